@@ -452,6 +452,128 @@ PyGccCfg_get_block_for_label(PyObject *s, PyObject *args)
     return PyGccBasicBlock_New(gcc_private_make_cfg_block(bb));
 }
 
+/*
+  Support for gcc.Cfg.get_flattened(), which gathers all of the blocks,
+  statements and edges of a CFG in a single walk, rather than building
+  lists of wrapper objects attribute by attribute
+ */
+struct flattened_cfg {
+    PyObject *blocks; /* list of gcc.BasicBlock */
+    PyObject *stmts;  /* list of (bb index, gcc.Gimple) */
+    PyObject *edges;  /* list of (src bb index, dest bb index, gcc.Edge) */
+    int bb_index;
+};
+
+static bool
+append_stmt_to_flattened_cfg(gcc_gimple stmt, void *user_data)
+{
+    struct flattened_cfg *flat = (struct flattened_cfg *)user_data;
+    PyObject *item;
+
+    /* ("N" steals the new reference to the wrapper): */
+    item = Py_BuildValue("(iN)", flat->bb_index, PyGccGimple_New(stmt));
+    if (!item) {
+        return true;
+    }
+    if (-1 == PyList_Append(flat->stmts, item)) {
+        Py_DECREF(item);
+        return true;
+    }
+    Py_DECREF(item);
+    return false;
+}
+
+static bool
+append_phi_to_flattened_cfg(gcc_gimple_phi phi, void *user_data)
+{
+    return append_stmt_to_flattened_cfg(gcc_gimple_phi_as_gcc_gimple(phi),
+                                        user_data);
+}
+
+static bool
+append_edge_to_flattened_cfg(gcc_cfg_edge e, void *user_data)
+{
+    struct flattened_cfg *flat = (struct flattened_cfg *)user_data;
+    PyObject *item;
+
+    item = Py_BuildValue("(iiN)",
+                         flat->bb_index,
+                         gcc_cfg_block_get_index(gcc_cfg_edge_get_dest(e)),
+                         PyGccEdge_New(e));
+    if (!item) {
+        return true;
+    }
+    if (-1 == PyList_Append(flat->edges, item)) {
+        Py_DECREF(item);
+        return true;
+    }
+    Py_DECREF(item);
+    return false;
+}
+
+static bool
+append_block_to_flattened_cfg(gcc_cfg_block bb, void *user_data)
+{
+    struct flattened_cfg *flat = (struct flattened_cfg *)user_data;
+
+    /* As per add_block_to_list, skip any NULL blocks: */
+    if (!bb.inner) {
+        return false;
+    }
+
+    if (add_block_to_list(bb, flat->blocks)) {
+        return true;
+    }
+
+    flat->bb_index = gcc_cfg_block_get_index(bb);
+    if (gcc_cfg_block_for_each_gimple_phi(bb,
+                                          append_phi_to_flattened_cfg,
+                                          flat)) {
+        return true;
+    }
+    if (gcc_cfg_block_for_each_gimple(bb,
+                                      append_stmt_to_flattened_cfg,
+                                      flat)) {
+        return true;
+    }
+    if (gcc_cfg_block_for_each_succ_edge(bb,
+                                         append_edge_to_flattened_cfg,
+                                         flat)) {
+        return true;
+    }
+    return false;
+}
+
+PyObject *
+PyGccCfg_get_flattened(PyObject *s, PyObject *noargs)
+{
+    struct PyGccCfg *self = (struct PyGccCfg *)s;
+    struct flattened_cfg flat;
+    PyObject *result = NULL;
+
+    flat.blocks = PyList_New(0);
+    flat.stmts = PyList_New(0);
+    flat.edges = PyList_New(0);
+    flat.bb_index = -1;
+    if (!flat.blocks || !flat.stmts || !flat.edges) {
+        goto cleanup;
+    }
+
+    if (gcc_cfg_for_each_block(self->cfg,
+                               append_block_to_flattened_cfg,
+                               &flat)) {
+        goto cleanup;
+    }
+
+    result = PyTuple_Pack(3, flat.blocks, flat.stmts, flat.edges);
+
+cleanup:
+    Py_XDECREF(flat.blocks);
+    Py_XDECREF(flat.stmts);
+    Py_XDECREF(flat.edges);
+    return result;
+}
+
 union gcc_cfg_as_ptr {
     gcc_cfg cfg;
     void *ptr;
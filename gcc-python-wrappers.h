@@ -187,6 +187,9 @@ PyGccCfg_get_basic_blocks(PyGccCfg *self, void *closure);
 PyObject *
 PyGccCfg_get_block_for_label(PyObject *self, PyObject *args);
 
+PyObject *
+PyGccCfg_get_flattened(PyObject *self, PyObject *noargs);
+
 /* autogenerated-tree.c: */
 
 /* return -1 if there isn't an enum tree_code associated with this type */
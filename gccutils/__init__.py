@@ -33,18 +33,64 @@ def get_field_by_name(typeobj, name):
         if field.name == name:
             return field
 
+class SymbolIndex(object):
+    """
+    The global gcc.TypeDecl and gcc.VarDecl instances of each translation
+    unit, as dicts by name, so that looking them up doesn't need to walk
+    the (potentially thousands of) decls from the headers each time
+    """
+    def __init__(self, units):
+        self.key = get_symbol_index_key(units)
+        # List of (gcc.TranslationUnitDecl, typedefs, vardecls) triples,
+        # where the latter two are dicts mapping from name to the first
+        # decl with that name:
+        self.units = []
+        for u in units:
+            typedefs = {}
+            vardecls = {}
+            if u.block:
+                for v in u.block.vars:
+                    if isinstance(v, gcc.TypeDecl):
+                        typedefs.setdefault(v.name, v)
+                    elif isinstance(v, gcc.VarDecl):
+                        vardecls.setdefault(v.name, v)
+            self.units.append((u, typedefs, vardecls))
+
+def get_symbol_index_key(units):
+    return [(u, u.block) for u in units]
+
+_symbol_index = None
+
+def get_symbol_index():
+    """
+    Get the SymbolIndex for the current translation units, building it if
+    they have changed (or if invalidate_symbol_index() has been called)
+    """
+    global _symbol_index
+    units = gcc.get_translation_units()
+    if (_symbol_index is None
+        or _symbol_index.key != get_symbol_index_key(units)):
+        _symbol_index = SymbolIndex(units)
+    return _symbol_index
+
+def invalidate_symbol_index():
+    """
+    Discard the SymbolIndex, so that it's rebuilt on the next lookup; this
+    should be called when new decls may have appeared (e.g. from a
+    PLUGIN_FINISH_DECL callback)
+    """
+    global _symbol_index
+    _symbol_index = None
+
 def get_global_typedef(name):
     # Look up a typedef in global scope by name, returning a gcc.TypeDecl,
     # or None if not found
-    for u in gcc.get_translation_units():
+    for u, typedefs, vardecls in get_symbol_index().units:
         if u.language.startswith('GNU C++'):
             gns = gcc.get_global_namespace()
             return gns.lookup(name)
-        if u.block:
-            for v in u.block.vars:
-                if isinstance(v, gcc.TypeDecl):
-                    if v.name == name:
-                        return v
+        if name in typedefs:
+            return typedefs[name]
 
 def get_variables_as_dict():
     result = {}
@@ -55,14 +101,54 @@ def get_variables_as_dict():
 def get_global_vardecl_by_name(name):
     # Look up a variable in global scope by name, returning a gcc.VarDecl,
     # or None if not found
-    for u in gcc.get_translation_units():
+    for u, typedefs, vardecls in get_symbol_index().units:
         if u.language == 'GNU C++':
             gns = gcc.get_global_namespace()
             return gns.lookup(name)
-        for v in u.block.vars:
-            if isinstance(v, gcc.VarDecl):
-                if v.name == name:
-                    return v
+        if name in vardecls:
+            return vardecls[name]
+
+class FlattenedCfg(object):
+    """
+    The blocks, statements and edges of a gcc.Cfg, fetched from GCC in a
+    single walk (see gcc.Cfg.get_flattened), rather than by building lists
+    of wrapper objects attribute by attribute
+
+    This is a snapshot of the CFG, so it should only be used within the pass
+    that built it; later passes may change the CFG
+    """
+    def __init__(self, cfg):
+        self.cfg = cfg
+        # A list of gcc.BasicBlock, a list of (bb index, gcc.Gimple) pairs
+        # (with the phi nodes of each block before its other statements),
+        # and a list of (src bb index, dest bb index, gcc.Edge) triples:
+        self.blocks, self.stmts, self.edges = cfg.get_flattened()
+
+        # Dicts mapping from bb index to the gcc.BasicBlock, to lists of
+        # its gcc.GimplePhi and other gcc.Gimple, and to lists of the
+        # indices within self.edges of its successor and predecessor edges:
+        self.block_for_index = {}
+        self.phi_nodes = {}
+        self.gimple = {}
+        self.succs = {}
+        self.preds = {}
+        for bb in self.blocks:
+            self.block_for_index[bb.index] = bb
+            self.phi_nodes[bb.index] = []
+            self.gimple[bb.index] = []
+            self.succs[bb.index] = []
+            self.preds[bb.index] = []
+        for index, stmt in self.stmts:
+            if isinstance(stmt, gcc.GimplePhi):
+                self.phi_nodes[index].append(stmt)
+            else:
+                self.gimple[index].append(stmt)
+        for i, (srcindex, destindex, edge) in enumerate(self.edges):
+            self.succs[srcindex].append(i)
+            # After optimization, the CFG sometimes contains edges that
+            # point to blocks that are no longer within it:
+            if destindex in self.preds:
+                self.preds[destindex].append(i)
 
 def get_nonnull_arguments(funtype):
     """
@@ -15,25 +15,69 @@
 #   along with this program.  If not, see
 #   <http://www.gnu.org/licenses/>.
 
+from array import array
+from collections import deque
+
 from gccutils.dot import to_html
 
 ############################################################################
 # Generic directed graphs
 ############################################################################
 class Graph(object):
-    __slots__ = ('nodes', 'edges')
+    __slots__ = ('nodes', 'edges', 'adjacency', 'reachability')
 
     def __init__(self):
         self.nodes = set()
         self.edges = set()
+        # The CompactAdjacency, if compact() has been called:
+        self.adjacency = None
+        # The ReachabilityIndex, if get_reachability_index() has been called
+        # since the graph was last changed:
+        self.reachability = None
+
+    def compact(self):
+        """
+        Replace the per-node sets of predecessor and successor edges with a
+        single CompactAdjacency for the whole graph, once it has been built
+
+        This roughly halves the memory used by a large graph.  The searches
+        made by the graph itself (get_shortest_path, and building the
+        ReachabilityIndex) walk the arrays directly by index, without
+        allocating anything per node, and so aren't slowed down by this.  However the "preds" and "succs" of each node
+        become tuples created on demand on every access, so code that walks
+        many edges that way trades time for the memory saved.  Any
+        subsequent changes to the graph switch it back to per-node sets.
+        """
+        self.adjacency = CompactAdjacency(self.nodes, self.edges)
+        for node in self.nodes:
+            node._preds = None
+            node._succs = None
+            node._adjacency = self.adjacency
+
+    def _expand(self):
+        # Go back from a CompactAdjacency to per-node sets, so that the
+        # graph can be changed:
+        for node in self.nodes:
+            if node._adjacency is self.adjacency:
+                node._preds = set(node.preds)
+                node._succs = set(node.succs)
+                node._adjacency = None
+                node._index = None
+        self.adjacency = None
 
     def add_node(self, node):
+        if self.adjacency:
+            self._expand()
+        self.reachability = None
         self.nodes.add(node)
         return node
 
     def add_edge(self, srcnode, dstnode, *args, **kwargs):
         assert isinstance(srcnode, Node)
         assert isinstance(dstnode, Node)
+        if self.adjacency:
+            self._expand()
+        self.reachability = None
         e = self._make_edge(srcnode, dstnode, *args, **kwargs)
         self.edges.add(e)
         srcnode.succs.add(e)
@@ -46,6 +90,9 @@ class Graph(object):
     def remove_node(self, node):
         if node not in self.nodes:
             return 0
+        if self.adjacency:
+            self._expand()
+        self.reachability = None
         self.nodes.remove(node)
         victims = 1
         for edge in list(node.succs):
@@ -57,6 +104,9 @@ class Graph(object):
     def remove_edge(self, edge):
         if edge not in self.edges:
             return 0
+        if self.adjacency:
+            self._expand()
+        self.reachability = None
         self.edges.remove(edge)
         edge.srcnode.succs.remove(edge)
         edge.dstnode.preds.remove(edge)
@@ -175,87 +225,191 @@ class Graph(object):
         Locate the shortest path from the srcnode to the dstnode
         Return a list of Edge instances, or None if no such path exists
         '''
-        # Dijkstra's algorithm
-        # A dict giving for each node the length of the shortest known path
-        # from srcnode to this node:
-        distance = {}
-
-        # A dict giving for each node the previous node within that shortest
-        # path:
-        inedge = {}
-
-        INFINITY = 0x80000000
-        for node in self.nodes:
-            distance[node] = INFINITY
-            inedge[node] = None
-        distance[srcnode] = 0
-
-        # We use a heapq to keep the nodes sorted by distance
-        # The items in the heapq are lists of the form:
-        #    [distance_to_node, node, is_live)
-        # The first entry in the list ensures that the heapq is sorted
-        # into the order needed for Dijkstra's algorithm
-        #
-        # Since we can't change the priority of items within a heapq,
-        # whenever we need to update the distance we mark the existing
-        # item as dead (setting the is_live boolean to False), and add a
-        # new entry with the correct value; we ignore dead items during
-        # the iteration
-        #
-        # This gets the time taken for a simple 10000 node graph down to
-        # ~3 seconds, compared to minutes/hours.
-        from heapq import heapify, heappop, heappush
-        item_for_node = {}
-        for node in self.nodes:
-            item_for_node[node] = [distance[node], node, True]
-
-        worklist = list(item_for_node.values())
-        heapify(worklist)
+        if srcnode == dstnode:
+            return []
+
+        # Every edge has the same weight, so a breadth-first search finds
+        # the shortest path, and we can stop as soon as we reach the
+        # dstnode, only having touched the nodes nearer to the srcnode than
+        # it.
+        if self.reachability:
+            if not self.reachability.is_reachable(srcnode, dstnode):
+                return None
+
+        if self.adjacency:
+            return self.adjacency.get_shortest_path(srcnode._index,
+                                                    dstnode._index)
+
+        # A dict giving for each node reached so far the edge by which it
+        # was first reached:
+        inedge = {srcnode: None}
+        worklist = deque([srcnode])
         while worklist:
-            def get_next():
-                while 1:
-                    if not worklist:
-                        return None
-                    disttonode, node, islive = heappop(worklist)
-                    if islive:
-                        return node
-            node = get_next()
-            if node is None:
-                # disjoint
-                break
-            if node == dstnode:
-                # We've found the target node; build a path of the edges to
-                # follow to get here:
-                path = []
-                while inedge[node]:
-                    path = [inedge[node]] + path
-                    node = inedge[node].srcnode
-                return path
-            if distance[node] == INFINITY:
-                # disjoint
-                break
+            node = worklist.popleft()
             for edge in node.succs:
-                alt = distance[node] + 1
-                if alt < distance[edge.dstnode]:
-                    distance[edge.dstnode] = alt
-                    # Changing the distance of edge.dstnode requires us to
-                    # update the heapq:
-                    # Mark the existing item as dead:
-                    item_for_node[edge.dstnode][2] = False
-                    # Create a new itemwith the new distance:
-                    newitem = [alt, edge.dstnode, True]
-                    item_for_node[edge.dstnode] = newitem
-                    heappush(worklist, newitem)
-                    inedge[edge.dstnode] = edge
+                if edge.dstnode in inedge:
+                    continue
+                inedge[edge.dstnode] = edge
+                if edge.dstnode == dstnode:
+                    # We've found the target node; build a path of the
+                    # edges to follow to get here:
+                    path = []
+                    while edge:
+                        path.append(edge)
+                        edge = inedge[edge.srcnode]
+                    path.reverse()
+                    return path
+                worklist.append(edge.dstnode)
+        # disjoint
         return None
 
+    def get_reachability_index(self):
+        """
+        Get a ReachabilityIndex for the graph, building it if the graph has
+        changed since it was last built
+
+        Once built, get_shortest_path() uses it to reject unreachable pairs
+        of nodes without searching.
+        """
+        if self.reachability is None:
+            self.reachability = ReachabilityIndex(self.nodes, self.adjacency)
+        return self.reachability
+
+    def is_reachable(self, srcnode, dstnode):
+        """
+        Is there a path from srcnode to dstnode?
+        """
+        return self.get_reachability_index().is_reachable(srcnode, dstnode)
+
+
+def _build_csr(numnodes, node_ids):
+    """
+    Given a sequence giving a node id for each edge id, build a pair of
+    arrays (offsets, edge_ids) such that the ids of the edges for node id i
+    are edge_ids[offsets[i]:offsets[i + 1]]
+    """
+    offsets = array('l', [0]) * (numnodes + 1)
+    for node_id in node_ids:
+        offsets[node_id + 1] += 1
+    for i in range(numnodes):
+        offsets[i + 1] += offsets[i]
+    edge_ids = array('l', [0]) * len(node_ids)
+    nextslot = offsets[:-1]
+    for edge_id, node_id in enumerate(node_ids):
+        edge_ids[nextslot[node_id]] = edge_id
+        nextslot[node_id] += 1
+    return offsets, edge_ids
+
+class CompactAdjacency(object):
+    """
+    The edges of a Graph in compressed sparse row ("CSR") form: the nodes
+    and edges are numbered, and the predecessors and successors of every
+    node are stored within a few flat arrays of integers, rather than as
+    two Python sets per node
+    """
+    __slots__ = ('nodes', 'edges',
+                 'src_ids', 'dst_ids',
+                 'succ_offsets', 'succ_edge_ids',
+                 'pred_offsets', 'pred_edge_ids')
+
+    def __init__(self, nodes, edges):
+        # Lists of Node and Edge, indexed by id:
+        self.nodes = list(nodes)
+        self.edges = list(edges)
+        for node_id, node in enumerate(self.nodes):
+            node._index = node_id
+
+        # The ids of the source and destination nodes of each edge:
+        self.src_ids = array('l', [edge.srcnode._index for edge in self.edges])
+        self.dst_ids = array('l', [edge.dstnode._index for edge in self.edges])
+
+        self.succ_offsets, self.succ_edge_ids = \
+            _build_csr(len(self.nodes), self.src_ids)
+        self.pred_offsets, self.pred_edge_ids = \
+            _build_csr(len(self.nodes), self.dst_ids)
+
+    def get_succs(self, node_id):
+        edges = self.edges
+        edge_ids = self.succ_edge_ids
+        return tuple([edges[edge_ids[i]]
+                      for i in range(self.succ_offsets[node_id],
+                                     self.succ_offsets[node_id + 1])])
+
+    def get_preds(self, node_id):
+        edges = self.edges
+        edge_ids = self.pred_edge_ids
+        return tuple([edges[edge_ids[i]]
+                      for i in range(self.pred_offsets[node_id],
+                                     self.pred_offsets[node_id + 1])])
+
+    # The following walk the arrays by index, rather than building a
+    # sequence of edges per node as the "preds" and "succs" of a Node do:
+
+    def iter_succ_node_ids(self, node_id):
+        dst_ids = self.dst_ids
+        edge_ids = self.succ_edge_ids
+        for i in range(self.succ_offsets[node_id],
+                       self.succ_offsets[node_id + 1]):
+            yield dst_ids[edge_ids[i]]
+
+    def iter_pred_node_ids(self, node_id):
+        src_ids = self.src_ids
+        edge_ids = self.pred_edge_ids
+        for i in range(self.pred_offsets[node_id],
+                       self.pred_offsets[node_id + 1]):
+            yield src_ids[edge_ids[i]]
+
+    def get_shortest_path(self, src_id, dst_id):
+        """
+        As per Graph.get_shortest_path, but given node ids
+        """
+        offsets = self.succ_offsets
+        edge_ids = self.succ_edge_ids
+        dst_ids = self.dst_ids
+        # A dict giving for each node id reached so far the id of the edge
+        # by which it was first reached:
+        inedge = {src_id: None}
+        worklist = deque([src_id])
+        while worklist:
+            node_id = worklist.popleft()
+            for i in range(offsets[node_id], offsets[node_id + 1]):
+                edge_id = edge_ids[i]
+                next_id = dst_ids[edge_id]
+                if next_id in inedge:
+                    continue
+                inedge[next_id] = edge_id
+                if next_id == dst_id:
+                    path = []
+                    while edge_id is not None:
+                        path.append(self.edges[edge_id])
+                        edge_id = inedge[self.src_ids[edge_id]]
+                    path.reverse()
+                    return path
+                worklist.append(next_id)
+        # disjoint
+        return None
 
 class Node(object):
-    __slots__ = ('preds', 'succs')
+    __slots__ = ('_preds', '_succs', '_adjacency', '_index')
 
     def __init__(self):
-        self.preds = set()
-        self.succs = set()
+        self._preds = set()
+        self._succs = set()
+        # Set by Graph.compact():
+        self._adjacency = None
+        self._index = None
+
+    @property
+    def preds(self):
+        if self._adjacency:
+            return self._adjacency.get_preds(self._index)
+        return self._preds
+
+    @property
+    def succs(self):
+        if self._adjacency:
+            return self._adjacency.get_succs(self._index)
+        return self._succs
 
     def to_dot_id(self):
         return '%s' % id(self)
@@ -329,3 +483,222 @@ class Subgraph(object):
 
     def __lt__(self, other):
         return self.id < other.id
+
+class ReachabilityIndex(object):
+    """
+    An index for answering "is there a path from A to B?" for many pairs of
+    nodes within a graph, without searching the whole graph each time
+
+    The strongly-connected components ("SCCs") of the graph are found
+    and numbered such that every SCC reachable from another has a lower
+    number than it (the "condensation" of the graph).  The SCCs are also
+    labelled with the interval of a depth-first traversal of the
+    condensation that they span.
+
+    A query is then answered directly when:
+      - both nodes are within the same SCC (reachable),
+      - the destination has a higher number than the source (unreachable),
+      - the destination's interval is within the source's (reachable)
+    and otherwise by a search of the condensation that only visits SCCs
+    numbered higher than the destination's.
+    """
+    __slots__ = ('scc_for_node', 'scc_succs', 'pre', 'post')
+
+    def __init__(self, nodes, adjacency=None):
+        """
+        nodes: the nodes of the graph
+
+        adjacency: the graph's CompactAdjacency, if it has been compacted,
+        in which case the SCCs are found by walking its arrays directly
+        """
+        # A dict mapping from Node to the id of its SCC:
+        self.scc_for_node = {}
+        # A list, indexed by SCC id, of tuples of the ids of the SCCs that
+        # it has edges to:
+        self.scc_succs = []
+        if adjacency:
+            self._find_sccs_compact(adjacency)
+        else:
+            self._find_sccs(nodes)
+
+        # Lists, indexed by SCC id, giving the order in which a depth-first
+        # traversal of the condensation enters and leaves each SCC:
+        self.pre = [None] * len(self.scc_succs)
+        self.post = [None] * len(self.scc_succs)
+        self._number_intervals()
+
+    def _find_sccs(self, nodes):
+        # Tarjan's algorithm, without recursion (to cope with long paths).
+        # This emits each SCC after all of the SCCs reachable from it,
+        # giving the numbering that we need:
+        index_of = {}
+        lowlink = {}
+        stack = []
+        onstack = set()
+        sccs = []
+
+        def get_dstnodes(node):
+            for edge in node.succs:
+                yield edge.dstnode
+
+        for root in nodes:
+            if root in index_of:
+                continue
+            index_of[root] = lowlink[root] = len(index_of)
+            stack.append(root)
+            onstack.add(root)
+            work = [(root, get_dstnodes(root))]
+            while work:
+                node, dstnodes = work[-1]
+                for dstnode in dstnodes:
+                    if dstnode not in index_of:
+                        index_of[dstnode] = lowlink[dstnode] = len(index_of)
+                        stack.append(dstnode)
+                        onstack.add(dstnode)
+                        work.append((dstnode, get_dstnodes(dstnode)))
+                        break
+                    elif dstnode in onstack:
+                        lowlink[node] = min(lowlink[node], index_of[dstnode])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == index_of[node]:
+                        scc_id = len(sccs)
+                        members = []
+                        while True:
+                            member = stack.pop()
+                            onstack.remove(member)
+                            self.scc_for_node[member] = scc_id
+                            members.append(member)
+                            if member is node:
+                                break
+                        sccs.append(members)
+
+        for scc_id, members in enumerate(sccs):
+            succs = set()
+            for node in members:
+                for edge in node.succs:
+                    succ_id = self.scc_for_node[edge.dstnode]
+                    if succ_id != scc_id:
+                        succs.add(succ_id)
+            self.scc_succs.append(tuple(succs))
+
+    def _find_sccs_compact(self, adjacency):
+        # As per _find_sccs, but on node and edge ids, using lists indexed
+        # by node id rather than dicts and sets of Node:
+        numnodes = len(adjacency.nodes)
+        offsets = adjacency.succ_offsets
+        edge_ids = adjacency.succ_edge_ids
+        src_ids = adjacency.src_ids
+        dst_ids = adjacency.dst_ids
+        index_of = [-1] * numnodes
+        lowlink = [0] * numnodes
+        onstack = [False] * numnodes
+        scc_of = [-1] * numnodes
+        stack = []
+        counter = 0
+        num_sccs = 0
+
+        def get_slots(node_id):
+            return iter(range(offsets[node_id], offsets[node_id + 1]))
+
+        for root in range(numnodes):
+            if index_of[root] >= 0:
+                continue
+            index_of[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            onstack[root] = True
+            work = [(root, get_slots(root))]
+            while work:
+                node_id, slots = work[-1]
+                for i in slots:
+                    dst_id = dst_ids[edge_ids[i]]
+                    if index_of[dst_id] < 0:
+                        index_of[dst_id] = lowlink[dst_id] = counter
+                        counter += 1
+                        stack.append(dst_id)
+                        onstack[dst_id] = True
+                        work.append((dst_id, get_slots(dst_id)))
+                        break
+                    elif onstack[dst_id]:
+                        lowlink[node_id] = min(lowlink[node_id],
+                                               index_of[dst_id])
+                else:
+                    work.pop()
+                    if work:
+                        parent_id = work[-1][0]
+                        lowlink[parent_id] = min(lowlink[parent_id],
+                                                 lowlink[node_id])
+                    if lowlink[node_id] == index_of[node_id]:
+                        while True:
+                            member_id = stack.pop()
+                            onstack[member_id] = False
+                            scc_of[member_id] = num_sccs
+                            if member_id == node_id:
+                                break
+                        num_sccs += 1
+
+        scc_succs = [set() for scc_id in range(num_sccs)]
+        for edge_id in range(len(adjacency.edges)):
+            src_scc_id = scc_of[src_ids[edge_id]]
+            dst_scc_id = scc_of[dst_ids[edge_id]]
+            if src_scc_id != dst_scc_id:
+                scc_succs[src_scc_id].add(dst_scc_id)
+        self.scc_succs = [tuple(succs) for succs in scc_succs]
+        self.scc_for_node = dict(zip(adjacency.nodes, scc_of))
+
+    def _number_intervals(self):
+        # Depth-first traversal of the condensation, starting from the
+        # highest-numbered SCCs (which have no predecessors):
+        counter = 0
+        for root in range(len(self.scc_succs) - 1, -1, -1):
+            if self.pre[root] is not None:
+                continue
+            self.pre[root] = counter
+            counter += 1
+            work = [(root, iter(self.scc_succs[root]))]
+            while work:
+                scc_id, succs = work[-1]
+                for succ_id in succs:
+                    if self.pre[succ_id] is None:
+                        self.pre[succ_id] = counter
+                        counter += 1
+                        work.append((succ_id, iter(self.scc_succs[succ_id])))
+                        break
+                else:
+                    work.pop()
+                    self.post[scc_id] = counter
+                    counter += 1
+
+    def _within_interval(self, src_id, dst_id):
+        return (self.pre[src_id] <= self.pre[dst_id]
+                and self.post[dst_id] <= self.post[src_id])
+
+    def is_reachable(self, srcnode, dstnode):
+        """
+        Is there a path from srcnode to dstnode?  (A node is reachable from
+        itself)
+        """
+        src_id = self.scc_for_node[srcnode]
+        dst_id = self.scc_for_node[dstnode]
+        if src_id == dst_id:
+            return True
+        if dst_id > src_id:
+            return False
+        if self._within_interval(src_id, dst_id):
+            return True
+        visited = set([src_id])
+        worklist = [src_id]
+        while worklist:
+            scc_id = worklist.pop()
+            for succ_id in self.scc_succs[scc_id]:
+                if succ_id == dst_id or self._within_interval(succ_id, dst_id):
+                    return True
+                # SCCs numbered lower than the destination's can't reach it:
+                if succ_id > dst_id and succ_id not in visited:
+                    visited.add(succ_id)
+                    worklist.append(succ_id)
+        return False
@@ -0,0 +1,268 @@
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+############################################################################
+# Interprocedural dataflow analysis over a Supergraph, using the
+# "tabulation" algorithm for IFDS problems (Interprocedural, Finite,
+# Distributive, Subset) from:
+#   Reps, Horwitz, Sagiv: "Precise Interprocedural Dataflow Analysis via
+#   Graph Reachability" (POPL 1995)
+# with the worklist formulation from:
+#   Naeem, Lhotak, Rodriguez: "Practical Extensions to the IFDS Algorithm"
+#   (CC 2010)
+#
+# Like IvpGraph, this only follows interprocedurally-valid paths (returning
+# from a call to the site that made it), but rather than cloning every node
+# for each callstring, it computes summaries of the effect of each function
+# on each fact, and reuses them at every call site.
+############################################################################
+
+from gccutils.graph.supergraph import CallNode, CallToStart, \
+    ExitToReturnSite, FakeEntryEdge
+
+class ZeroFact(object):
+    """
+    The special fact that holds at every reachable node (often written as
+    "0" or lambda in the literature), from which facts are generated
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'ZERO'
+
+    def __str__(self):
+        return 'ZERO'
+
+ZERO = ZeroFact()
+
+class IfdsProblem(object):
+    """
+    Base class for dataflow problems to be solved by IfdsSolver
+
+    Facts can be any hashable values.  Each flow function is given an edge
+    and a fact holding at the start of the edge, and returns an iterable of
+    the facts that hold at the end of it as a result.  ZERO is always
+    propagated to ZERO by the solver, so the flow functions only need to
+    handle it in order to generate new facts.
+
+    The default flow functions propagate every fact unchanged (except into
+    and out of calls, where they're killed).
+    """
+    def get_seeds(self, sg):
+        """
+        Get an iterable of (node, fact) pairs giving the facts that hold
+        initially; by default, ZERO at the entry nodes of the supergraph
+        """
+        for node in sg.get_entry_nodes():
+            yield (node, ZERO)
+
+    def flow(self, edge, fact):
+        """
+        The flow function for an intraprocedural edge
+        """
+        return [fact]
+
+    def call_flow(self, edge, fact):
+        """
+        The flow function for a CallToStart edge (or a FakeEntryEdge), from a
+        fact at the CallNode to facts at the entry of the callee (e.g. mapping
+        arguments to parameters)
+        """
+        return []
+
+    def return_flow(self, edge, callnode, callfact, fact):
+        """
+        The flow function for an ExitToReturnSite edge, from a fact at the
+        exit of the callee to facts at the ReturnNode, given the CallNode
+        and one of the facts holding there that led to the callee being
+        entered with this fact (e.g. mapping the return value to the LHS)
+        """
+        return []
+
+    def call_to_return_flow(self, edge, fact):
+        """
+        The flow function for the CallToReturnSiteEdge from a CallNode to
+        its ReturnNode, for the facts that aren't affected by the call (e.g.
+        those about local variables)
+        """
+        return [fact]
+
+class IfdsSolver(object):
+    """
+    Solve an IfdsProblem over a Supergraph (or LazySupergraph)
+    """
+    def __init__(self, sg, problem):
+        self.sg = sg
+        self.problem = problem
+
+        # The "path edges": a dict mapping from (node, fact) to the set of
+        # facts at the entry of the node's function that lead to that fact
+        # holding at that node:
+        self.path_edges = {}
+
+        # A dict mapping from node to the set of facts that can hold there:
+        self.facts_at = {}
+
+        # The summaries: a dict mapping from (start node, fact) to the set
+        # of (exit node, fact) pairs reachable within that function:
+        self.end_summaries = {}
+
+        # A dict mapping from (start node, fact) to the set of
+        # (CallNode, fact) pairs that lead to the function being entered
+        # with that fact:
+        self.incoming = {}
+
+        # The worklist, of (start fact, node, fact) triples:
+        self._worklist = []
+
+    def get_start_node(self, node):
+        """
+        Get the entry node of the function containing the given node (or
+        the node itself, for the FakeEntryNode)
+        """
+        stmtg = node.stmtg
+        if stmtg is None:
+            return node
+        return stmtg.supernode_for_stmtnode[stmtg.entry]
+
+    def is_exit_node(self, node):
+        stmtg = node.stmtg
+        if stmtg is None:
+            return False
+        return node.innernode == stmtg.exit
+
+    def _propagate(self, startfact, node, fact):
+        key = (node, fact)
+        if key not in self.path_edges:
+            self.path_edges[key] = set()
+            if node not in self.facts_at:
+                self.facts_at[node] = set()
+            self.facts_at[node].add(fact)
+        if startfact not in self.path_edges[key]:
+            self.path_edges[key].add(startfact)
+            self._worklist.append((startfact, node, fact))
+
+    def _iter_flow(self, facts, fact):
+        # Yield the results of a flow function, adding ZERO -> ZERO:
+        if fact is ZERO:
+            yield ZERO
+        for result in facts:
+            if result is not ZERO:
+                yield result
+
+    def solve(self):
+        problem = self.problem
+        for node, fact in problem.get_seeds(self.sg):
+            if node.function and hasattr(self.sg, 'build_reachable'):
+                self.sg.build_reachable([node.function])
+            self._propagate(fact, node, fact)
+
+        while self._worklist:
+            startfact, node, fact = self._worklist.pop()
+            if isinstance(node, CallNode):
+                self._process_call(startfact, node, fact)
+            else:
+                if self.is_exit_node(node):
+                    self._process_exit(startfact, node, fact)
+                for edge in node.succs:
+                    if isinstance(edge, ExitToReturnSite):
+                        # (handled by _process_exit)
+                        continue
+                    if isinstance(edge, FakeEntryEdge):
+                        # Entering a function "from outside", from which
+                        # there's no return:
+                        for newfact in self._iter_flow(
+                                problem.call_flow(edge, fact), fact):
+                            self._propagate(newfact, edge.dstnode, newfact)
+                        continue
+                    for newfact in self._iter_flow(problem.flow(edge, fact),
+                                                   fact):
+                        self._propagate(startfact, edge.dstnode, newfact)
+
+    def _process_call(self, startfact, callnode, fact):
+        problem = self.problem
+        for edge in callnode.succs:
+            if isinstance(edge, CallToStart):
+                calleestart = edge.dstnode
+                for calleefact in self._iter_flow(
+                        problem.call_flow(edge, fact), fact):
+                    self._propagate(calleefact, calleestart, calleefact)
+                    key = (calleestart, calleefact)
+                    if key not in self.incoming:
+                        self.incoming[key] = set()
+                    self.incoming[key].add((callnode, fact))
+                    # Apply any summary that we already have for the callee:
+                    for exitnode, exitfact in list(
+                            self.end_summaries.get(key, ())):
+                        self._apply_return(callnode, fact,
+                                           exitnode, exitfact)
+            else:
+                # The CallToReturnSiteEdge:
+                for newfact in self._iter_flow(
+                        problem.call_to_return_flow(edge, fact), fact):
+                    self._propagate(startfact, edge.dstnode, newfact)
+
+    def _process_exit(self, startfact, exitnode, fact):
+        key = (self.get_start_node(exitnode), startfact)
+        if key not in self.end_summaries:
+            self.end_summaries[key] = set()
+        if (exitnode, fact) in self.end_summaries[key]:
+            return
+        self.end_summaries[key].add((exitnode, fact))
+        # Return to every call site that entered with this fact:
+        for callnode, callfact in list(self.incoming.get(key, ())):
+            self._apply_return(callnode, callfact, exitnode, fact)
+
+    def _apply_return(self, callnode, callfact, exitnode, exitfact):
+        # Propagate a fact at the exit of a callee back to the ReturnNode of a
+        # call site that entered it:
+        problem = self.problem
+        for edge in exitnode.succs:
+            if (isinstance(edge, ExitToReturnSite)
+                and edge.dstnode == callnode.returnnode):
+                for newfact in self._iter_flow(
+                        problem.return_flow(edge, callnode, callfact,
+                                            exitfact),
+                        exitfact):
+                    # (for every fact at the caller's entry that led to the
+                    # call)
+                    for callerstartfact in list(
+                            self.path_edges.get((callnode, callfact), ())):
+                        self._propagate(callerstartfact, edge.dstnode,
+                                        newfact)
+
+    def get_facts_at(self, node):
+        """
+        Get the set of facts (other than ZERO) that can hold at the given
+        node
+        """
+        return set(fact
+                   for fact in self.facts_at.get(node, ())
+                   if fact is not ZERO)
+
+    def get_summary(self, fun, fact):
+        """
+        Get the set of facts that can hold at the exit of the given
+        gcc.Function when it's entered with the given fact, as computed so
+        far (only for the facts that it was entered with during solve())
+        """
+        stmtg = self.sg.get_stmtgraph(fun)
+        start = stmtg.supernode_for_stmtnode[stmtg.entry]
+        return set(exitfact
+                   for exitnode, exitfact
+                   in self.end_summaries.get((start, fact), ())
+                   if exitfact is not ZERO)
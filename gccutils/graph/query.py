@@ -25,6 +25,49 @@ from gccutils.graph.supergraph import ReturnNode
 __all__ = ['Query']
 
 class BaseQuery:
+    # Each query is a chain of filters, ending in a Query.  Rather than
+    # having each filter iterate over the results of the one before, and
+    # hence over every node in the graph, the whole chain is tested against
+    # just the nodes from the most selective lookup that any of its filters
+    # can do (using the graph's index, if it has one).
+
+    def __iter__(self):
+        candidates = self._plan()
+        if candidates is None:
+            graph = self.get_graph()
+            # A LazySupergraph needs to be fully built to be scanned:
+            if hasattr(graph, 'build_reachable'):
+                graph.build_reachable(list(graph.get_functions()))
+            # (iterate over a snapshot of the nodes, in case the caller
+            # builds more of the graph between the nodes that we yield):
+            candidates = list(graph.nodes)
+        for node in candidates:
+            if self.matches(node):
+                yield node
+
+    def _plan(self):
+        # Get the smallest sequence of candidate nodes available from a
+        # lookup by one of the filters, or None if none of them can do one
+        chain = []
+        query = self
+        while isinstance(query, CompoundQuery):
+            chain.append(query)
+            query = query.innerquery
+        # Looking up the nodes within a function doesn't need the index
+        # (and so doesn't require a LazySupergraph to be fully built):
+        for query in chain:
+            if isinstance(query, Within):
+                candidates = query.lookup()
+                if candidates is not None:
+                    return candidates
+        best = None
+        for query in chain:
+            candidates = query.lookup()
+            if candidates is not None:
+                if best is None or len(candidates) < len(best):
+                    best = candidates
+        return best
+
     def first(self):
         results = list(self)
         if len(results) < 1:
@@ -44,99 +87,142 @@ class BaseQuery:
     #######################################################################
 
     def get_calls_of(self, funcname):
-        class GetCallsOf(CompoundQuery):
-            def __init__(self, innerquery, funcname):
-                CompoundQuery.__init__(self, innerquery)
-                self.funcname = funcname
-            def __iter__(self):
-                for node in self.innerquery:
-                    # For an interprocedural call, we want the CallNode, not the
-                    # ReturnNode.
-                    # For a call to an external function, the GimpleCall will be
-                    # within a regular SupergraphNode:
-                    if not isinstance(node, ReturnNode):
-                        stmt = node.stmt
-                        if isinstance(stmt, gcc.GimpleCall):
-                            if isinstance(stmt.fn, gcc.AddrExpr):
-                                if isinstance(stmt.fn.operand, gcc.FunctionDecl):
-                                    if stmt.fn.operand.name == funcname:
-                                        yield node
-            def __repr__(self):
-                return ('GetCallsOf(%r, funcname=%r)'
-                        % (self.innerquery, self.funcname))
-            def __str__(self):
-                return '%s that are calls of %s()' % (self.innerquery, self.funcname)
-
         return GetCallsOf(self, funcname)
 
     def assigning_to(self, varname):
-        class AssigningTo(CompoundQuery):
-            def __init__(self, innerquery, varname):
-                CompoundQuery.__init__(self, innerquery)
-                self.varname = varname
-            def __iter__(self):
-                for node in self.innerquery:
-                    stmt = node.stmt
-                    if stmt.lhs.var.name == self.varname:
-                        yield node
-            def __repr__(self):
-                return ('AssigningTo(%r, varname=%r)'
-                        % (self.innerquery, self.varname))
-            def __str__(self):
-                return '%s in which the LHS is assigned to a variable named %s' % (self.innerquery, self.varname)
         return AssigningTo(self, varname)
 
     def assigning_constant(self, constant):
-        class AssigningConstant(CompoundQuery):
-            def __init__(self, innerquery, constant):
-                CompoundQuery.__init__(self, innerquery)
-                self.constant = constant
-            def __iter__(self):
-                for node in self.innerquery:
-                    stmt = node.stmt
-                    if isinstance(stmt, gcc.GimpleAssign):
-                        if stmt.exprcode == gcc.IntegerCst:
-                            if stmt.rhs[0] == self.constant:
-                                yield node
-            def __repr__(self):
-                return ('AssigningConstant(%r, constant=%r)'
-                        % (self.innerquery, self.constant))
-            def __str__(self):
-                return '%s in which an assignment of the value %s is made' % (self.innerquery, self.constant)
         return AssigningConstant(self, constant)
 
     def within(self, funcname):
-        class Within(CompoundQuery):
-            def __init__(self, innerquery, funcname):
-                CompoundQuery.__init__(self, innerquery)
-                self.funcname = funcname
-            def __iter__(self):
-                for node in self.innerquery:
-                    if node.function:
-                        if node.function.decl.name == self.funcname:
-                            yield node
-            def __repr__(self):
-                return ('Within(%r, funcname=%r)'
-                        % (self.innerquery, self.funcname))
-            def __str__(self):
-                return '%s within %s' % (self.innerquery, self.funcname)
         return Within(self, funcname)
 
 class CompoundQuery(BaseQuery):
     def __init__(self, innerquery):
         self.innerquery = innerquery
 
+    def get_graph(self):
+        return self.innerquery.get_graph()
+
+    def get_index(self):
+        graph = self.get_graph()
+        if hasattr(graph, 'get_index'):
+            return graph.get_index()
+
+    def matches(self, node):
+        return self.test(node) and self.innerquery.matches(node)
+
+    def test(self, node):
+        # Does the node satisfy this filter?
+        raise NotImplementedError
+
+    def lookup(self):
+        # Get a list of the nodes in the graph that might satisfy this
+        # filter, or None if this isn't possible
+        return None
+
+class GetCallsOf(CompoundQuery):
+    def __init__(self, innerquery, funcname):
+        CompoundQuery.__init__(self, innerquery)
+        self.funcname = funcname
+    def test(self, node):
+        # For an interprocedural call, we want the CallNode, not the
+        # ReturnNode.
+        # For a call to an external function, the GimpleCall will be
+        # within a regular SupergraphNode:
+        if not isinstance(node, ReturnNode):
+            stmt = node.stmt
+            if isinstance(stmt, gcc.GimpleCall):
+                if isinstance(stmt.fn, gcc.AddrExpr):
+                    if isinstance(stmt.fn.operand, gcc.FunctionDecl):
+                        if stmt.fn.operand.name == self.funcname:
+                            return True
+        return False
+    def lookup(self):
+        index = self.get_index()
+        if index:
+            return index.calls_by_callee_name.get(self.funcname, [])
+    def __repr__(self):
+        return ('GetCallsOf(%r, funcname=%r)'
+                % (self.innerquery, self.funcname))
+    def __str__(self):
+        return '%s that are calls of %s()' % (self.innerquery, self.funcname)
+
+class AssigningTo(CompoundQuery):
+    def __init__(self, innerquery, varname):
+        CompoundQuery.__init__(self, innerquery)
+        self.varname = varname
+    def test(self, node):
+        var = getattr(getattr(node.stmt, 'lhs', None), 'var', None)
+        return getattr(var, 'name', None) == self.varname
+    def lookup(self):
+        index = self.get_index()
+        if index:
+            return index.nodes_by_lhs_name.get(self.varname, [])
+    def __repr__(self):
+        return ('AssigningTo(%r, varname=%r)'
+                % (self.innerquery, self.varname))
+    def __str__(self):
+        return '%s in which the LHS is assigned to a variable named %s' % (self.innerquery, self.varname)
+
+class AssigningConstant(CompoundQuery):
+    def __init__(self, innerquery, constant):
+        CompoundQuery.__init__(self, innerquery)
+        self.constant = constant
+    def test(self, node):
+        stmt = node.stmt
+        if isinstance(stmt, gcc.GimpleAssign):
+            if stmt.exprcode == gcc.IntegerCst:
+                if stmt.rhs[0] == self.constant:
+                    return True
+        return False
+    def lookup(self):
+        index = self.get_index()
+        if index:
+            # The index is by value; test() then checks for the tree itself:
+            return index.assignments_by_constant.get(
+                getattr(self.constant, 'constant', self.constant), [])
+    def __repr__(self):
+        return ('AssigningConstant(%r, constant=%r)'
+                % (self.innerquery, self.constant))
+    def __str__(self):
+        return '%s in which an assignment of the value %s is made' % (self.innerquery, self.constant)
+
+class Within(CompoundQuery):
+    def __init__(self, innerquery, funcname):
+        CompoundQuery.__init__(self, innerquery)
+        self.funcname = funcname
+    def test(self, node):
+        if node.function:
+            if node.function.decl.name == self.funcname:
+                return True
+        return False
+    def lookup(self):
+        graph = self.get_graph()
+        if hasattr(graph, 'get_functions_by_name'):
+            result = []
+            for fun in graph.get_functions_by_name(self.funcname):
+                result += graph.iter_nodes_within(fun)
+            return result
+    def __repr__(self):
+        return ('Within(%r, funcname=%r)'
+                % (self.innerquery, self.funcname))
+    def __str__(self):
+        return '%s within %s' % (self.innerquery, self.funcname)
+
 class Query(BaseQuery):
     def __init__(self, graph):
         self.graph = graph
 
-    def __iter__(self):
-        for node in self.graph.nodes:
-            yield node
+    def get_graph(self):
+        return self.graph
+
+    def matches(self, node):
+        return True
 
     def __repr__(self):
         return 'Query()'
 
     def __str__(self):
         return 'nodes'
-
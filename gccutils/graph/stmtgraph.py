@@ -17,6 +17,7 @@
 
 import gcc
 
+from gccutils import FlattenedCfg
 from gccutils.graph import Graph, Node, Edge
 
 ############################################################################
@@ -34,7 +35,8 @@ class StmtGraph(Graph):
                  '__lastnode',
                  'supernode_for_stmtnode')
 
-    def __init__(self, fun, split_phi_nodes, omit_complex_edges=False):
+    def __init__(self, fun, split_phi_nodes, omit_complex_edges=False,
+                 flat=None):
         """
         fun : the underlying gcc.Function
 
@@ -47,6 +49,9 @@ class StmtGraph(Graph):
 
            if false, create a StmtNode per phi node at the top of the BB
 
+        flat: the gccutils.FlattenedCfg for fun.cfg, if the caller has
+        already built one within the current pass (otherwise, one is built)
+
         """
         Graph.__init__(self)
         self.fun = fun
@@ -58,11 +63,16 @@ class StmtGraph(Graph):
         self.exit_of_bb = {}
         self.node_for_stmt = {}
 
-        basic_blocks = fun.cfg.basic_blocks
+        if flat is None:
+            flat = FlattenedCfg(fun.cfg)
+        entry_bb = fun.cfg.entry
+        exit_bb = fun.cfg.exit
 
         # 1st pass: create nodes and edges within BBs:
-        for bb in basic_blocks:
+        for bb in flat.blocks:
             self.__lastnode = None
+            phi_nodes = flat.phi_nodes[bb.index]
+            gimple = flat.gimple[bb.index]
 
             def add_stmt(stmt):
                 nextnode = self.add_node(StmtNode(fun, bb, stmt))
@@ -73,23 +83,23 @@ class StmtGraph(Graph):
                     self.entry_of_bb[bb] = nextnode
                 self.__lastnode = nextnode
 
-            if bb.phi_nodes and not split_phi_nodes:
+            if phi_nodes and not split_phi_nodes:
                 # If we're not splitting the phi nodes, add them to the top
                 # of each BB:
-                for stmt in bb.phi_nodes:
+                for stmt in phi_nodes:
                     add_stmt(stmt)
                 self.exit_of_bb[bb] = self.__lastnode
-            if bb.gimple:
-                for stmt in bb.gimple:
+            if gimple:
+                for stmt in gimple:
                     add_stmt(stmt)
                 self.exit_of_bb[bb] = self.__lastnode
 
             if self.__lastnode is None:
                 # We have a BB with neither statements nor phis
                 # Create a single node for this BB:
-                if bb == fun.cfg.entry:
+                if bb == entry_bb:
                     cls = EntryNode
-                elif bb == fun.cfg.exit:
+                elif bb == exit_bb:
                     cls = ExitNode
                 else:
                     # gcc appears to create empty BBs for functions
@@ -99,45 +109,43 @@ class StmtGraph(Graph):
                 node = self.add_node(cls(fun, bb, None))
                 self.entry_of_bb[bb] = node
                 self.exit_of_bb[bb] = node
-                if bb == fun.cfg.entry:
+                if bb == entry_bb:
                     self.entry = node
-                elif bb == fun.cfg.exit:
+                elif bb == exit_bb:
                     self.exit = node
 
             assert self.entry_of_bb[bb] is not None
             assert self.exit_of_bb[bb] is not None
 
         # 2nd pass: wire up the cross-BB edges:
-        for bb in basic_blocks:
-            for edge in bb.succs:
-
-                # If requested, omit "complex" edges e.g. due to
-                # exception-handling:
-                if omit_complex_edges:
-                    if edge.complex:
-                        continue
-
-                last_node = self.exit_of_bb[bb]
-                if split_phi_nodes:
-                    # add SplitPhiNode instances at the end of each edge
-                    # as a copy of each phi node, specialized for this edge
-                    if edge.dest.phi_nodes:
-                        for stmt in edge.dest.phi_nodes:
-                            split_phi = self.add_node(SplitPhiNode(fun, stmt, edge))
-                            self.add_edge(last_node,
-                                          split_phi,
-                                          edge)
-                            last_node = split_phi
-
-                # After optimization, the CFG sometimes contains edges that
-                # point to blocks that are no longer within fun.cfg.basic_blocks
-                # Skip them:
-                if edge.dest not in basic_blocks:
+        for srcindex, destindex, edge in flat.edges:
+            # If requested, omit "complex" edges e.g. due to
+            # exception-handling:
+            if omit_complex_edges:
+                if edge.complex:
                     continue
 
-                self.add_edge(last_node,
-                              self.entry_of_bb[edge.dest],
-                              edge)
+            last_node = self.exit_of_bb[flat.block_for_index[srcindex]]
+
+            # After optimization, the CFG sometimes contains edges that
+            # point to blocks that are no longer within fun.cfg.basic_blocks
+            # Skip them:
+            if destindex not in flat.block_for_index:
+                continue
+
+            if split_phi_nodes:
+                # add SplitPhiNode instances at the end of each edge
+                # as a copy of each phi node, specialized for this edge
+                for stmt in flat.phi_nodes[destindex]:
+                    split_phi = self.add_node(SplitPhiNode(fun, stmt, edge))
+                    self.add_edge(last_node,
+                                  split_phi,
+                                  edge)
+                    last_node = split_phi
+
+            self.add_edge(last_node,
+                          self.entry_of_bb[flat.block_for_index[destindex]],
+                          edge)
 
         # 3rd pass: set up caselabelexprs for edges within switch statements
         # There doesn't seem to be any direct association between edges in a
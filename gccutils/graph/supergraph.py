@@ -15,6 +15,8 @@
 #   along with this program.  If not, see
 #   <http://www.gnu.org/licenses/>.
 
+import gcc
+
 from gccutils.graph import Graph, Node, Edge, Subgraph
 from gccutils.graph.stmtgraph import StmtGraph
 
@@ -25,11 +27,20 @@ from gccutils.graph.stmtgraph import StmtGraph
 class Supergraph(Graph):
     __slots__ = ('supernode_for_stmtnode',
                  'stmtg_for_fun',
-                 'fake_entry_node')
+                 'fake_entry_node',
+                 'index')
 
-    def __init__(self, split_phi_nodes, add_fake_entry_node):
+    def __init__(self, split_phi_nodes, add_fake_entry_node, compact=False):
+        """
+        compact: if true, compact the supergraph and the StmtGraph of each
+        function once they're built (see Graph.compact), saving memory for
+        supergraphs of whole programs at the cost of slower access to the
+        "preds" and "succs" of their nodes
+        """
         Graph.__init__(self)
         self.supernode_for_stmtnode = {}
+        # The SupergraphIndex, once get_index() has been called:
+        self.index = None
         # 1st pass: locate interprocedural instances of gcc.GimpleCall
         # i.e. where both caller and callee are within the supergraph
         # (perhaps the same function)
@@ -50,37 +61,10 @@ class Supergraph(Graph):
             fun = node.decl.function
             if fun:
                 stmtg = StmtGraph(fun, split_phi_nodes)
+                if compact:
+                    stmtg.compact()
                 self.stmtg_for_fun[fun] = stmtg
-                # Clone the stmtg nodes and edges into the Supergraph:
-                stmtg.supernode_for_stmtnode = {}
-                for node in stmtg.nodes:
-                    if node.stmt in ipcalls:
-                        # These nodes will have two supernodes, a CallNode
-                        # and a ReturnNode:
-                        callnode = self.add_node(CallNode(node, stmtg))
-                        returnnode = self.add_node(ReturnNode(node, stmtg))
-                        callnode.returnnode = returnnode
-                        returnnode.callnode = callnode
-                        stmtg.supernode_for_stmtnode[node] = (callnode, returnnode)
-                        self.add_edge(
-                            callnode, returnnode,
-                            CallToReturnSiteEdge, None)
-                    else:
-                        stmtg.supernode_for_stmtnode[node] = \
-                            self.add_node(SupergraphNode(node, stmtg))
-                for edge in stmtg.edges:
-                    if edge.srcnode.stmt in ipcalls:
-                        # Begin the superedge from the ReturnNode:
-                        srcsupernode = stmtg.supernode_for_stmtnode[edge.srcnode][1]
-                    else:
-                        srcsupernode = stmtg.supernode_for_stmtnode[edge.srcnode]
-                    if edge.dstnode.stmt in ipcalls:
-                        # End the superedge at the CallNode:
-                        dstsupernode = stmtg.supernode_for_stmtnode[edge.dstnode][0]
-                    else:
-                        dstsupernode = stmtg.supernode_for_stmtnode[edge.dstnode]
-                    superedge = self.add_edge(srcsupernode, dstsupernode,
-                                              SupergraphEdge, edge)
+                self._add_stmtgraph(stmtg, ipcalls)
 
         # 3rd pass: add the interprocedural edges (call and return):
         for node in get_callgraph_nodes():
@@ -88,35 +72,75 @@ class Supergraph(Graph):
             if fun:
                 for edge in node.callees:
                     if edge.callee.decl.function:
-                        calling_stmtg = self.stmtg_for_fun[fun]
-                        called_stmtg = self.stmtg_for_fun[edge.callee.decl.function]
-
-                        calling_stmtnode = calling_stmtg.node_for_stmt[edge.call_stmt]
-                        assert calling_stmtnode
-
-                        entry_stmtnode = called_stmtg.entry
-                        assert entry_stmtnode
-
-                        exit_stmtnode = called_stmtg.exit
-                        assert exit_stmtnode
-
-                        superedge_call = self.add_edge(
-                            calling_stmtg.supernode_for_stmtnode[calling_stmtnode][0],
-                            called_stmtg.supernode_for_stmtnode[entry_stmtnode],
-                            CallToStart,
-                            None)
-                        superedge_return = self.add_edge(
-                            called_stmtg.supernode_for_stmtnode[exit_stmtnode],
-                            calling_stmtg.supernode_for_stmtnode[calling_stmtnode][1],
-                            ExitToReturnSite,
-                            None)
-                        superedge_return.calling_stmtnode = calling_stmtnode
+                        self._add_call_edges(
+                            self.stmtg_for_fun[fun],
+                            edge.call_stmt,
+                            self.stmtg_for_fun[edge.callee.decl.function])
 
         # 4th pass: create fake entry node:
-        if not add_fake_entry_node:
+        if add_fake_entry_node:
+            self._add_fake_entry_node()
+        else:
             self.fake_entry_node = None
-            return
 
+        if compact:
+            self.compact()
+
+    def _add_stmtgraph(self, stmtg, ipcalls):
+        # Clone the stmtg nodes and edges into the Supergraph:
+        stmtg.supernode_for_stmtnode = {}
+        for node in stmtg.nodes:
+            if node.stmt in ipcalls:
+                # These nodes will have two supernodes, a CallNode
+                # and a ReturnNode:
+                callnode = self.add_node(CallNode(node, stmtg))
+                returnnode = self.add_node(ReturnNode(node, stmtg))
+                callnode.returnnode = returnnode
+                returnnode.callnode = callnode
+                stmtg.supernode_for_stmtnode[node] = (callnode, returnnode)
+                self.add_edge(
+                    callnode, returnnode,
+                    CallToReturnSiteEdge, None)
+            else:
+                stmtg.supernode_for_stmtnode[node] = \
+                    self.add_node(SupergraphNode(node, stmtg))
+        for edge in stmtg.edges:
+            if edge.srcnode.stmt in ipcalls:
+                # Begin the superedge from the ReturnNode:
+                srcsupernode = stmtg.supernode_for_stmtnode[edge.srcnode][1]
+            else:
+                srcsupernode = stmtg.supernode_for_stmtnode[edge.srcnode]
+            if edge.dstnode.stmt in ipcalls:
+                # End the superedge at the CallNode:
+                dstsupernode = stmtg.supernode_for_stmtnode[edge.dstnode][0]
+            else:
+                dstsupernode = stmtg.supernode_for_stmtnode[edge.dstnode]
+            superedge = self.add_edge(srcsupernode, dstsupernode,
+                                      SupergraphEdge, edge)
+
+    def _add_call_edges(self, calling_stmtg, call_stmt, called_stmtg):
+        calling_stmtnode = calling_stmtg.node_for_stmt[call_stmt]
+        assert calling_stmtnode
+
+        entry_stmtnode = called_stmtg.entry
+        assert entry_stmtnode
+
+        exit_stmtnode = called_stmtg.exit
+        assert exit_stmtnode
+
+        superedge_call = self.add_edge(
+            calling_stmtg.supernode_for_stmtnode[calling_stmtnode][0],
+            called_stmtg.supernode_for_stmtnode[entry_stmtnode],
+            CallToStart,
+            None)
+        superedge_return = self.add_edge(
+            called_stmtg.supernode_for_stmtnode[exit_stmtnode],
+            calling_stmtg.supernode_for_stmtnode[calling_stmtnode][1],
+            ExitToReturnSite,
+            None)
+        superedge_return.calling_stmtnode = calling_stmtnode
+
+    def _add_fake_entry_node(self):
         self.fake_entry_node = self.add_node(FakeEntryNode(None, None))
         """
 	/* At file scope, the presence of a `static' or `register' storage
@@ -133,18 +157,63 @@ class Supergraph(Graph):
         for fun in self.stmtg_for_fun:
             # Only for non-static functions:
             if fun.decl.is_public:
-                stmtg = self.stmtg_for_fun[fun]
-                self.add_edge(self.fake_entry_node,
-                              stmtg.supernode_for_stmtnode[stmtg.entry],
-                              FakeEntryEdge,
-                              None)
+                self._add_fake_entry_edge(self.stmtg_for_fun[fun])
+
+    def _add_fake_entry_edge(self, stmtg):
+        self.add_edge(self.fake_entry_node,
+                      stmtg.supernode_for_stmtnode[stmtg.entry],
+                      FakeEntryEdge,
+                      None)
+
+    def get_stmtgraph(self, fun):
+        """
+        Get the StmtGraph for the given gcc.Function
+        """
+        return self.stmtg_for_fun[fun]
+
+    def get_functions_by_name(self, funcname):
+        """
+        Get a list of the gcc.Function instances within the supergraph with
+        the given name (there can be more than one for static functions)
+        """
+        return [fun for fun in self.get_functions()
+                if fun.decl.name == funcname]
+
+    def get_index(self):
+        """
+        Get the SupergraphIndex for the supergraph, building it on the
+        first call; it's kept up-to-date as nodes are added
+        """
+        if self.index is None:
+            self.index = SupergraphIndex(self.nodes)
+        return self.index
+
+    def iter_nodes_within(self, fun):
+        """
+        Yield the supernodes for the given gcc.Function
+        """
+        stmtg = self.get_stmtgraph(fun)
+        for supernode in stmtg.supernode_for_stmtnode.values():
+            if isinstance(supernode, tuple):
+                # (CallNode, ReturnNode) pair:
+                for node in supernode:
+                    yield node
+            else:
+                yield supernode
 
     def add_node(self, supernode):
         Graph.add_node(self, supernode)
         # Keep track of mapping from stmtnode -> supernode
         self.supernode_for_stmtnode[supernode.innernode] = supernode
+        if self.index is not None:
+            self.index.add_node(supernode)
         return supernode
 
+    def remove_node(self, node):
+        # (rather than trying to update the index)
+        self.index = None
+        return Graph.remove_node(self, node)
+
     def _make_edge(self, srcnode, dstnode, cls, edge):
         return cls(srcnode, dstnode, edge)
 
@@ -156,6 +225,193 @@ class Supergraph(Graph):
         for fun in self.stmtg_for_fun:
             yield fun
 
+class LazySupergraph(Supergraph):
+    """
+    A Supergraph in which the nodes and edges for each function (and the
+    interprocedural edges to and from it) are only added when first needed,
+    so that clients that only look at a few functions don't pay for
+    building the StmtGraph of every function in the program
+
+    The supergraph can be restricted to a subset of the functions (e.g. those
+    within one LTO partition); calls to functions outside of that subset are
+    treated like calls to external functions.
+
+    Only the functions that have been built so far are within "nodes" and
+    "edges"; use get_stmtgraph() or build_reachable() (or
+    get_entry_nodes()) to ensure that the ones of interest have been
+
+    Building a function adds to the "nodes" and "edges" sets in place, so
+    nothing that can build functions (get_stmtgraph(), build_reachable(),
+    get_entry_nodes(), get_index(), iter_nodes_within(), or solving an IFDS
+    problem) should be called while iterating over them; iterate over a
+    snapshot instead (e.g. "for node in list(sg.nodes):"), or build
+    everything of interest beforehand
+    """
+    __slots__ = ('split_phi_nodes',
+                 'add_fake_entry_node',
+                 'functions',
+                 'calls_from',
+                 'calls_to',
+                 'ipcalls',
+                 'compact_stmtgraphs')
+
+    def __init__(self, split_phi_nodes, add_fake_entry_node, functions=None,
+                 compact=False):
+        """
+        functions: the gcc.Function instances to cover, or None for all of
+        those in the callgraph that have bodies
+
+        compact: if true, compact the StmtGraph of each function once it's
+        built (the supergraph itself changes as it's built, so it isn't
+        compacted)
+        """
+        Graph.__init__(self)
+        self.split_phi_nodes = split_phi_nodes
+        self.compact_stmtgraphs = compact
+        self.add_fake_entry_node = add_fake_entry_node
+        self.supernode_for_stmtnode = {}
+        self.stmtg_for_fun = {}
+        self.fake_entry_node = None
+        self.index = None
+
+        from gcc import get_callgraph_nodes
+        if functions is None:
+            functions = [node.decl.function
+                         for node in get_callgraph_nodes()
+                         if node.decl.function]
+        self.functions = []
+        # Dicts mapping from gcc.Function to lists of (gcc.GimpleCall,
+        # callee) and (caller, gcc.GimpleCall) pairs for the calls between
+        # the functions:
+        self.calls_from = {}
+        self.calls_to = {}
+        for fun in functions:
+            if fun not in self.calls_from:
+                self.functions.append(fun)
+                self.calls_from[fun] = []
+                self.calls_to[fun] = []
+
+        # Locate the interprocedural instances of gcc.GimpleCall (in one
+        # walk of the callgraph, without building anything):
+        self.ipcalls = set()
+        for node in get_callgraph_nodes():
+            fun = node.decl.function
+            if fun in self.calls_from:
+                for edge in node.callees:
+                    callee = edge.callee.decl.function
+                    if callee in self.calls_from:
+                        self.calls_from[fun].append((edge.call_stmt, callee))
+                        self.calls_to[callee].append((fun, edge.call_stmt))
+                        self.ipcalls.add(edge.call_stmt)
+
+    def get_stmtgraph(self, fun):
+        """
+        Get the StmtGraph for the given gcc.Function, adding its nodes and
+        edges to the supergraph if they haven't been already, along with
+        the call and return edges to and from any other functions that have
+        """
+        if fun in self.stmtg_for_fun:
+            return self.stmtg_for_fun[fun]
+        if fun not in self.calls_from:
+            raise ValueError('%s is not within the supergraph'
+                             % fun.decl.name)
+
+        stmtg = StmtGraph(fun, self.split_phi_nodes)
+        if self.compact_stmtgraphs:
+            stmtg.compact()
+        self.stmtg_for_fun[fun] = stmtg
+        self._add_stmtgraph(stmtg, self.ipcalls)
+
+        for call_stmt, callee in self.calls_from[fun]:
+            if callee in self.stmtg_for_fun:
+                self._add_call_edges(stmtg, call_stmt,
+                                     self.stmtg_for_fun[callee])
+        for caller, call_stmt in self.calls_to[fun]:
+            # (recursive calls were handled above)
+            if caller in self.stmtg_for_fun and caller != fun:
+                self._add_call_edges(self.stmtg_for_fun[caller], call_stmt,
+                                     stmtg)
+
+        if self.fake_entry_node and fun.decl.is_public:
+            self._add_fake_entry_edge(stmtg)
+        return stmtg
+
+    def build_reachable(self, funs):
+        """
+        Ensure that the given gcc.Function instances, and all of those that
+        they can (transitively) call within the supergraph, have been built
+        """
+        worklist = list(funs)
+        while worklist:
+            fun = worklist.pop()
+            if fun in self.stmtg_for_fun:
+                continue
+            self.get_stmtgraph(fun)
+            for call_stmt, callee in self.calls_from[fun]:
+                worklist.append(callee)
+
+    def get_index(self):
+        # The index covers the whole supergraph:
+        self.build_reachable(self.functions)
+        return Supergraph.get_index(self)
+
+    def get_entry_nodes(self):
+        if self.add_fake_entry_node:
+            if not self.fake_entry_node:
+                self.fake_entry_node = self.add_node(FakeEntryNode(None, None))
+                for fun in self.stmtg_for_fun:
+                    if fun.decl.is_public:
+                        self._add_fake_entry_edge(self.stmtg_for_fun[fun])
+            # Everything reachable from the entrypoints needs to be built,
+            # so that the successors of every node are complete:
+            self.build_reachable(fun for fun in self.functions
+                                 if fun.decl.is_public)
+            yield self.fake_entry_node
+
+    def get_functions(self):
+        for fun in self.functions:
+            yield fun
+
+class SupergraphIndex(object):
+    """
+    Dicts for looking up the nodes of a Supergraph by various properties of
+    their statements, built in one pass over the nodes (for use by
+    gccutils.graph.query)
+    """
+    def __init__(self, nodes):
+        # Dict mapping from the name of the called function to the list of
+        # nodes for calls to it (the CallNode for interprocedural calls):
+        self.calls_by_callee_name = {}
+        # Dict mapping from the name of the variable assigned to by the
+        # statement to the list of nodes:
+        self.nodes_by_lhs_name = {}
+        # Dict mapping from an int to the list of nodes for assignments of
+        # it as a constant:
+        self.assignments_by_constant = {}
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node):
+        stmt = node.stmt
+        if stmt is None:
+            return
+
+        if isinstance(stmt, gcc.GimpleCall) and not isinstance(node, ReturnNode):
+            if isinstance(stmt.fn, gcc.AddrExpr):
+                if isinstance(stmt.fn.operand, gcc.FunctionDecl):
+                    self.calls_by_callee_name.setdefault(
+                        stmt.fn.operand.name, []).append(node)
+
+        var = getattr(getattr(stmt, 'lhs', None), 'var', None)
+        name = getattr(var, 'name', None)
+        if name is not None:
+            self.nodes_by_lhs_name.setdefault(name, []).append(node)
+
+        if isinstance(stmt, gcc.GimpleAssign):
+            if stmt.exprcode == gcc.IntegerCst:
+                self.assignments_by_constant.setdefault(
+                    stmt.rhs[0].constant, []).append(node)
+
 class SupergraphNode(Node):
     """
     A node in the supergraph, wrapping a StmtNode
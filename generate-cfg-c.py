@@ -176,6 +176,10 @@ def generate_cfg():
                        'PyGccCfg_get_block_for_label',
                        'METH_VARARGS',
                        "Given a gcc.LabelDecl, get the corresponding gcc.BasicBlock")
+    methods.add_method('get_flattened',
+                       'PyGccCfg_get_flattened',
+                       'METH_NOARGS',
+                       "Get a (blocks, stmts, edges) tuple for the whole graph, built in a single walk")
     cu.add_defn(methods.c_defn())
     pytype.tp_methods = methods.identifier
 
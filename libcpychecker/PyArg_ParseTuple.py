@@ -99,6 +99,9 @@ class TypeCheck(FormatUnit):
             return None
         return get_type_for_typeobject(self.typeobject)
 
+    def reset(self):
+        self.typeobject = None
+
 class TypeCheckCheckerType(AwkwardType):
     def __init__(self, typecheck):
         self.typecheck = typecheck
@@ -188,6 +191,10 @@ class Conversion(FormatUnit):
         # together the two arguments
         return [self.callback, self.result]
 
+    def reset(self):
+        self.callback.actual_type = None
+        self.result.type = None
+
 class ConverterCallbackType(AwkwardType):
     def __init__(self, conv):
         self.conv = conv
@@ -261,9 +268,6 @@ class PyArgParseFmt(ParsedFormatString):
     def add_argument(self, code, expected_types):
         self.args.append(ConcreteUnit(code, expected_types))
 
-    def num_expected(self):
-        return len(list(self.iter_exp_types()))
-
     def iter_exp_types(self):
         """
         Yield a sequence of (FormatUnit, gcc.Type) pairs, representing
@@ -155,11 +155,6 @@ class PyBuildValueFmt(ParsedFormatString):
         ParsedFormatString.__init__(self, fmt_string)
         self.arg_stack = [self.args]
 
-    def num_expected(self):
-        from pprint import pformat
-        #sys.stderr.write('%s\n' % pformat(list(self.iter_exp_types())))
-        return len(list(self.iter_exp_types()))
-
     def iter_exp_types(self):
         """
         Yield a sequence of (FormatUnit, gcc.Type) pairs, representing
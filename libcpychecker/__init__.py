@@ -18,12 +18,14 @@
 from __future__ import print_function
 import sys
 import gcc
-from libcpychecker.formatstrings import check_pyargs
-from libcpychecker.utils import log
+from libcpychecker.formatstrings import check_pyargs, PyArgsChecker
+from libcpychecker.utils import log, enable_logging
 from libcpychecker.refcounts import check_refcounts, get_traces
 from libcpychecker.attributes import register_our_attributes
 from libcpychecker.initializers import check_initializers
 from libcpychecker.types import get_PyObject
+from libcpychecker.summaries import get_summary, record_summary
+from gccutils import sorted_callgraph, FlattenedCfg
 if hasattr(gcc, 'PLUGIN_FINISH_DECL'):
     from libcpychecker.compat import on_finish_decl
 
@@ -36,16 +38,36 @@ class CpyCheckerGimplePass(gcc.GimplePass):
                  dump_traces=False,
                  show_traces=False,
                  verify_pyargs=True,
+                 batch_pyargs=False,
                  verify_refcounting=False,
                  show_possible_null_derefs=False,
                  only_on_python_code=True,
                  maxtrans=256,
                  dump_json=False,
-                 verbose=False):
+                 verbose=False,
+                 jobs=1,
+                 cache_dir=None,
+                 cache_size=None,
+                 summaries=False,
+                 merge_states=True,
+                 widen_loops=False,
+                 max_cpu_secs=None,
+                 max_memory_mb=None,
+                 degrade=False,
+                 report_budget=False,
+                 jsonl=False,
+                 html=True):
         gcc.GimplePass.__init__(self, 'cpychecker-gimple')
         self.dump_traces = dump_traces
         self.show_traces = show_traces
         self.verify_pyargs = verify_pyargs
+        # Optionally, share the results of checking the format strings
+        # between all of the functions in the translation unit:
+        self.batch_pyargs = batch_pyargs
+        if batch_pyargs:
+            self.pyargs_checker = PyArgsChecker()
+        else:
+            self.pyargs_checker = None
         # Refcounting verification is run before rewriting gimple into ssa form,
         # and as such is not expected to handle ssa.  In gcc 7 and later, gcc
         # introduces ssa names before the ssa rewrite (for call arguments that
@@ -64,12 +86,75 @@ class CpyCheckerGimplePass(gcc.GimplePass):
         self.only_on_python_code = only_on_python_code
         self.maxtrans = maxtrans
         self.dump_json = dump_json
+        # Optionally, analyze functions bottom-up over the callgraph (from
+        # the IPA pass), using summaries of the functions already analyzed
+        # at the sites that call them:
+        self.summaries = summaries
+        self.merge_states = merge_states
+        self.widen_loops = widen_loops
+        # The budget for analyzing each function, beyond maxtrans:
+        self.max_cpu_secs = max_cpu_secs
+        self.max_memory_mb = max_memory_mb
+        self.degrade = degrade
+        self.report_budget = report_budget
+
+        # Optionally, write all of the reports for the translation unit to
+        # a single JSONL file, rather than per-function JSON and HTML files:
+        if jsonl:
+            from libcpychecker.diagnostics import JsonlReportWriter
+            self.jsonl = JsonlReportWriter()
+        else:
+            self.jsonl = None
+        # Optionally, don't render HTML reports, leaving that to be done
+        # offline from the JSON:
+        self.html = html
+
+        # Optionally, cache the results of the refcount checker on disk,
+        # so that unchanged functions aren't reanalyzed:
+        if self.verify_refcounting and cache_dir:
+            from libcpychecker.cache import ResultCache, DEFAULT_MAXSIZE
+            options = dict(show_possible_null_derefs=show_possible_null_derefs,
+                           maxtrans=maxtrans,
+                           dump_json=dump_json,
+                           summaries=summaries,
+                           merge_states=merge_states,
+                           widen_loops=widen_loops,
+                           max_cpu_secs=max_cpu_secs,
+                           max_memory_mb=max_memory_mb,
+                           degrade=degrade,
+                           report_budget=report_budget,
+                           jsonl=jsonl,
+                           html=html)
+            self.cache = ResultCache(cache_dir,
+                                     cache_size or DEFAULT_MAXSIZE,
+                                     options,
+                                     self.jsonl)
+        else:
+            self.cache = None
+
+        # Optionally, run the refcount checker on each function within a
+        # pool of worker processes (jobs=0 meaning one per CPU), emitting
+        # the results at the end (see CpyCheckerIpaPass):
+        if self.verify_refcounting and jobs != 1:
+            from libcpychecker.parallel import WorkerPool
+            self.pool = WorkerPool(self._check_refcounts_in_worker, jobs,
+                                   on_result=self._on_summary,
+                                   on_emit=self._on_emit)
+        else:
+            self.pool = None
 
     def execute(self, fun):
         if fun:
             log('%s', fun)
+            # Fetch the CFG from GCC once, for all of the checks below:
+            flat = None
+            if fun.cfg and (self.verify_pyargs or self.verify_refcounting):
+                flat = FlattenedCfg(fun.cfg)
             if self.verify_pyargs:
-                check_pyargs(fun)
+                if self.pyargs_checker:
+                    self.pyargs_checker.check_function(fun, flat)
+                else:
+                    check_pyargs(fun, flat)
 
             if self.only_on_python_code:
                 # Only run the refcount checker on code that
@@ -79,26 +164,116 @@ class CpyCheckerGimplePass(gcc.GimplePass):
 
             # The refcount code is too buggy for now to be on by default:
             if self.verify_refcounting:
+                if self.jsonl:
+                    # (before any worker processes are forked)
+                    self.jsonl.start()
+                if self.summaries:
+                    # The function will be analyzed from the IPA pass, once
+                    # its callees have been (see check_refcounts_bottom_up):
+                    return
                 if 0:
                     # Profiled version:
                     import cProfile
                     prof_filename = '%s.%s.refcount-profile' % (gcc.get_dump_base_name(),
                                                                 fun.decl.name)
-                    cProfile.runctx('self._check_refcounts(fun)',
+                    cProfile.runctx('self._check_refcounts(fun, flat)',
                                     globals(), locals(),
                                     filename=prof_filename)
                     import pstats
                     prof = pstats.Stats(prof_filename)
                     prof.sort_stats('cumulative').print_stats(20)
+                elif self.pool:
+                    # Analyze the function in a worker process:
+                    self.pool.submit(fun)
                 else:
                     # Normal mode (without profiler):
-                    self._check_refcounts(fun)
+                    self._check_refcounts(fun, flat)
 
-    def _check_refcounts(self, fun):
-        check_refcounts(fun, self.dump_traces, self.show_traces,
+    def _check_refcounts(self, fun, flat=None):
+        # flat: the gccutils.FlattenedCfg for fun.cfg, if it was built
+        # within the current pass (not so for the IPA pass, or within a
+        # worker process)
+        def analyze(fun):
+            return self._analyze_refcounts(fun, flat)
+        # (dump_traces and show_traces have side-effects that we can't
+        # replay from the cache)
+        if self.cache and not (self.dump_traces or self.show_traces):
+            self.cache.check_function(fun, analyze, flat)
+        else:
+            analyze(fun)
+        if self.summaries:
+            # (for the benefit of WorkerPool, which passes this back from
+            # the worker process to _on_summary)
+            return get_summary(fun.decl.name)
+
+    def _analyze_refcounts(self, fun, flat=None):
+        return check_refcounts(fun, self.dump_traces, self.show_traces,
                         self.show_possible_null_derefs,
                         maxtrans=self.maxtrans,
-                        dump_json=self.dump_json)
+                        dump_json=self.dump_json,
+                        summarize=self.summaries,
+                        merge_states=self.merge_states,
+                        widen_loops=self.widen_loops,
+                        max_cpu_secs=self.max_cpu_secs,
+                        max_memory_mb=self.max_memory_mb,
+                        degrade=self.degrade,
+                        report_budget=self.report_budget,
+                        jsonl=self.jsonl,
+                        html=self.html,
+                        flat=flat)
+
+    def _check_refcounts_in_worker(self, fun):
+        # Within a worker process: pass back any JSONL lines along with the
+        # summary, so that they're written out in the order of the
+        # functions (see _on_emit), rather than that in which the workers
+        # finish:
+        if self.jsonl:
+            self.jsonl.capture_lines()
+        summary = self._check_refcounts(fun)
+        if self.jsonl:
+            return (summary, self.jsonl.get_captured_lines())
+        return (summary, [])
+
+    def _on_summary(self, fun, result):
+        summary, lines = result
+        if summary:
+            record_summary(summary)
+
+    def _on_emit(self, fun, result):
+        summary, lines = result
+        for line in lines:
+            self.jsonl.write_line(line)
+
+    def check_refcounts_bottom_up(self):
+        """
+        Run the refcount checker on every function in the callgraph,
+        analyzing callees before their callers, so that the calls can use the
+        FunctionSummary of the callee
+        """
+        if self.only_on_python_code:
+            if not get_PyObject():
+                return
+        if self.jsonl:
+            self.jsonl.start()
+        done = set()
+        def check(node):
+            fun = node.decl.function
+            if fun is None or fun in done:
+                return
+            done.add(fun)
+            if self.pool:
+                self.pool.submit(fun,
+                                 wait_for=[edge.callee.decl.function
+                                           for edge in node.callees
+                                           if edge.callee.decl.function])
+            else:
+                self._check_refcounts(fun)
+        for node in reversed(sorted_callgraph()):
+            check(node)
+        # sorted_callgraph() omits cycles of mutually-recursive functions
+        # that don't call anything else; analyze them too:
+        for node in gcc.get_callgraph_nodes():
+            check(node)
 
 
 class CpyCheckerIpaPass(gcc.SimpleIpaPass):
@@ -106,13 +281,30 @@ class CpyCheckerIpaPass(gcc.SimpleIpaPass):
     The custom pass that implements the whole-program part of
     our extra compile-time checks
     """
-    def __init__(self):
+    def __init__(self, gimple_ps=None):
         gcc.SimpleIpaPass.__init__(self, 'cpychecker-ipa')
+        self.gimple_ps = gimple_ps
 
     def execute(self):
+        if (self.gimple_ps
+            and self.gimple_ps.verify_refcounting
+            and self.gimple_ps.summaries):
+            self.gimple_ps.check_refcounts_bottom_up()
+
+        # Emit the results of any per-function analysis that's been running
+        # in worker processes:
+        if self.gimple_ps and self.gimple_ps.pool:
+            self.gimple_ps.pool.finish()
+
         check_initializers()
 
 def main(**kwargs):
+    # Enable logging for the given subsystems, if any
+    # e.g. log="absinterp,refcounts":
+    if kwargs.get('log'):
+        enable_logging(kwargs['log'])
+    kwargs.pop('log', None)
+
     # Register our custom attributes:
     gcc.register_callback(gcc.PLUGIN_ATTRIBUTES,
                           register_our_attributes)
@@ -131,5 +323,5 @@ def main(**kwargs):
         # SSA version:
         gimple_ps.register_after('ssa')
 
-    ipa_ps = CpyCheckerIpaPass()
+    ipa_ps = CpyCheckerIpaPass(gimple_ps)
     ipa_ps.register_before('*free_lang_data')
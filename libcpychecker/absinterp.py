@@ -15,20 +15,28 @@
 #   along with this program.  If not, see
 #   <http://www.gnu.org/licenses/>.
 
+import copy
 import gcc
 import gccutils
+import itertools
+import os
+import random
 import re
+import resource
 import sys
-from six import StringIO, integer_types
+import weakref
+from six import StringIO, integer_types, add_metaclass
 
 from gccutils import get_src_for_loc, get_nonnull_arguments, check_isinstance
 from gccutils.graph.stmtgraph import StmtGraph, StmtNode
 
-from collections import OrderedDict
-from libcpychecker.utils import log, logging_enabled
+from collections import OrderedDict, deque
+from libcpychecker.utils import get_logger, Lazy
 from libcpychecker.types import *
 from libcpychecker.diagnostics import location_as_json, type_as_json
 
+log = get_logger('absinterp')
+
 debug_comparisons = 0
 
 numeric_types = integer_types + (float, )
@@ -172,12 +180,53 @@ class FnMeta(object):
 # Various kinds of r-value:
 ############################################################################
 
+def get_intern_key(arg):
+    # Get a hashable key for an argument used in constructing an
+    # AbstractValue.  The type is included, so that e.g. 0 and 0.0 are kept
+    # distinct:
+    if isinstance(arg, AbstractValue):
+        return arg.get_fingerprint()
+    return (type(arg), arg)
+
+class InterningMeta(type):
+    """
+    Metaclass for AbstractValue: instances of the classes for which identity
+    doesn't matter are immutable, and are hash-consed, so that constructing
+    a value that's structurally identical to one that's still alive gives
+    back the existing instance, rather than a new one.
+    """
+    # A mapping from keys describing constructor calls to the resulting
+    # instances (held weakly, so that this doesn't keep values alive):
+    interned = weakref.WeakValueDictionary()
+
+    def __call__(cls, *args, **kwargs):
+        if cls.identity_matters:
+            return type.__call__(cls, *args, **kwargs)
+        try:
+            key = (cls,
+                   tuple(get_intern_key(arg) for arg in args),
+                   tuple(sorted((name, get_intern_key(arg))
+                                for name, arg in kwargs.items())))
+            result = InterningMeta.interned.get(key)
+        except TypeError:
+            # Unhashable argument; don't intern:
+            return type.__call__(cls, *args, **kwargs)
+        if result is None:
+            result = type.__call__(cls, *args, **kwargs)
+            InterningMeta.interned[key] = result
+        return result
+
+@add_metaclass(InterningMeta)
 class AbstractValue(object):
     """
     Base class, representing some subset of possible values out of the full
     set of values that this r-value could hold.
+
+    Instances of subclasses for which identity doesn't matter (see
+    identity_matters) are interned (see InterningMeta), and so must not be
+    modified after construction.
     """
-    __slots__ = ('gcctype', 'loc', 'fromsplit')
+    __slots__ = ('gcctype', 'loc', 'fromsplit', '__weakref__')
 
     def __init__(self, gcctype, loc):
         if gcctype:
@@ -220,6 +269,63 @@ class AbstractValue(object):
         # Overridden by ConcreteValue
         return False
 
+    # Does the identity of instances of this class matter?  For example, an
+    # UnknownValue compares equal to itself, but not to another UnknownValue
+    # with the same type and location:
+    identity_matters = True
+
+    def get_fingerprint(self):
+        """
+        Get a hashable value describing this AbstractValue structurally,
+        for use when comparing States (see State.get_fingerprint)
+        """
+        return (self.__class__, self.gcctype, self.loc,
+                hasattr(self, 'fromsplit'))
+
+    # Values for which identity doesn't matter compare structurally (though
+    # since these are interned, they are usually the same instance):
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if self.identity_matters or not isinstance(other, AbstractValue):
+            return False
+        if other.__class__ is not self.__class__:
+            return False
+        return self.get_fingerprint() == other.get_fingerprint()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        if self.identity_matters:
+            return id(self)
+        return hash(self.get_fingerprint())
+
+    def copy_from_split(self):
+        """
+        Get a version of this value, marked as being one of the alternatives
+        from a SplitValue
+        """
+        if self.identity_matters:
+            result = self
+        else:
+            # Don't modify the interned instance, which could be shared
+            # with values that didn't come from the split:
+            result = copy.copy(self)
+        result.fromsplit = True
+        return result
+
+    def widen(self, v_prev):
+        """
+        Given the value v_prev that was in the same place when we last
+        reached this loop head, get a value covering both it and this one,
+        and any further values that going around the loop again is likely
+        to produce (see State.widen)
+
+        By default, no widening is done.
+        """
+        return self
+
     def get_transitions_for_function_call(self, state, stmt):
         """
         For use for handling function pointers.  Return a list of Transition
@@ -430,10 +536,16 @@ class ConcreteValue(AbstractValue):
     def from_int(self, value):
         return ConcreteValue(gcc.Type.int(), None, value)
 
-    def __ne__(self, other):
+    # Unlike other values for which identity doesn't matter, ConcreteValues
+    # compare (and hash) by their value alone, ignoring their type and
+    # where they came from (AbstractValue.__ne__ is the negation of this):
+    def __eq__(self, other):
         if isinstance(other, ConcreteValue):
-            return self.value != other.value
-        return NotImplemented
+            return self.value == other.value
+        return False
+
+    def __hash__(self):
+        return hash(self.value)
 
     def __str__(self):
         if self.loc:
@@ -447,6 +559,14 @@ class ConcreteValue(AbstractValue):
         return ('ConcreteValue(gcctype=%r, loc=%r, value=%s)'
                 % (str(self.gcctype), self.loc, value_to_str(self.value)))
 
+    identity_matters = False
+
+    def get_fingerprint(self):
+        return AbstractValue.get_fingerprint(self) + (self.value, )
+
+    def widen(self, v_prev):
+        return widen_range(self, v_prev)
+
     def json_fields(self, state):
         return dict(value=self.value)
 
@@ -747,6 +867,13 @@ class WithinRange(AbstractValue):
                 % (str(self.gcctype), self.loc, value_to_str(self.minvalue),
                    value_to_str(self.maxvalue)))
 
+    def get_fingerprint(self):
+        return AbstractValue.get_fingerprint(self) + (self.minvalue,
+                                                      self.maxvalue)
+
+    def widen(self, v_prev):
+        return widen_range(self, v_prev)
+
     def json_fields(self, state):
         return dict(minvalue=self.minvalue,
                     maxvalue=self.maxvalue)
@@ -895,6 +1022,40 @@ class WithinRange(AbstractValue):
         raise NotImplementedError('%s.union(%s)'
                                   % (self.__class__.__name__, v_other))
 
+def get_range(value):
+    """
+    Get a (minvalue, maxvalue) pair for a ConcreteValue or WithinRange of an
+    integer type, or None for other values
+    """
+    if not isinstance(value.gcctype, gcc.IntegerType):
+        return None
+    if isinstance(value, ConcreteValue):
+        return (value.value, value.value)
+    if isinstance(value, WithinRange):
+        return (value.minvalue, value.maxvalue)
+    return None
+
+def widen_range(v_cur, v_prev):
+    """
+    Widen an integer value at a loop head: any bound that has moved since the
+    previous visit is pushed out to the limit of the type, so that iterating
+    again can't move it further.  Returns a WithinRange (or ConcreteValue)
+    """
+    r_cur = get_range(v_cur)
+    r_prev = get_range(v_prev)
+    if r_cur is None or r_prev is None:
+        return v_cur
+    gcctype = v_cur.gcctype
+    if r_cur[0] >= r_prev[0]:
+        minvalue = r_prev[0]
+    else:
+        minvalue = gcctype.min_value.constant
+    if r_cur[1] <= r_prev[1]:
+        maxvalue = r_prev[1]
+    else:
+        maxvalue = gcctype.max_value.constant
+    return WithinRange.make(gcctype, v_cur.loc, minvalue, maxvalue)
+
 class PointerToRegion(AbstractValue):
     """A non-NULL pointer value, pointing at a specific Region"""
     __slots__ = ('region', )
@@ -913,6 +1074,11 @@ class PointerToRegion(AbstractValue):
     def __repr__(self):
         return 'PointerToRegion(gcctype=%r, loc=%r, region=%r)' % (str(self.gcctype), self.loc, self.region)
 
+    identity_matters = False
+
+    def get_fingerprint(self):
+        return AbstractValue.get_fingerprint(self) + (self.region, )
+
     def json_fields(self, state):
         return dict(target=self.region.as_json())
 
@@ -944,6 +1110,8 @@ class DeallocatedMemory(AbstractValue):
     A 'poisoned' r-value: this memory has been deallocated, so the r-value
     is meaningless.
     """
+    identity_matters = False
+
     def __str__(self):
         if self.loc:
             return 'memory deallocated at %s' % self.loc
@@ -958,6 +1126,8 @@ class UninitializedData(AbstractValue):
     A 'poisoned' r-value: this memory has not yet been written to, so the
     r-value is meaningless.
     """
+    identity_matters = False
+
     def __str__(self):
         if self.loc:
             return 'uninitialized data at %s' % self.loc
@@ -1122,14 +1292,20 @@ def describe_stmt(stmt):
     else:
         return str(stmt.loc)
 
+# Regions are numbered in order of creation, giving an order for them that
+# doesn't depend on where they happen to be in memory (see
+# State.get_fingerprint):
+region_seqnos = itertools.count()
+
 class Region(object):
-    __slots__ = ('name', 'parent', 'children', 'fields', )
+    __slots__ = ('name', 'parent', 'children', 'fields', 'seqno', )
 
     def __init__(self, name, parent):
         self.name = name
         self.parent = parent
         self.children = []
         self.fields = {}
+        self.seqno = next(region_seqnos)
         if parent:
             parent.children.append(self)
 
@@ -1262,7 +1438,7 @@ class SplitValue(Exception):
         result = []
         for altvalue, desc in zip(self.altvalues, self.descriptions):
             log(' creating state for split where %s is %s', self.value, altvalue)
-            altvalue.fromsplit = True
+            altvalue = altvalue.copy_from_split()
 
             newstate = state.copy()
             newstate.fromsplit = True
@@ -1299,6 +1475,308 @@ class Facet(object):
         # Concrete subclasses should implement this.
         raise NotImplementedError
 
+    def get_fingerprint(self):
+        # Concrete subclasses should implement this, returning a hashable
+        # value summarizing the facet (see State.get_fingerprint)
+        raise NotImplementedError
+
+    # Cache of get_impl_table() results, mapping from Facet subclass to
+    # dict:
+    _impl_tables = {}
+
+    @classmethod
+    def get_impl_table(cls):
+        """
+        Get a dict mapping from the names of the functions that this class
+        implements to its "impl_" methods for them, e.g.
+          'PyList_New' -> CPython.impl_PyList_New
+        The methods are unbound (they take the Facet instance as their first
+        argument).
+
+        This is built once per class; it can also be used to list the API
+        entrypoints that the class models.
+        """
+        table = Facet._impl_tables.get(cls)
+        if table is None:
+            table = {}
+            for attrname in dir(cls):
+                if attrname.startswith('impl_'):
+                    table[attrname[len('impl_'):]] = getattr(cls, attrname)
+            Facet._impl_tables[cls] = table
+        return table
+
+# Cache of get_impl_dispatch() results:
+_impl_dispatch_tables = {}
+
+def get_impl_dispatch(facets):
+    """
+    Given a dict mapping from facet names to Facet subclasses (as used by
+    State), get a dict mapping from function names to
+    (facet name, unbound "impl_" method) pairs, for all of the functions
+    that the facets implement.  If more than one facet implements a
+    function, the first one in the dict is used.
+    """
+    key = tuple(facets.items())
+    dispatch = _impl_dispatch_tables.get(key)
+    if dispatch is None:
+        dispatch = {}
+        for facetname, facetcls in key:
+            for fnname, meth in facetcls.get_impl_table().items():
+                dispatch.setdefault(fnname, (facetname, meth))
+        _impl_dispatch_tables[key] = dispatch
+    return dispatch
+
+class CopyOnWriteDict(object):
+    """
+    An insertion-ordered mapping (like OrderedDict) that can be copied in
+    O(1), for use as the stores within a State.
+
+    Each instance only holds the entries that have changed since it was
+    copied ("_local"), chained to a shared, frozen parent layer holding
+    everything else.  copy() freezes the current entries into a new parent
+    shared by both the old and new instances, so that neither can see
+    subsequent changes made to the other.
+
+    Frozen layers are never modified, and reading the entries walks the
+    chain of layers, rather than flattening it.  To keep the chain short,
+    a newly-frozen layer absorbs its parent (in a new layer, leaving the
+    parent as it is for the other instances sharing it) for as long as the
+    parent is no more than twice its size, so that the layer sizes grow
+    geometrically down the chain, and there are only O(log n) of them.
+    Hence a copy only ever costs time proportional to the changes made
+    since the last one (amortized), never to the size of the whole store.
+
+    The number of entries, and an order-independent hash of them (see
+    StoreSnapshot), are updated as entries are set and deleted, rather than
+    being recomputed from the entries.
+    """
+    __slots__ = ('_parent', '_local', '_len', '_hash')
+
+    # Marker within _local for a key that has been deleted:
+    _DELETED = object()
+
+    def __init__(self, items=None):
+        self._parent = None
+        self._local = OrderedDict()
+        self._len = 0
+        self._hash = 0
+        if items:
+            for k, v in items:
+                self[k] = v
+
+    def _freeze(self):
+        # Move our local entries into a new frozen parent layer:
+        frozen = CopyOnWriteDict()
+        frozen._local = self._local
+        frozen._len = self._len
+        frozen._hash = self._hash
+        parent = self._parent
+        while parent is not None and len(parent._local) <= 2 * len(frozen._local):
+            merged = self._merge_layers(parent, frozen._local)
+            if merged is None:
+                break
+            frozen._local = merged
+            parent = parent._parent
+        if parent is None:
+            # Nothing to hide beneath a root layer, so drop its deletion
+            # markers (see _merge_layers):
+            for k in [k for k, v in frozen._local.items()
+                      if v is self._DELETED]:
+                del frozen._local[k]
+        frozen._parent = parent
+        self._parent = frozen
+        self._local = OrderedDict()
+        return frozen
+
+    def _merge_layers(self, parent, local):
+        # Get a new OrderedDict for a layer equivalent to the given parent
+        # layer followed by the given entries, or None if that can't be
+        # represented as a single layer
+        at_root = parent._parent is None
+        if not at_root:
+            # A key deleted within the parent and then set again must move
+            # to the end of the iteration order, which a single layer can't
+            # express (see __setitem__):
+            for k, v in local.items():
+                if (v is not self._DELETED
+                    and parent._local.get(k) is self._DELETED):
+                    return None
+        result = OrderedDict(parent._local)
+        for k, v in local.items():
+            if v is self._DELETED and at_root:
+                # (a frozen layer without a parent never contains deletion
+                # markers):
+                result.pop(k, None)
+            else:
+                result[k] = v
+        return result
+
+    def copy(self):
+        result = CopyOnWriteDict()
+        if self._local:
+            self._freeze()
+        result._parent = self._parent
+        result._len = self._len
+        result._hash = self._hash
+        return result
+
+    def _lookup(self, key):
+        layer = self
+        while layer is not None:
+            if key in layer._local:
+                return layer._local[key]
+            layer = layer._parent
+        return self._DELETED
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is self._DELETED:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        if value is self._DELETED:
+            return default
+        return value
+
+    def __contains__(self, key):
+        return self._lookup(key) is not self._DELETED
+
+    def __setitem__(self, key, value):
+        old = self._lookup(key)
+        if old is self._DELETED:
+            if self._local.get(key) is self._DELETED:
+                # Re-adding a key deleted within this layer: start a new
+                # layer, so that the key moves to the end of the iteration
+                # order:
+                self._freeze()
+            self._len += 1
+        else:
+            self._hash -= hash((key, old))
+        self._hash += hash((key, value))
+        self._local[key] = value
+
+    def __delitem__(self, key):
+        old = self._lookup(key)
+        if old is self._DELETED:
+            raise KeyError(key)
+        self._len -= 1
+        self._hash -= hash((key, old))
+        self._local[key] = self._DELETED
+
+    def iter_changes(self):
+        """
+        Yield the (key, value) pairs that have been set since this store was
+        last copied
+        """
+        for k, v in self._local.items():
+            if v is not self._DELETED:
+                yield (k, v)
+
+    def _iter_items(self):
+        # Yield the (key, value) pairs, in order, by walking the layers from
+        # the oldest to the newest, yielding each key at the layer where
+        # its current value was inserted (rather than where it was last
+        # overwritten), without gathering all of the entries together:
+        layers = []
+        layer = self
+        while layer is not None:
+            layers.append(layer)
+            layer = layer._parent
+        layers.reverse()
+        for i, layer in enumerate(layers):
+            for k, v in layer._local.items():
+                if v is self._DELETED:
+                    continue
+                # Skip it if it's deleted within a later layer (and perhaps
+                # re-added, at the end); otherwise get its latest value:
+                deleted = False
+                for later in layers[i + 1:]:
+                    if k in later._local:
+                        v = later._local[k]
+                        if v is self._DELETED:
+                            deleted = True
+                if deleted:
+                    continue
+                # Skip it if it's overwriting an earlier entry:
+                for earlier in reversed(layers[:i]):
+                    if k in earlier._local:
+                        break
+                else:
+                    earlier = None
+                if earlier is not None:
+                    if earlier._local[k] is not self._DELETED:
+                        continue
+                yield (k, v)
+
+    def items(self):
+        return list(self._iter_items())
+
+    def keys(self):
+        return [k for k, v in self._iter_items()]
+
+    def values(self):
+        return [v for k, v in self._iter_items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return repr(OrderedDict(self._iter_items()))
+
+class StoreSnapshot(object):
+    """
+    A hashable snapshot of the entries of a CopyOnWriteDict, for use within
+    State.get_fingerprint(exact=True).  Snapshots are equal if they have the
+    same keys, with the same values (in the sense of the exact fingerprints
+    of the values: see AbstractValue.get_fingerprint), regardless of the
+    order of the entries.
+
+    Taking a snapshot is O(1), as is hashing it (using the store's
+    incrementally-maintained hash); the entries are only compared when the
+    hashes are equal.
+    """
+    __slots__ = ('store', )
+
+    def __init__(self, store):
+        check_isinstance(store, CopyOnWriteDict)
+        # (a copy, so that later changes to the store don't affect it):
+        self.store = store.copy()
+
+    def __hash__(self):
+        return hash(self.store._hash)
+
+    def __eq__(self, other):
+        if not isinstance(other, StoreSnapshot):
+            return False
+        if self.store._hash != other.store._hash:
+            return False
+        if len(self.store) != len(other.store):
+            return False
+        for k, v in self.store._iter_items():
+            v_other = other.store.get(k, CopyOnWriteDict._DELETED)
+            if v_other is v:
+                continue
+            if v_other is CopyOnWriteDict._DELETED:
+                return False
+            if isinstance(v, AbstractValue):
+                if not isinstance(v_other, AbstractValue):
+                    return False
+                if v.identity_matters or v_other.identity_matters:
+                    return False
+                if v.get_fingerprint() != v_other.get_fingerprint():
+                    return False
+            elif v != v_other:
+                return False
+        return True
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
 class State(object):
     """
     A Location with memory state, and zero or more additional "facets" of
@@ -1340,18 +1818,18 @@ class State(object):
         self.facets = facets
 
         # Mapping from VarDecl.name to Region:
-        if region_for_var:
-            check_isinstance(region_for_var, OrderedDict)
+        if region_for_var is not None:
+            check_isinstance(region_for_var, CopyOnWriteDict)
             self.region_for_var = region_for_var
         else:
-            self.region_for_var = OrderedDict()
+            self.region_for_var = CopyOnWriteDict()
 
         # Mapping from Region to AbstractValue:
-        if value_for_region:
-            check_isinstance(value_for_region, OrderedDict)
+        if value_for_region is not None:
+            check_isinstance(value_for_region, CopyOnWriteDict)
             self.value_for_region = value_for_region
         else:
-            self.value_for_region = OrderedDict()
+            self.value_for_region = CopyOnWriteDict()
 
         self.return_rvalue = return_rvalue
         self.has_returned = has_returned
@@ -1394,7 +1872,7 @@ class State(object):
         return result
 
     def log(self, logger):
-        if not logging_enabled:
+        if not logger.enabled:
             return
         # Display data in tabular form:
         logger('%s', self.as_str_table())
@@ -1426,15 +1904,96 @@ class State(object):
             setattr(s_new, key, f_new)
         return s_new
 
+    def widen(self, s_prev):
+        """
+        Given the State s_prev that we had when we last reached this loop
+        head, get a copy of this State in which each value that has changed
+        since then is widened (see AbstractValue.widen), so that going around
+        the loop repeatedly converges
+        """
+        check_isinstance(s_prev, State)
+        s_new = self.copy()
+        # Widen each distinct value once, so that regions that shared a
+        # value still do so afterwards:
+        widened = {}
+        for region, value in self.value_for_region.items():
+            v_prev = s_prev.value_for_region.get(region, None)
+            if v_prev is None or v_prev is value:
+                continue
+            if id(value) not in widened:
+                widened[id(value)] = value.widen(v_prev)
+            s_new.value_for_region[region] = widened[id(value)]
+        return s_new
+
+    def get_fingerprint(self, exact=False):
+        """
+        Get a hashable value summarizing this State, ignoring its location
+        within the function.  Two States at the same StmtNode with equal
+        fingerprints will have the same futures, and so only one of them
+        needs to be explored.
+
+        The identity of some AbstractValue instances matters (e.g. an
+        UnknownValue is only known to be equal to itself), so these are
+        numbered in order of first appearance, so that the aliasing between
+        them is captured without depending on the instances themselves.
+
+        If exact is true, such instances are instead included as themselves,
+        so that States only have equal fingerprints if they share them (as
+        needed if one State's future is to be reused for another's: see
+        explore_traces).  This doesn't depend on the order of the entries
+        within the stores, so they are included as StoreSnapshot instances,
+        which makes this O(1) (see CopyOnWriteDict), rather than proportional
+        to the size of the stores
+        """
+        aliases = {}
+        def value_key(v):
+            if v is None:
+                return None
+            key = v.get_fingerprint()
+            if v.identity_matters:
+                if exact:
+                    key += (v, )
+                else:
+                    key += (aliases.setdefault(id(v), len(aliases)), )
+            return key
+
+        facets = []
+        for key in sorted(self.facets):
+            facets.append(getattr(self, key).get_fingerprint())
+        if exact:
+            return (StoreSnapshot(self.region_for_var),
+                    StoreSnapshot(self.value_for_region),
+                    value_key(self.return_rvalue),
+                    self.has_returned,
+                    self.not_returning,
+                    tuple(facets))
+
+        # (ordered by the creation of the regions, so that the numbering of
+        # the aliases is reproducible):
+        values = []
+        for r, v in sorted(self.value_for_region.items(),
+                           key=lambda item: item[0].seqno):
+            values.append((r, value_key(v)))
+        return (frozenset(self.region_for_var.items()),
+                tuple(values),
+                value_key(self.return_rvalue),
+                self.has_returned,
+                self.not_returning,
+                tuple(facets))
+
     def verify(self):
         """
         Perform self-tests to ensure sanity of this State
+
+        Only the values that have changed since this State was copied from
+        its predecessor are checked, since the rest have already been
+        verified.
         """
-        for k in self.value_for_region:
+        for k, v in self.value_for_region.iter_changes():
             check_isinstance(k, Region)
-            if not isinstance(self.value_for_region[k], AbstractValue):
+            if not isinstance(v, AbstractValue):
                 raise TypeError('value for region %r is not an AbstractValue: %r'
-                                % (k, self.value_for_region[k]))
+                                % (k, v))
 
     def eval_lvalue(self, expr, loc):
         """
@@ -1960,7 +2519,7 @@ class State(object):
         # don't allow this.  Use the end of the function for this case.
         stmt = self.stmtnode.get_stmt()
         if stmt:
-            log('%s' % self.stmtnode.get_stmt().loc)
+            log('%s', stmt.loc)
             # grrr... not all statements have a non-NULL location
             gccloc = self.stmtnode.get_stmt().loc
             if gccloc is None:
@@ -2058,7 +2617,7 @@ class State(object):
 
     def _get_transitions_for_stmt(self, stmt):
         log('_get_transitions_for_stmt: %r %s', stmt, stmt)
-        log('dir(stmt): %s', dir(stmt))
+        log('dir(stmt): %s', Lazy(dir, stmt))
         if stmt.loc:
             gcc.set_location(stmt.loc)
         if isinstance(stmt, gcc.GimpleCall):
@@ -2176,7 +2735,6 @@ class State(object):
     def _get_transitions_for_GimpleCall(self, stmt):
         log('stmt.lhs: %s %r', stmt.lhs, stmt.lhs)
         log('stmt.fn: %s %r', stmt.fn, stmt.fn)
-        log('dir(stmt.fn): %s', dir(stmt.fn))
         if hasattr(stmt.fn, 'operand'):
             log('stmt.fn.operand: %s', stmt.fn.operand)
         returntype = stmt.fn.type.dereference.type
@@ -2210,7 +2768,6 @@ class State(object):
                     raise PassingPointerToDeallocatedMemory(i, 'function', stmt, rvalue)
 
         if isinstance(stmt.fn.operand, gcc.FunctionDecl):
-            log('dir(stmt.fn.operand): %s', dir(stmt.fn.operand))
             log('stmt.fn.operand.name: %r', stmt.fn.operand.name)
             fnname = stmt.fn.operand.name
 
@@ -2222,14 +2779,13 @@ class State(object):
             # for the evaluated arguments (which for some functions will
             # involve varargs, like above).
             # They should return a list of Transition instances.
-            methname = 'impl_%s' % fnname
-            for key in self.facets:
-                facet = getattr(self, key)
-                if hasattr(facet, methname):
-                    meth = getattr(facet, 'impl_%s' % fnname)
+            # (see get_impl_dispatch)
+            entry = get_impl_dispatch(self.facets).get(fnname)
+            if entry:
+                key, meth = entry
 
-                    # Call the facet's method:
-                    return meth(stmt, *args)
+                # Call the facet's method:
+                return meth(getattr(self, key), stmt, *args)
 
             #from libcpychecker.c_stdio import c_stdio_functions, handle_c_stdio_function
 
@@ -2246,7 +2802,7 @@ class State(object):
             # Unknown function returning (PyObject*):
             from libcpychecker.refcounts import type_is_pyobjptr_subclass
             if type_is_pyobjptr_subclass(stmt.fn.operand.type.type):
-                log('Invocation of unknown function returning PyObject * (or subclass): %r' % fnname)
+                log('Invocation of unknown function returning PyObject * (or subclass): %r', fnname)
 
                 fnmeta = FnMeta(name=fnname)
 
@@ -2261,6 +2817,18 @@ class State(object):
                         self.cpython.make_transitions_for_borrowed_ref_or_fail(stmt,
                                                                                fnmeta),
                         stmt)
+
+                # If we've already analyzed the function, use the summary of
+                # its behavior:
+                from libcpychecker.summaries import get_summary
+                summary = get_summary(fnname)
+                if summary:
+                    return self.apply_fncall_side_effects(
+                        self.cpython.make_transitions_for_summary(stmt,
+                                                                  fnmeta,
+                                                                  summary),
+                        stmt)
+
                 return self.apply_fncall_side_effects(
                     self.cpython.make_transitions_for_new_ref_or_fail(stmt,
                                                                       fnmeta,
@@ -2322,13 +2890,21 @@ class State(object):
 
         fnname = self.get_function_name(stmt)
 
+        # cpython: use the summary of the function, if we've already
+        # analyzed it:
+        from libcpychecker.summaries import get_summary
+        summary = get_summary(fnname)
+
         # cpython: handle functions marked as stealing references to their
-        # arguments:
+        # arguments (or that we've found to do so):
         from libcpychecker.attributes import stolen_refs_by_fnname
-        if fnname in stolen_refs_by_fnname:
+        stolen_args = set(stolen_refs_by_fnname.get(fnname, ()))
+        if summary:
+            stolen_args |= summary.stolen_args
+        if stolen_args:
             for t_iter in transitions:
                 check_isinstance(t_iter, Transition)
-                for argindex in stolen_refs_by_fnname[stmt.fn.operand.name]:
+                for argindex in sorted(stolen_args):
                     v_arg = args[argindex-1]
                     if isinstance(v_arg, PointerToRegion):
                         t_iter.dest.cpython.steal_reference(v_arg, stmt.loc)
@@ -2343,10 +2919,12 @@ class State(object):
                 t_iter.dest.cpython.set_exception('PyExc_MemoryError',
                                                   stmt.loc)
 
-        # cpython: handle functions that have been marked as setting the
-        # exception state when they return a negative value:
+        # cpython: handle functions that have been marked (or that we've
+        # found) as setting the exception state when they return a negative
+        # value:
         from libcpychecker.attributes import fnnames_setting_exception_on_negative_result
-        if fnname in fnnames_setting_exception_on_negative_result:
+        if (fnname in fnnames_setting_exception_on_negative_result
+            or (summary and summary.sets_exception_on_negative)):
 
             def handle_negative_return(t_iter):
                 check_isinstance(t_iter, Transition)
@@ -2697,7 +3275,8 @@ class Transition(object):
         self.dest.log(logger)
 
 class Trace(object):
-    __slots__ = ('states', 'transitions', 'err', 'paths_taken')
+    __slots__ = ('states', 'transitions', 'err', 'paths_taken',
+                 'edges_taken', 'repeated_edge', 'num_paths', 'endnode')
 
     """A sequence of States and Transitions"""
     def __init__(self):
@@ -2705,16 +3284,35 @@ class Trace(object):
         self.transitions = []
         self.err = None
 
+        # The number of paths through the function that this trace stands
+        # for: more than one if it was rebuilt by explore_traces() for the
+        # end of paths that passed through equivalent States (in which case
+        # endnode is the ExplodedNode that they end at; see iter_all_traces)
+        self.num_paths = 1
+        self.endnode = None
+
         # A list of (src gcc.StmtNode, dest gcc.StmtNode) pairs
         self.paths_taken = []
 
+        # The same pairs, as a set, so that has_looped is O(1):
+        self.edges_taken = set()
+
+        # Did the last transition follow an edge that's in paths_taken
+        # earlier?
+        self.repeated_edge = False
+
     def add(self, transition):
         check_isinstance(transition, Transition)
         self.states.append(transition.dest)
         self.transitions.append(transition)
         if transition.src.stmtnode.bb != transition.dest.stmtnode.bb:
-            self.paths_taken.append( (transition.src.stmtnode.bb,
-                                      transition.dest.stmtnode.bb) )
+            edge = (transition.src.stmtnode.bb,
+                    transition.dest.stmtnode.bb)
+            self.repeated_edge = edge in self.edges_taken
+            self.paths_taken.append(edge)
+            self.edges_taken.add(edge)
+        else:
+            self.repeated_edge = False
         return self
 
     def add_error(self, err):
@@ -2726,6 +3324,10 @@ class Trace(object):
         t.transitions = self.transitions[:]
         t.err = self.err # FIXME: should this be a copy?
         t.paths_taken = self.paths_taken[:]
+        t.edges_taken = set(self.edges_taken)
+        t.repeated_edge = self.repeated_edge
+        t.num_paths = self.num_paths
+        t.endnode = self.endnode
         return t
 
     def log(self, logger, name):
@@ -2757,20 +3359,8 @@ class Trace(object):
             # repeated location:
             return False
 
-        endtransition = self.transitions[-1]
-        if 0:
-            gcc.inform(endstate.get_gcc_loc(endstate.fun),
-                       ('paths_taken: %s'
-                        % (self.paths_taken,)))
-            gcc.inform(endstate.get_gcc_loc(endstate.fun),
-                       'src, loc: %s' % ((endtransition.src.loc, endtransition.dest.loc),))
-
         # Is this a path we've followed before?
-        src_bb = endtransition.src.stmtnode.bb
-        dest_bb = endtransition.dest.stmtnode.bb
-        if src_bb != dest_bb:
-            if (src_bb, dest_bb) in self.paths_taken[0:-1]:
-                return True
+        return self.repeated_edge
 
     def get_all_var_region_pairs(self):
         """
@@ -2934,6 +3524,129 @@ class Limits:
         if self.trans_seen > self.maxtrans:
             raise TooComplicated(result)
 
+class Budget(Limits):
+    """
+    Resource limits on the analysis of one function by explore_traces(): a
+    number of transitions, and optionally an amount of CPU time (in seconds)
+    and growth of the process's resident memory (in megabytes).
+
+    The memory usage is the current resident set size, as given by
+    /proc/self/statm.  Where that's not available, the process's high-water
+    mark is used instead, which only grows, and so is really a cap on the
+    peak memory usage of the whole process: after analyzing one expensive
+    function, it won't register any growth from later ones until they use
+    more than that one did.
+
+    If "degrade" is false, then exceeding any of these stops the analysis
+    (by raising TooComplicated), as with Limits.  Otherwise, exceeding them
+    moves explore_traces() onto the next of a series of cheaper strategies,
+    each of which gets a fresh allowance of the same size:
+
+      EXHAUSTIVE: explore every path (merging equivalent States at join
+      points, if that's enabled)
+
+      MERGE: merge equivalent States at every statement, not just at join
+      points
+
+      SAMPLE: follow only one (pseudorandomly-chosen) transition out of each
+      State, breadth-first
+
+      STOP: give up, raising TooComplicated
+    """
+    EXHAUSTIVE, MERGE, SAMPLE, STOP = range(4)
+    strategy_names = ('exhaustive', 'merging', 'sampling', 'stopped')
+
+    # How many transitions between checks of the CPU time and memory
+    # usage (which need a system call):
+    CHECK_INTERVAL = 64
+
+    def __init__(self, maxtrans, max_cpu_secs=None, max_memory_mb=None,
+                 degrade=False):
+        Limits.__init__(self, maxtrans)
+        self.max_cpu_secs = max_cpu_secs
+        self.max_memory_mb = max_memory_mb
+        self.degrade = degrade
+        self.strategy = Budget.EXHAUSTIVE
+
+        self.start_cpu_secs, self.start_rss = self._get_usage()
+        self.cpu_secs = 0.0
+        self.memory_mb = 0.0
+
+        # The values of trans_seen, cpu_secs and memory_mb at which the
+        # current strategy began:
+        self.stage_trans = 0
+        self.stage_cpu_secs = 0.0
+        self.stage_memory_mb = 0.0
+
+    def _get_usage(self):
+        # Get (CPU seconds, memory usage in KB) for the process
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        rss = self._get_current_rss()
+        if rss is None:
+            rss = usage.ru_maxrss
+        return usage.ru_utime + usage.ru_stime, rss
+
+    def _get_current_rss(self):
+        # Get the current resident set size in KB, or None if we can't
+        # (the second field of /proc/self/statm is the RSS in pages):
+        try:
+            with open('/proc/self/statm') as f:
+                pages = int(f.read().split()[1])
+            return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+        except (IOError, OSError, ValueError, IndexError):
+            return None
+
+    def update_usage(self):
+        cpu_secs, rss = self._get_usage()
+        self.cpu_secs = cpu_secs - self.start_cpu_secs
+        self.memory_mb = (rss - self.start_rss) / 1024.0
+
+    def get_exceeded(self):
+        """
+        Get a description of the limit that the current strategy has
+        exceeded, or None
+        """
+        if self.trans_seen - self.stage_trans > self.maxtrans:
+            return 'more than %i transitions' % self.maxtrans
+        if self.trans_seen % Budget.CHECK_INTERVAL == 0:
+            self.update_usage()
+            if self.max_cpu_secs is not None:
+                if self.cpu_secs - self.stage_cpu_secs > self.max_cpu_secs:
+                    return 'more than %gs CPU' % self.max_cpu_secs
+            if self.max_memory_mb is not None:
+                if self.memory_mb - self.stage_memory_mb > self.max_memory_mb:
+                    return 'more than %gMB memory' % self.max_memory_mb
+
+    def on_transition(self, transition, result):
+        self.trans_seen += 1
+        exceeded = self.get_exceeded()
+        if exceeded:
+            if not self.degrade or self.strategy == Budget.SAMPLE:
+                self.strategy = Budget.STOP
+                raise TooComplicated(result)
+            if exceeded.endswith('memory'):
+                # Merging won't reduce memory usage; go straight to sampling:
+                self.strategy = Budget.SAMPLE
+            else:
+                self.strategy += 1
+            log('exceeded budget (%s); switching to %s',
+                exceeded, self.get_strategy_name())
+            self.stage_trans = self.trans_seen
+            self.stage_cpu_secs = self.cpu_secs
+            self.stage_memory_mb = self.memory_mb
+
+    def get_strategy_name(self):
+        return Budget.strategy_names[self.strategy]
+
+    def describe(self):
+        """
+        Get a string describing the resources consumed so far
+        """
+        self.update_usage()
+        return ('%i transitions, %.2fs CPU, %.1fMB memory growth (%s)'
+                % (self.trans_seen, self.cpu_secs, self.memory_mb,
+                   self.get_strategy_name()))
+
 def iter_traces(stmtgraph, facets, prefix=None, limits=None, depth=0):
     """
     Traverse the tree of traces of program state, returning a list
@@ -2991,7 +3704,10 @@ def iter_traces(stmtgraph, facets, prefix=None, limits=None, depth=0):
     else:
         prevstate = None
 
-    prefix.log(log, 'PREFIX')
+    # (dumping the prefix at every step is quadratic, so only do it at
+    # level 2 and above)
+    if log.level >= 2:
+        prefix.log(log, 'PREFIX')
     log('  %s:%s', fun.decl.name, curstate.stmtnode)
     try:
         transitions = curstate.get_transitions()
@@ -3002,7 +3718,8 @@ def iter_traces(stmtgraph, facets, prefix=None, limits=None, depth=0):
         err.loc = prefix.get_last_stmt().loc
         trace_with_err = prefix.copy()
         trace_with_err.add_error(err)
-        trace_with_err.log(log, 'FINISHED TRACE WITH ERROR: %s' % err)
+        if log.enabled:
+            trace_with_err.log(log, 'FINISHED TRACE WITH ERROR: %s' % err)
         return [trace_with_err]
     except SplitValue:
         # Split the state up, splitting into parallel worlds with different
@@ -3040,9 +3757,447 @@ def iter_traces(stmtgraph, facets, prefix=None, limits=None, depth=0):
         return result
     else:
         # We're at a terminating state:
-        prefix.log(log, 'FINISHED TRACE')
+        if log.enabled:
+            prefix.log(log, 'FINISHED TRACE')
         return [prefix]
 
+class ExplodedNode(object):
+    """
+    A State reached during explore_traces(), together with the Transition
+    that first led to it, and the ExplodedNode it came from.
+
+    Rather than copying the whole Trace prefix at every transition, we only
+    record the predecessor link, and rebuild Trace instances lazily (via
+    to_trace) for the ends of the paths that we actually need to report on.
+
+    Paths that reach equivalent States share the ExplodedNode for the first
+    of them, so the nodes form a graph rather than a tree: "children" lists
+    the (Transition, ExplodedNode) pairs leading out of this node, including
+    any that lead to a node that was first reached along another path.
+    """
+    __slots__ = ('state', 'transition', 'pred', 'children', 'bb_edge',
+                 'edges_taken', 'repeated_edge', 'widenings')
+
+    def __init__(self, state, transition, pred):
+        check_isinstance(state, State)
+        self.state = state
+        self.transition = transition # None for the initial node
+        self.pred = pred # None for the initial node
+        self.children = []
+        if pred:
+            pred.children.append((transition, self))
+
+        # The (src gcc.BasicBlock, dest gcc.BasicBlock) pair followed by the
+        # transition, if it crosses between basic blocks:
+        self.bb_edge = None
+        if transition:
+            if transition.src.stmtnode.bb != transition.dest.stmtnode.bb:
+                self.bb_edge = (transition.src.stmtnode.bb,
+                                transition.dest.stmtnode.bb)
+
+        # The frozenset of all bb_edge values along the path to here.  This
+        # is shared with the predecessor unless this node adds to it, which
+        # only happens for the first traversal of each edge:
+        if pred:
+            self.edges_taken = pred.edges_taken
+            self.widenings = pred.widenings
+        else:
+            self.edges_taken = frozenset()
+            # A dict mapping from bb_edge to (count, State) pairs, for the
+            # loops we've widened at along this path (see widen_at_loop);
+            # copied on write:
+            self.widenings = {}
+        self.repeated_edge = False
+        if self.bb_edge:
+            if self.bb_edge in self.edges_taken:
+                self.repeated_edge = True
+            else:
+                self.edges_taken = self.edges_taken | frozenset([self.bb_edge])
+
+    def has_looped(self):
+        """
+        Is the transition into this node a path we've followed before?
+        (c.f. Trace.has_looped)
+        """
+        if hasattr(self.state, 'fromsplit'):
+            return False
+        if self.state.not_returning:
+            return False
+        return self.repeated_edge
+
+    def get_previous_visit(self):
+        """
+        Get the State we had when we last followed this node's bb_edge
+        along the path to this node
+        """
+        if self.bb_edge in self.widenings:
+            return self.widenings[self.bb_edge][1]
+        node = self.pred
+        while node:
+            if node.bb_edge == self.bb_edge:
+                return node.state
+            node = node.pred
+
+    def widen_at_loop(self):
+        """
+        Called on a node that has looped: get an ExplodedNode at which to
+        continue going around the loop, with a widened State, or None if
+        there's no point in doing so (the loop has converged, or we've
+        already widened here too many times)
+
+        Returning None abandons this path without reporting anything about
+        it: anything wrong with the State (such as a reference leaked on
+        each iteration) has already been reported on the paths that left
+        the loop after the earlier iterations
+        """
+        count = 0
+        if self.bb_edge in self.widenings:
+            count = self.widenings[self.bb_edge][0]
+        if count >= MAX_WIDENINGS:
+            log('giving up on loop after %i widenings', count)
+            return None
+        s_prev = self.get_previous_visit()
+        s_widened = self.state.widen(s_prev)
+        if s_widened.get_fingerprint() == s_prev.get_fingerprint():
+            log('loop has converged')
+            return None
+        log('widening state at loop')
+        transition = Transition(self.state, s_widened,
+                                'treating as an arbitrary iteration of the loop')
+        node = ExplodedNode(s_widened, transition, self)
+        node.widenings = dict(self.widenings)
+        node.widenings[self.bb_edge] = (count + 1, s_widened)
+        return node
+
+    def to_trace(self, err=None):
+        """
+        Rebuild the Trace leading to this node (along the first path that
+        reached it)
+        """
+        transitions = []
+        node = self
+        while node.transition:
+            transitions.append(node.transition)
+            node = node.pred
+        trace = Trace()
+        for transition in reversed(transitions):
+            trace.add(transition)
+        if err:
+            trace.add_error(err)
+        trace.endnode = self
+        return trace
+
+def count_paths(root):
+    """
+    Get a dict mapping from each ExplodedNode reachable from the given one
+    to the number of paths from that one to it, without enumerating them
+    """
+    # Get the nodes in reverse postorder (a topological order, since paths
+    # never lead back to an earlier node):
+    order = []
+    visited = set([root])
+    stack = [(root, iter(root.children))]
+    while stack:
+        node, children = stack[-1]
+        for transition, child in children:
+            if child not in visited:
+                visited.add(child)
+                stack.append((child, iter(child.children)))
+                break
+        else:
+            order.append(node)
+            stack.pop()
+    result = {root: 1}
+    for node in reversed(order):
+        num_paths = result[node]
+        for transition, child in node.children:
+            result[child] = result.get(child, 0) + num_paths
+    return result
+
+def iter_all_traces(traces):
+    """
+    Given a list of Trace instances from explore_traces(), each of which
+    stands for all of the paths that end at the same ExplodedNode (see
+    Trace.num_paths), yield a Trace for every one of those paths, in the
+    order in which they would be found by walking every path depth-first.
+
+    There can be exponentially many of these, so this should only be used
+    when each path really is needed (e.g. for dumping them in selftests)
+    """
+    if all(trace.num_paths == 1 for trace in traces):
+        # No paths were merged, so these are all of them (in the order
+        # that iter_traces would give them, even if the exploration was cut
+        # short):
+        for trace in traces:
+            yield trace
+        return
+
+    err_for_node = dict((trace.endnode, trace.err) for trace in traces)
+    root = traces[0].endnode
+    while root.pred:
+        root = root.pred
+
+    def make_trace(node):
+        trace = Trace()
+        for transition in path:
+            trace.add(transition)
+        if err_for_node[node]:
+            trace.add_error(err_for_node[node])
+        return trace
+
+    # The transitions along the current path, and an iterator over the
+    # remaining children of each node along it:
+    path = []
+    if root in err_for_node:
+        yield make_trace(root)
+    stack = [iter(root.children)]
+    while stack:
+        for transition, node in stack[-1]:
+            path.append(transition)
+            if node in err_for_node:
+                yield make_trace(node)
+            stack.append(iter(node.children))
+            break
+        else:
+            stack.pop()
+            if path:
+                path.pop()
+
+# The maximum number of times that explore_traces will widen the state at a
+# loop along one path:
+MAX_WIDENINGS = 3
+
+def explore_traces(stmtgraph, facets, limits=None, merge_states=True,
+                   widen_loops=False):
+    """
+    Traverse the possible program states within a function, returning a list
+    of Trace instances, like iter_traces.
+
+    This uses an explicit worklist rather than recursion.  The worklist is
+    processed in LIFO order, so that the traces are found in the same
+    depth-first order as iter_traces would give.
+
+    If merge_states is true, then at join points within the StmtGraph, a
+    State that's equivalent to one that we've already reached at that node
+    (with the same exact fingerprint, and having taken the same path around
+    any loops) is subsumed by it: its path joins that of the first one, so
+    that the statements that follow are only interpreted (and charged
+    against the limits) once, however many paths lead there.  Hence there's
+    one Trace for each distinct end of a path (rebuilt from the first path
+    to reach it), with Trace.num_paths giving the number of paths that it
+    stands for; use iter_all_traces to get every path.  If merge_states is
+    false, every path is interpreted separately, and has a Trace of its own.
+
+    By default, like iter_traces, a path that goes around a loop a second
+    time is abandoned.  If widen_loops is true, then instead the State is
+    widened (see State.widen) and the path continues, until the widened
+    State stops changing (or MAX_WIDENINGS is reached, when the path is
+    abandoned in the same way), so that the loop body and the code after the
+    loop are analyzed for an arbitrary iteration, rather than just the
+    first.
+
+    If limits is a Budget, then the strategy may change part-way through,
+    when the budget is exceeded: to merging States that are equivalent to
+    ones already reached at any statement (not just at join points), and
+    then to sampling paths breadth-first (see Budget).
+    """
+    fun = stmtgraph.fun
+    log('explore_traces(%r, %r)', fun, facets)
+    initial = State(stmtgraph,
+                    stmtgraph.get_entry_nodes()[0],
+                    None,
+                    facets,
+                    None, None, None)
+    initial.init_for_function(fun)
+    for key in facets:
+        facet_cls = facets[key]
+        f_new = facet_cls(initial, fun=fun)
+        setattr(initial, key, f_new)
+        f_new.init_for_function(fun)
+
+    # The (src gcc.BasicBlock, dest gcc.BasicBlock) pairs that lie on a
+    # cycle within the function, and hence could be followed again later
+    # on a path (see ExplodedNode.has_looped); found when first needed:
+    loop_edges = set()
+
+    def get_merge_key(node):
+        state = node.state
+        key = (state.stmtnode,
+               state.get_fingerprint(exact=True),
+               state.lastgccloc,
+               hasattr(state, 'fromsplit'))
+        # The future of a path depends on which of the edges that it could
+        # follow again it has already followed (and, if we're widening at
+        # loops, the States it had when it did):
+        edges = frozenset(edge for edge in node.edges_taken
+                          if edge in loop_edges)
+        if not widen_loops:
+            return key + (edges, )
+        visits = {}
+        iter_node = node
+        while iter_node and len(visits) < len(edges):
+            if iter_node.bb_edge in edges:
+                visits.setdefault(iter_node.bb_edge, iter_node.state)
+            iter_node = iter_node.pred
+        return key + (frozenset(visits.items()),
+                      frozenset((edge, count, s_prev)
+                                for edge, (count, s_prev)
+                                in node.widenings.items()))
+
+    # A dict mapping from merge key to the first ExplodedNode reached with
+    # it:
+    canonical = {}
+
+    def merge_node(node, strategy):
+        # If the new ExplodedNode's State is equivalent to one that we've
+        # already reached, make the transition into it lead to the existing
+        # node for that one instead, returning True (as there's then
+        # nothing more to explore, or to charge against the limits)
+        if not ((merge_states and len(node.state.stmtnode.preds) > 1)
+                or strategy >= Budget.MERGE):
+            return False
+        if node.has_looped():
+            return False
+        if not canonical:
+            index = stmtgraph.get_reachability_index()
+            for edge in stmtgraph.edges:
+                if (index.scc_for_node[edge.srcnode]
+                    == index.scc_for_node[edge.dstnode]):
+                    loop_edges.add((edge.srcnode.bb, edge.dstnode.bb))
+        existing = canonical.setdefault(get_merge_key(node), node)
+        if existing is node:
+            return False
+        log('merging state with equivalent state at %s',
+            node.state.stmtnode)
+        children = node.pred.children
+        children[children.index((node.transition, node))] = \
+            (node.transition, existing)
+        return True
+
+    num_merged = 0
+
+    # List of (ExplodedNode, err) pairs for the ends of complete paths:
+    complete = []
+
+    def get_traces(pairs):
+        num_paths = count_paths(root)
+        result = []
+        for node, err in pairs:
+            trace = node.to_trace(err)
+            trace.num_paths = num_paths[node]
+            result.append(trace)
+        return result
+
+    def get_partial_traces(node):
+        # Get the complete traces so far, in the order that iter_traces
+        # gives them when a TooComplicated exception propagates up through
+        # its recursion: those below the innermost level first
+        level_for_node = {}
+        level = 0
+        iter_node = node.pred
+        while iter_node:
+            level_for_node[iter_node] = level
+            level += 1
+            iter_node = iter_node.pred
+        def get_level(item):
+            iter_node = item[0]
+            while iter_node not in level_for_node:
+                iter_node = iter_node.pred
+            return level_for_node[iter_node]
+        return get_traces(sorted(complete, key=get_level))
+
+    # For choosing paths under the Budget.SAMPLE strategy (seeded, so that
+    # the results are reproducible):
+    rng = random.Random(fun.decl.name)
+
+    root = ExplodedNode(initial, None, None)
+    worklist = deque([root])
+    while worklist:
+        strategy = getattr(limits, 'strategy', Budget.EXHAUSTIVE)
+        if strategy >= Budget.SAMPLE:
+            # Breadth-first:
+            node = worklist.popleft()
+        else:
+            node = worklist.pop()
+        if node.transition:
+            # (this is done as each node is taken from the worklist, rather
+            # than as it's created, so that the first path to reach each
+            # State, and hence the one that its Trace is rebuilt from, is
+            # the first in depth-first order):
+            if merge_node(node, strategy):
+                num_merged += 1
+                continue
+
+            # Potentially raise a TooComplicated exception:
+            if limits:
+                try:
+                    limits.on_transition(node.transition, [])
+                except TooComplicated:
+                    raise TooComplicated(get_partial_traces(node))
+
+            if node.state.has_returned or node.state.not_returning:
+                # This trace has terminated:
+                complete.append( (node, None) )
+                continue
+
+            # Stop interpreting when you see a loop, to ensure termination:
+            if node.has_looped():
+                widened = None
+                if widen_loops:
+                    widened = node.widen_at_loop()
+                if not widened:
+                    log('loop detected; stopping iteration')
+                    continue
+                if merge_node(widened, strategy):
+                    num_merged += 1
+                    continue
+                node = widened
+
+        curstate = node.state
+        log('  %s:%s', fun.decl.name, curstate.stmtnode)
+
+        try:
+            transitions = curstate.get_transitions()
+            check_isinstance(transitions, list)
+        except PredictedError:
+            # We're at a terminating state:
+            err = sys.exc_info()[1]
+            err.loc = curstate.stmtnode.get_stmt().loc
+            complete.append( (node, err) )
+            continue
+        except SplitValue:
+            # Split the state up, splitting into parallel worlds with
+            # different values for the given value
+            err = sys.exc_info()[1]
+            transitions = err.split(curstate)
+            check_isinstance(transitions, list)
+        for transition in transitions:
+            check_isinstance(transition, Transition)
+            transition.dest.verify()
+
+        log('transitions: %s', transitions)
+
+        if not transitions:
+            # We're at a terminating state:
+            complete.append( (node, None) )
+            continue
+
+        if strategy >= Budget.SAMPLE and len(transitions) > 1:
+            transitions = [rng.choice(transitions)]
+
+        newnodes = []
+        for transition in transitions:
+            newnodes.append(ExplodedNode(transition.dest, transition, node))
+
+        # Push in reverse order, so that the first transition is explored
+        # first:
+        worklist.extend(reversed(newnodes))
+
+    traces = get_traces(complete)
+    log('explore_traces: %i distinct ends of %i paths, %i states merged',
+        len(traces), sum(trace.num_paths for trace in traces), num_merged)
+    return traces
+
 class StateGraph:
     """
     A graph of states, representing the various routes through a function,
@@ -3084,9 +4239,9 @@ class StateGraph:
             self.transitions.append(transition)
             return
 
-        logger('transitions:', 2)
+        logger('transitions:')
         for t in transitions:
-            t.log(logger, 3)
+            t.log(logger)
 
         if len(transitions) > 0:
             for transition in transitions:
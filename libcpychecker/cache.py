@@ -0,0 +1,352 @@
+#   Copyright 2011, 2012 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2011, 2012 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+"""
+A persistent on-disk cache of the results of the refcount checker, so that
+rebuilding a project only reanalyzes the functions that have changed.
+
+Each function's results are stored in a JSON file within the cache
+directory, named by a hash of everything that the analysis depends on:
+
+  - the function's GIMPLE (including the source locations of the
+    statements), and the source lines of the function
+
+  - the layouts of the types that the function uses
+
+  - the data recorded from our custom attributes (stolen references,
+    borrowed references, functions that set exceptions), and the
+    registered type objects
+
+  - whether the function is a tp_iternext callback
+
+  - the summaries of the functions that it calls (when analyzing bottom-up
+    over the callgraph)
+
+  - the version of the checker itself (a hash of the source of the
+    libcpychecker package), of GCC and of Python, and the options that
+    the checker was run with
+
+An entry holds the GCC diagnostics that were emitted for the function, plus
+the contents of any report files (or JSONL line) that were written for it,
+and its FunctionSummary (if any); on a hit these are replayed, rather than
+analyzing the function.
+
+The total size of the cache is bounded: when it grows beyond its maximum
+size, the least-recently-used entries are removed (using the modification
+times of the files, which are updated on each hit).
+"""
+
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+import gcc
+
+from gccutils import check_isinstance, FlattenedCfg
+from libcpychecker.attributes import fnnames_returning_borrowed_refs, \
+    stolen_refs_by_fnname, fnnames_setting_exception, \
+    fnnames_setting_exception_on_negative_result
+from libcpychecker.diagnostics import CapturedDiagnostics, \
+    RecordedDiagnostic, get_locations_for_function, \
+    get_locations_for_translation_unit
+from libcpychecker.summaries import FunctionSummary, get_summary, \
+    record_summary
+from libcpychecker.types import type_dict
+from libcpychecker.utils import log
+
+DEFAULT_MAXSIZE = 100 * 1024 * 1024
+
+# Bump this if the format of the cache entries changes:
+CACHE_FORMAT = 3
+
+_checker_version = None
+
+def get_checker_version():
+    """
+    Get a string identifying the version of the checker, as a hash of the
+    source of the libcpychecker package
+    """
+    global _checker_version
+    if _checker_version is None:
+        h = hashlib.sha1()
+        pkgdir = os.path.dirname(os.path.abspath(__file__))
+        for filename in sorted(glob.glob(os.path.join(pkgdir, '*.py'))):
+            h.update(os.path.basename(filename).encode('utf-8'))
+            with open(filename, 'rb') as f:
+                h.update(f.read())
+        _checker_version = h.hexdigest()
+    return _checker_version
+
+def describe_type_layout(t, result, visited):
+    """
+    Append strings describing the given gcc.Type to the "result" list,
+    recursing into the types that it refers to
+    """
+    if t is None or not isinstance(t, gcc.Type):
+        return
+    key = str(t)
+    if key in visited:
+        return
+    visited.add(key)
+    result.append('type %s' % key)
+    if isinstance(t, gcc.RecordType):
+        for field in t.fields:
+            result.append('field %s: %s' % (field.name, field.type))
+            describe_type_layout(field.type, result, visited)
+    elif isinstance(t, (gcc.PointerType, gcc.ArrayType)):
+        describe_type_layout(t.dereference, result, visited)
+    elif isinstance(t, gcc.FunctionType):
+        describe_type_layout(t.type, result, visited)
+        for argtype in (t.argument_types or []):
+            describe_type_layout(argtype, result, visited)
+
+def describe_attributes():
+    """
+    Get a list of strings describing the data recorded from our custom
+    attributes
+    """
+    return ['borrowed: %r' % sorted(fnnames_returning_borrowed_refs),
+            'stolen: %r' % sorted((fnname, sorted(indices))
+                                  for fnname, indices
+                                  in stolen_refs_by_fnname.items()),
+            'setting exception: %r' % sorted(fnnames_setting_exception),
+            ('setting exception on negative result: %r'
+             % sorted(fnnames_setting_exception_on_negative_result)),
+            'type objects: %r' % sorted((name, str(typedef))
+                                        for name, typedef
+                                        in type_dict.items())]
+
+def get_function_source(fun):
+    """
+    Get the source lines of the given gcc.Function, as a list of strings
+    """
+    if not (fun.start and fun.end):
+        return []
+    try:
+        with open(fun.start.file) as f:
+            lines = f.readlines()
+    except IOError:
+        return []
+    return lines[fun.decl.location.line - 1:fun.end.line]
+
+class ResultCache:
+    """
+    The results of check_refcounts() on functions, keyed by hashes of the
+    functions (and everything else the results depend on), stored within
+    the given directory
+    """
+    def __init__(self, cachedir, maxsize=DEFAULT_MAXSIZE, options=None,
+                 jsonl=None):
+        self.cachedir = cachedir
+        self.maxsize = maxsize
+        # A dict of the options the checker is being run with:
+        self.options = options or {}
+        # The JsonlReportWriter that reports are written to, if any:
+        self.jsonl = jsonl
+        # (built on the first cache hit; see _emit):
+        self._tu_locations = None
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+
+    def get_key(self, fun, flat=None):
+        """
+        Get a hash of everything that analyzing the given gcc.Function
+        depends on
+
+        flat: the gccutils.FlattenedCfg for fun.cfg, if the caller has
+        already built one within the current pass (otherwise, one is built)
+        """
+        from libcpychecker.refcounts import function_is_tp_iternext_callback
+        check_isinstance(fun, gcc.Function)
+        items = ['format %i' % CACHE_FORMAT,
+                 'checker %s' % get_checker_version(),
+                 'gcc %i' % gcc.GCC_VERSION,
+                 'python %r' % (sys.version_info[:2], ),
+                 'options %r' % sorted(self.options.items()),
+                 'function %s: %s' % (fun.decl.name, fun.decl.type),
+                 'location %s' % fun.decl.location,
+                 'tp_iternext %r' % function_is_tp_iternext_callback(fun)]
+        items += describe_attributes()
+
+        types = [fun.decl.type]
+        for decl in list(fun.decl.arguments) + list(fun.local_decls):
+            items.append('decl %s: %s at %s'
+                         % (decl.name, decl.type, decl.location))
+            types.append(decl.type)
+        if flat is None:
+            flat = FlattenedCfg(fun.cfg)
+        for bb in flat.blocks:
+            succs = [flat.edges[i] for i in flat.succs[bb.index]]
+            items.append('bb %i -> %r'
+                         % (bb.index,
+                            [(destindex, e.true_value, e.false_value,
+                              e.complex)
+                             for srcindex, destindex, e in succs]))
+            for stmt in flat.phi_nodes[bb.index] + flat.gimple[bb.index]:
+                items.append('%s: %s at %s'
+                             % (stmt.__class__.__name__, stmt, stmt.loc))
+                fndecl = getattr(stmt, 'fndecl', None)
+                if fndecl:
+                    summary = get_summary(fndecl.name)
+                    if summary:
+                        items.append('summary %r' % summary)
+                for attrname in ('lhs', 'fn'):
+                    value = getattr(stmt, attrname, None)
+                    if hasattr(value, 'type'):
+                        types.append(value.type)
+                for value in (getattr(stmt, 'rhs', None)
+                              or getattr(stmt, 'args', None)
+                              or []):
+                    if hasattr(value, 'type'):
+                        types.append(value.type)
+
+        visited = set()
+        for t in types:
+            describe_type_layout(t, items, visited)
+
+        items += get_function_source(fun)
+
+        h = hashlib.sha1()
+        for item in items:
+            h.update(item.encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.cachedir, '%s.json' % key)
+
+    def lookup(self, key):
+        """
+        Get the entry for the given key as a dict, or None if there isn't
+        one
+        """
+        path = self._get_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        # Mark the entry as recently used:
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry
+
+    def store(self, key, entry):
+        """
+        Save the given dict as the entry for the given key, evicting old
+        entries if the cache has grown too big
+        """
+        # Write to a temporary file, then rename it into place, so that
+        # concurrent compilations never see a partial entry:
+        fd, tmppath = tempfile.mkstemp(dir=self.cachedir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.rename(tmppath, self._get_path(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least-recently-used entries until the total size of the
+        cache is within self.maxsize
+        """
+        entries = []
+        total = 0
+        for path in glob.glob(os.path.join(self.cachedir, '*.json')):
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Removed by another compilation:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        if total <= self.maxsize:
+            return
+        for mtime, size, path in sorted(entries):
+            log('evicting %s from cache', path)
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+            if total <= self.maxsize:
+                break
+
+    def check_function(self, fun, fn, flat=None):
+        """
+        Run fn(fun) on the given gcc.Function (which should analyze it,
+        returning a Reporter), or replay the cached results of doing so
+
+        flat: the gccutils.FlattenedCfg for fun.cfg, if the caller has
+        already built one within the current pass (otherwise, one is built)
+        """
+        if flat is None:
+            flat = FlattenedCfg(fun.cfg)
+        key = self.get_key(fun, flat)
+        entry = self.lookup(key)
+        if entry is not None:
+            log('cache hit for %s: %s', fun.decl.name, key)
+            self._replay(fun, entry, flat)
+            return
+
+        log('cache miss for %s: %s', fun.decl.name, key)
+        base = gcc.get_dump_base_name()
+        # Emit the diagnostics as normal, recording them for next time:
+        with CapturedDiagnostics(passthrough=True) as captured:
+            rep = fn(fun)
+
+        # (only the files that this analysis wrote out, rather than any
+        # left over from earlier compilations):
+        files = {}
+        for filename in rep.written_files:
+            with open(filename) as f:
+                files[filename[len(base):]] = f.read()
+        summary = get_summary(fun.decl.name)
+        self.store(key,
+                   dict(diagnostics=[d.as_json()
+                                     for d in captured.diagnostics],
+                        files=files,
+                        jsonl=rep.jsonl_data,
+                        summary=summary.as_json() if summary else None))
+
+    def _emit(self, fun, diagnostics, flat):
+        # Emit diagnostics replayed from the cache, at the equivalent
+        # locations within this compilation:
+        locations = get_locations_for_function(fun, flat)
+        if self._tu_locations is None:
+            self._tu_locations = get_locations_for_translation_unit()
+        for d in diagnostics:
+            d.emit(locations, fun.start, self._tu_locations)
+
+    def _replay(self, fun, entry, flat):
+        # Rewrite the report files, relative to the current dump base name:
+        base = gcc.get_dump_base_name()
+        for suffix, content in entry['files'].items():
+            with open(base + suffix, 'w') as f:
+                f.write(content)
+        if entry['jsonl'] and self.jsonl:
+            self.jsonl.write(entry['jsonl'])
+        self._emit(fun,
+                   [RecordedDiagnostic.from_json(d)
+                    for d in entry['diagnostics']],
+                   flat)
+        if entry['summary']:
+            record_summary(FunctionSummary.from_json(entry['summary']))
@@ -50,12 +50,20 @@ if hasattr(gcc, 'PLUGIN_FINISH_DECL'):
 
     def on_finish_decl(*args):
         # GCC 4.7 and later: callback to the PLUGIN_FINISH_DECL event
-        # print(args) # FIXME: why two args?
+        # The args are the decl, and the gcc.Function whose body it's
+        # within (or None for a decl at file scope)
 
         global global_exceptions
         global global_typeobjs
 
         decl = args[0]
+        fun = args[1]
+
+        # A new global typedef or variable may have appeared (but not from
+        # the decls within function bodies):
+        if fun is None and isinstance(decl, (gcc.TypeDecl, gcc.VarDecl)):
+            gccutils.invalidate_symbol_index()
+
         if isinstance(decl, gcc.VarDecl):
             if decl.name:
                 if decl.name.startswith('PyExc_'):
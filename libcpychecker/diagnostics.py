@@ -23,8 +23,11 @@ GCC diagnostic messages are buffered up within Report instances and eventually
 flushed, allowing us to de-duplicate error reports.
 """
 
+import json
+import os
+
 import gcc
-from gccutils import get_src_for_loc, check_isinstance
+from gccutils import get_src_for_loc, check_isinstance, FlattenedCfg
 from libcpychecker.visualizations import HtmlRenderer
 from libcpychecker.utils import log
 
@@ -97,11 +100,22 @@ class Reporter:
 
     Error reports can be de-duplicated by finding sufficiently similar Report
     instances, and only fully flushing one of them within each equivalence
-    class
+    class.  The equivalence classes are given by a function mapping each
+    Report to a hashable key (by default, get_default_duplicate_key), which
+    can be overridden e.g. to group reports about objects allocated at the
+    same site
     """
-    def __init__(self):
+    def __init__(self, get_duplicate_key=None):
         self.reports = []
         self._got_warnings = False
+        # The names of the files that the reports have been written out to:
+        self.written_files = []
+        # The result of to_json(), if the reports were written out to a
+        # JsonlReportWriter:
+        self.jsonl_data = None
+        if get_duplicate_key is None:
+            get_duplicate_key = get_default_duplicate_key
+        self.get_duplicate_key = get_duplicate_key
 
     def make_warning(self, fun, loc, msg):
         assert isinstance(fun, gcc.Function)
@@ -142,6 +156,7 @@ class Reporter:
         from json import dump, dumps
         with open(filename, 'w') as f:
             dump(js, f, sort_keys=True, indent=4)
+        self.written_files.append(filename)
         if 0:
             print(dumps(js, sort_keys=True, indent=4))
 
@@ -158,33 +173,110 @@ class Reporter:
         html = self.to_html(fun)
         with open(filename, 'w') as f:
             f.write(html)
+        self.written_files.append(filename)
 
     def remove_duplicates(self):
         """
         Try to organize Report instances into equivalence classes, and only
         keep the first Report within each class
         """
-        for report in self.reports[:]:
-            # The report might have been removed during the iteration:
-            if report.is_duplicate:
-                continue
-            for candidate in self.reports[:]:
-                if report != candidate and not report.is_duplicate:
-                    if candidate.is_duplicate_of(report):
-                        report.add_duplicate(candidate)
-                        self.reports.remove(candidate)
+        # Mapping from key to the first Report with that key:
+        first_for_key = {}
+        survivors = []
+        for report in self.reports:
+            key = self.get_duplicate_key(report)
+            if key in first_for_key:
+                first_for_key[key].add_duplicate(report)
+            else:
+                first_for_key[key] = report
+                survivors.append(report)
+        self.reports = survivors
 
         # Add a note to each report that survived about any duplicates:
         for report in self.reports:
-            if report.duplicates:
+            num_similar = report.get_num_similar_traces()
+            if num_similar:
                 report.add_note(report.loc,
                                 ('found %i similar trace(s) to this'
-                                 % len(report.duplicates)))
+                                 % num_similar))
 
     def flush(self):
         for r in self.reports:
             r.flush()
 
+class JsonlReportWriter:
+    """
+    Writes the reports for a whole translation unit to a single file of
+    newline-delimited JSON, with one line per function that has reports (in
+    the form given by Reporter.to_json), appended as each function is
+    checked.  HTML can be generated from this file later, offline.
+
+    Within a worker process, the lines can instead be captured (see
+    capture_lines), to be passed back to the compiler process, which writes
+    them out in the order of the functions, rather than in the order in
+    which the workers happened to finish.
+    """
+    def __init__(self):
+        self._started = False
+        # A list of the lines written since capture_lines() was called, or
+        # None if they're being written straight to the file:
+        self._captured = None
+
+    def get_filename(self):
+        return '%s.cpychecker.jsonl' % gcc.get_dump_base_name()
+
+    def start(self):
+        """
+        Truncate any file left from a previous compilation.  This should be
+        called from the compiler process before any functions are checked
+        in worker processes, so that only happens once
+        """
+        if not self._started:
+            with open(self.get_filename(), 'w'):
+                pass
+            self._started = True
+
+    def capture_lines(self):
+        """
+        Gather the lines written from now on, rather than writing them to
+        the file (see get_captured_lines)
+        """
+        self._captured = []
+
+    def get_captured_lines(self):
+        """
+        Get the list of lines captured since the last call, as strings to be
+        passed to write_line()
+        """
+        lines = self._captured
+        self._captured = []
+        return lines
+
+    def write(self, jsonobj):
+        self.write_line(json.dumps(jsonobj, sort_keys=True) + '\n')
+
+    def write_line(self, line):
+        if self._captured is not None:
+            self._captured.append(line)
+            return
+        self.start()
+        # Append the line with a single write(), so that the lines from
+        # concurrent worker processes don't get interleaved:
+        fd = os.open(self.get_filename(),
+                     os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        try:
+            os.write(fd, line.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+def get_default_duplicate_key(report):
+    """
+    The default equivalence classes for de-duplicating Report instances:
+    the same function, source location, and message; everything else can be
+    different
+    """
+    return (report.fun, report.loc, report.msg)
+
 class SavedDiagnostic:
     """
     A saved GCC diagnostic, which we can choose to emit or suppress at a later
@@ -204,6 +296,140 @@ class SavedInform(SavedDiagnostic):
     def flush(self):
         gcc.inform(self.loc, self.msg)
 
+def location_as_key(loc):
+    return (loc.file, loc.line, loc.column)
+
+def get_locations_for_function(fun, flat=None):
+    """
+    Build a dict mapping from (file, line, column) to gcc.Location for the
+    locations that diagnostics about the given gcc.Function could refer to
+
+    flat: the gccutils.FlattenedCfg for fun.cfg, if the caller has already
+    built one within the current pass (otherwise, one is built)
+    """
+    check_isinstance(fun, gcc.Function)
+    result = {}
+    def add(loc):
+        if loc:
+            result[location_as_key(loc)] = loc
+    add(fun.start)
+    add(fun.end)
+    add(fun.decl.location)
+    for parm in fun.decl.arguments:
+        add(parm.location)
+    for local in fun.local_decls:
+        add(local.location)
+    if flat is None:
+        flat = FlattenedCfg(fun.cfg)
+    for bb_index, stmt in flat.stmts:
+        add(stmt.loc)
+    return result
+
+def get_locations_for_translation_unit():
+    """
+    Build a dict mapping from (file, line, column) to gcc.Location for the
+    locations of the global declarations of the translation unit (the
+    functions and variables), which diagnostics about any function could
+    refer to (e.g. a note about a callee)
+    """
+    result = {}
+    def add(loc):
+        if loc:
+            result[location_as_key(loc)] = loc
+    for node in gcc.get_callgraph_nodes():
+        add(node.decl.location)
+        fun = node.decl.function
+        if fun:
+            add(fun.start)
+            add(fun.end)
+    for var in gcc.get_variables():
+        add(var.decl.location)
+    return result
+
+class RecordedDiagnostic:
+    """
+    A GCC diagnostic that was captured rather than emitted, in a form that
+    can be pickled (to send it between processes) or saved as JSON (to cache
+    it), and emitted later
+    """
+    def __init__(self, kind, lockey, msg, option=None):
+        self.kind = kind # 'warning' or 'inform'
+        self.lockey = lockey # (file, line, column)
+        self.msg = msg
+        self.option = option # the text of the gcc.Option for a warning, or None
+
+    def emit(self, locations, fallback_loc, other_locations=None):
+        """
+        Emit the diagnostic, at the gcc.Location within the dict "locations"
+        (or failing that, "other_locations") with the same (file, line,
+        column), or at fallback_loc if neither has one
+        """
+        loc = locations.get(self.lockey)
+        if loc is None and other_locations:
+            loc = other_locations.get(self.lockey)
+        if loc is None:
+            loc = fallback_loc
+        if self.kind == 'warning':
+            if self.option:
+                gcc.warning(loc, self.msg, gcc.Option(self.option))
+            else:
+                gcc.warning(loc, self.msg)
+        else:
+            gcc.inform(loc, self.msg)
+
+    def as_json(self):
+        return [self.kind, list(self.lockey), self.msg, self.option]
+
+    @classmethod
+    def from_json(cls, jsonobj):
+        kind, lockey, msg, option = jsonobj
+        return cls(kind, tuple(lockey), msg, option)
+
+class CapturedDiagnostics:
+    """
+    Context manager: within the "with" block, calls to gcc.warning() and
+    gcc.inform() are recorded as RecordedDiagnostic instances in
+    self.diagnostics, rather than being emitted
+
+    If passthrough is true, they are also emitted as normal (so that they
+    have their real locations), as well as being recorded
+    """
+    def __init__(self, passthrough=False):
+        self.diagnostics = []
+        self.passthrough = passthrough
+
+    def _record_warning(self, loc, msg, option=None):
+        self.diagnostics.append(RecordedDiagnostic('warning',
+                                                   location_as_key(loc),
+                                                   msg,
+                                                   option.text
+                                                   if option else None))
+        if self.passthrough:
+            saved_warning = self._saved[0]
+            if option:
+                return saved_warning(loc, msg, option)
+            return saved_warning(loc, msg)
+        # (we don't know yet whether it will be emitted, but assume so):
+        return True
+
+    def _record_inform(self, loc, msg):
+        self.diagnostics.append(RecordedDiagnostic('inform',
+                                                   location_as_key(loc),
+                                                   msg))
+        if self.passthrough:
+            saved_inform = self._saved[1]
+            saved_inform(loc, msg)
+
+    def __enter__(self):
+        self._saved = (gcc.warning, gcc.inform)
+        gcc.warning = self._record_warning
+        gcc.inform = self._record_inform
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        gcc.warning, gcc.inform = self._saved
+        return False
+
 class Report:
     """
     Data about a particular bug found by the checker
@@ -220,6 +446,9 @@ class Report:
         # De-duplication handling:
         self.is_duplicate = False
         self.duplicates = [] # list of Report
+        # The number of other traces that lead to this same report, without
+        # having a Report of their own (see add_duplicate_traces):
+        self.num_duplicate_traces = 0
 
     def add_warning(self, loc, msg):
         # Add a gcc.warning() to the buffer of GCC diagnostics
@@ -255,23 +484,34 @@ class Report:
 
     def is_duplicate_of(self, other):
         check_isinstance(other, Report)
-
-        # Simplistic equivalence classes for now:
-        # the same function, source location, and message; everything
-        # else can be different
-        if self.fun != other.fun:
-            return False
-        if self.loc != other.loc:
-            return False
-        if self.msg != other.msg:
-            return False
-
-        return True
+        return (get_default_duplicate_key(self)
+                == get_default_duplicate_key(other))
 
     def add_duplicate(self, other):
         assert not self.is_duplicate
         self.duplicates.append(other)
         other.is_duplicate = True
+        # Take over any duplicates already attached to the other report, so
+        # that they're counted too:
+        self.duplicates += other.duplicates
+        other.duplicates = []
+        self.num_duplicate_traces += other.num_duplicate_traces
+        other.num_duplicate_traces = 0
+
+    def add_duplicate_traces(self, count):
+        """
+        Record that the given number of other traces lead to this same
+        report, without generating reports (or even Trace instances) for
+        them
+        """
+        self.num_duplicate_traces += count
+
+    def get_num_similar_traces(self):
+        """
+        Get the number of other traces that lead to this same report: those
+        of the duplicate reports, and those recorded by add_duplicate_traces
+        """
+        return len(self.duplicates) + self.num_duplicate_traces
 
     def to_json(self, fun):
         assert self.trace
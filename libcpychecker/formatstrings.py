@@ -15,12 +15,15 @@
 #   along with this program.  If not, see
 #   <http://www.gnu.org/licenses/>.
 
+import copy
 import sys
 
-from gccutils import get_src_for_loc, get_global_typedef
+from gccutils import get_src_for_loc, get_global_typedef, FlattenedCfg
 
 from libcpychecker.types import *
-from libcpychecker.utils import log
+from libcpychecker.utils import get_logger
+
+log = get_logger('formatstrings')
 
 const_correctness = True
 
@@ -100,6 +103,11 @@ class FormatUnit:
         # either as gcc.Type instances, or as instances of AwkwardType
         raise NotImplementedError
 
+    def reset(self):
+        # Forget anything recorded about the arguments at a particular
+        # callsite (see ParsedFormatString.reset)
+        pass
+
 class ConcreteUnit(FormatUnit):
     """
     The common case: a fragment of a format string that corresponds to a
@@ -133,11 +141,65 @@ class ParsedFormatString:
     def __init__(self, fmt_string):
         self.fmt_string = fmt_string
         self.args = []
+        self._exp_types = None
 
     def __repr__(self):
         return ('%s(fmt_string=%r, args=%r)'
                 % (self.__class__.__name__, self.fmt_string, self.args))
 
+    def get_exp_types(self):
+        """
+        Get a tuple of (FormatUnit, gcc.Type) pairs, representing the
+        expected types of the varargs, computing it on the first call
+        """
+        if self._exp_types is None:
+            self._exp_types = tuple(self.iter_exp_types())
+        return self._exp_types
+
+    def num_expected(self):
+        return len(self.get_exp_types())
+
+    def reset(self):
+        """
+        Forget anything recorded by the format units when checking the
+        arguments at a callsite (e.g. the PyTypeObject passed for "O!"), so
+        that this can be used for checking another callsite
+        """
+        for arg, exp_type in self.get_exp_types():
+            arg.reset()
+
+# A dictionary mapping from (fmt_string, with_size_t, parser class) to either
+# the ParsedFormatString, or the FormatStringWarning raised when parsing it:
+_parsed_format_strings = {}
+
+def parse_format_string(parser, fmt_string, with_size_t):
+    """
+    Get the result of parser.from_string(fmt_string, with_size_t), parsing
+    each distinct format string only once (generated code can contain the
+    same format strings thousands of times)
+
+    The result is shared between callers, and must not be modified, other
+    than by checking a callsite against it; any state left from checking an
+    earlier callsite is reset before it is returned
+    """
+    key = (fmt_string, with_size_t, parser)
+    try:
+        result = _parsed_format_strings[key]
+    except KeyError:
+        try:
+            result = parser.from_string(fmt_string, with_size_t)
+            result.args = tuple(result.args)
+            result.get_exp_types()
+        except FormatStringWarning:
+            result = sys.exc_info()[1]
+        _parsed_format_strings[key] = result
+    if isinstance(result, FormatStringWarning):
+        # (raise a copy, rather than accumulating tracebacks on the cached
+        # instance)
+        raise copy.copy(result)
+    result.reset()
+    return result
+
 class WrongNumberOfVars(ParsedFormatStringWarning):
     def __init__(self, funcname, fmt, varargs):
         ParsedFormatStringWarning.__init__(self, funcname, fmt)
@@ -174,12 +236,19 @@ class TooManyVars(WrongNumberOfVars):
         return 'Too many arguments'
 
 class MismatchingType(ParsedFormatStringWarning):
-    def __init__(self, funcname, fmt, arg_num, arg_fmt_string, exp_type, vararg):
+    def __init__(self, funcname, fmt, arg_num, arg_fmt_string, exp_type, vararg,
+                 exp_desc=None):
         super(self.__class__, self).__init__(funcname, fmt)
         self.arg_num = arg_num
         self.arg_fmt_string = arg_fmt_string
         self.exp_type = exp_type
         self.vararg = vararg
+        # The description of exp_type, if it was rendered earlier (for
+        # AwkwardType instances, this depends on the state recorded when the
+        # callsite was compared):
+        if exp_desc is None:
+            exp_desc = describe_type(exp_type)
+        self.exp_desc = exp_desc
 
     def extra_info(self):
         def _describe_vararg(va):
@@ -194,7 +263,7 @@ class MismatchingType(ParsedFormatStringWarning):
                 '    %s\n'
                 '  for format code "%s"\n'
                 % (self.arg_num, self.vararg, describe_type(self.vararg.type),
-                   describe_type(self.exp_type), self.arg_fmt_string))
+                   self.exp_desc, self.arg_fmt_string))
 
     def __str__(self):
         return ('Mismatching type in call to %s with format code "%s"'
@@ -319,163 +388,286 @@ def compatible_type(exp_type, actual_type, actualarg=None):
 
     return False
 
-def check_pyargs(fun):
-    from libcpychecker.PyArg_ParseTuple import PyArgParseFmt
-    from libcpychecker.Py_BuildValue import PyBuildValueFmt
-
-    def get_format_string(stmt, format_idx):
-        fmt_code = stmt.args[format_idx]
-        # We can only cope with the easy case, when it's a AddrExpr(StringCst())
-        # i.e. a reference to a string constant, i.e. a string literal in the C
-        # source:
-        if isinstance(fmt_code, gcc.AddrExpr):
-            operand = fmt_code.operand
-            if isinstance(operand, gcc.StringCst):
-                return operand.constant
-
-    def check_keyword_array(stmt, idx):
-        keywords = stmt.args[idx]
-        if isinstance(keywords, gcc.AddrExpr):
-            operand = keywords.operand
-            if isinstance(operand, gcc.VarDecl):
-                # Caveat: "initial" will only be set up on the VarDecl of a
-                # global variable, or a "static" variable in function scope;
-                # for other local variables we appear to need to track the
-                # gimple statements to get the value at the callsite
-                initial = operand.initial
-                if isinstance(initial, gcc.Constructor):
-                    elements = [None] * len(initial.elements)
-                    for elt in initial.elements:
-                        (num, contents) = elt
-                        elt_idx = num.constant
-                        if isinstance(contents, gcc.NopExpr):
-                            contents = contents.operand
-                        if isinstance(contents, gcc.AddrExpr):
-                            contents = contents.operand
-                            if isinstance(contents, gcc.StringCst):
-                                elements[elt_idx] = contents.constant
-                        elif isinstance(contents, gcc.IntegerCst):
+class FormatStringFunction:
+    """
+    A function taking a format string followed by varargs (e.g.
+    PyArg_ParseTuple), and how to check the calls to it
+    """
+    def __init__(self, parser, funcname, format_idx, varargs_idx,
+                 with_size_t, keywords_idx=None):
+        # The ParsedFormatString subclass for the format string:
+        self.parser = parser
+        # The name to report the function as:
+        self.funcname = funcname
+        self.format_idx = format_idx
+        self.varargs_idx = varargs_idx
+        # Was PY_SSIZE_T_CLEAN defined?
+        self.with_size_t = with_size_t
+        # The index of the array of keywords, if any:
+        self.keywords_idx = keywords_idx
+
+_format_string_functions = None
+
+def get_format_string_functions():
+    """
+    Get a dictionary mapping from the names of functions (as seen by the
+    compiler) to FormatStringFunction instances
+    """
+    global _format_string_functions
+    if _format_string_functions is None:
+        from libcpychecker.PyArg_ParseTuple import PyArgParseFmt
+        from libcpychecker.Py_BuildValue import PyBuildValueFmt
+
+        # If "PY_SSIZE_T_CLEAN" is defined before #include <Python.h>, then
+        # the preprocessor is actually turning these into "_SizeT"-suffixed
+        # variants, which handle some format codes differently
+
+        # FIXME: should we report the name as seen by the compiler?
+        # It doesn't appear in the CPython API docs
+        _format_string_functions = {
+            'PyArg_ParseTuple':
+                FormatStringFunction(PyArgParseFmt, 'PyArg_ParseTuple',
+                                     1, 2, False),
+            '_PyArg_ParseTuple_SizeT':
+                FormatStringFunction(PyArgParseFmt, 'PyArg_ParseTuple',
+                                     1, 2, True),
+            'PyArg_Parse':
+                FormatStringFunction(PyArgParseFmt, 'PyArg_Parse',
+                                     1, 2, False),
+            '_PyArg_Parse_SizeT':
+                FormatStringFunction(PyArgParseFmt, 'PyArg_Parse',
+                                     1, 2, True),
+            'PyArg_ParseTupleAndKeywords':
+                FormatStringFunction(PyArgParseFmt,
+                                     'PyArg_ParseTupleAndKeywords',
+                                     2, 4, False, keywords_idx=3),
+            '_PyArg_ParseTupleAndKeywords_SizeT':
+                FormatStringFunction(PyArgParseFmt,
+                                     'PyArg_ParseTupleAndKeywords',
+                                     2, 4, True, keywords_idx=3),
+            'Py_BuildValue':
+                FormatStringFunction(PyBuildValueFmt, 'Py_BuildValue',
+                                     0, 1, False),
+            'Py_BuildValue_SizeT':
+                FormatStringFunction(PyBuildValueFmt, 'Py_BuildValue',
+                                     0, 1, True),
+        }
+    return _format_string_functions
+
+def get_format_string(stmt, format_idx):
+    fmt_code = stmt.args[format_idx]
+    # We can only cope with the easy case, when it's a AddrExpr(StringCst())
+    # i.e. a reference to a string constant, i.e. a string literal in the C
+    # source:
+    if isinstance(fmt_code, gcc.AddrExpr):
+        operand = fmt_code.operand
+        if isinstance(operand, gcc.StringCst):
+            return operand.constant
+
+def check_keyword_array(stmt, idx):
+    keywords = stmt.args[idx]
+    if isinstance(keywords, gcc.AddrExpr):
+        operand = keywords.operand
+        if isinstance(operand, gcc.VarDecl):
+            # Caveat: "initial" will only be set up on the VarDecl of a
+            # global variable, or a "static" variable in function scope;
+            # for other local variables we appear to need to track the
+            # gimple statements to get the value at the callsite
+            initial = operand.initial
+            if isinstance(initial, gcc.Constructor):
+                elements = [None] * len(initial.elements)
+                for elt in initial.elements:
+                    (num, contents) = elt
+                    elt_idx = num.constant
+                    if isinstance(contents, gcc.NopExpr):
+                        contents = contents.operand
+                    if isinstance(contents, gcc.AddrExpr):
+                        contents = contents.operand
+                        if isinstance(contents, gcc.StringCst):
                             elements[elt_idx] = contents.constant
-                    if elements[-1] != 0:
-                        gcc.warning(stmt.loc, 'keywords to PyArg_ParseTupleAndKeywords are not NULL-terminated')
-                    i = 0
-                    for elt in elements[0:-1]:
-                        if not elt:
-                            gcc.warning(stmt.loc, 'keyword argument %d missing in PyArg_ParseTupleAndKeywords call' % i)
-                        i = i + 1
-
-    def check_callsite(stmt, parser, funcname, format_idx, varargs_idx, with_size_t):
-        log('got call at %s', stmt.loc)
-        log(get_src_for_loc(stmt.loc))
-        # log('stmt: %r %s', (stmt, stmt))
-        # log('args: %r', stmt.args)
-        # for arg in stmt.args:
-        #    # log('  arg: %s %r', (arg, arg))
-            
-
-        # We expect the following args:
-        #   args[0]: PyObject *input_tuple
-        #   args[1]: char * format
-        #   args[2...]: output pointers
-
-        if len(stmt.args) >= format_idx:
-            fmt_string = get_format_string(stmt, format_idx)
-            if fmt_string:
-                log('fmt_string: %r', fmt_string)
-
-                loc = stmt.loc
-
-                # Figure out expected types, based on the format string...
-                try:
-                    fmt = parser.from_string(fmt_string, with_size_t)
-                except FormatStringWarning:
-                    err = sys.exc_info()[1]
-                    err.emit_as_warning(stmt.loc)
-                    return
-                log('fmt: %r', fmt.args)
-
-                exp_types = list(fmt.iter_exp_types())
-                log('exp_types: %r', exp_types)
-
-                # ...then compare them against the actual types:
-                varargs = stmt.args[varargs_idx:]
-                # log('varargs: %r', varargs)
-                if len(varargs) < len(exp_types):
-                    NotEnoughVars(funcname, fmt, varargs).emit_as_warning(loc)
-                    return
-
-                if len(varargs) > len(exp_types):
-                    TooManyVars(funcname, fmt, varargs).emit_as_warning(loc)
-                    return
-
-                for index, ((exp_arg, exp_type), vararg) in enumerate(zip(exp_types, varargs)):
-                    if not compatible_type(exp_type, vararg.type, actualarg=vararg):
-                        err = MismatchingType(funcname, fmt,
-                                              index + varargs_idx + 1,
-                                              exp_arg.code, exp_type, vararg)
-                        if hasattr(vararg, 'location'):
-                            loc = vararg.location
-                        else:
-                            loc = stmt.loc
-                        err.emit_as_warning(loc)
-
-    def maybe_check_callsite(stmt):
-        if stmt.fndecl:
-            # If "PY_SSIZE_T_CLEAN" is defined before #include <Python.h>, then
-            # the preprocessor is actually turning these into "_SizeT"-suffixed
-            # variants, which handle some format codes differently
-
-            # FIXME: should we report the name as seen by the compiler?
-            # It doesn't appear in the CPython API docs
-
-            if stmt.fndecl.name == 'PyArg_ParseTuple':
-                check_callsite(stmt,
-                               PyArgParseFmt,
-                               'PyArg_ParseTuple',
-                               1, 2, False)
-            elif stmt.fndecl.name == '_PyArg_ParseTuple_SizeT':
-                check_callsite(stmt,
-                               PyArgParseFmt,
-                               'PyArg_ParseTuple',
-                               1, 2, True)
-            elif stmt.fndecl.name == 'PyArg_Parse':
-                check_callsite(stmt,
-                               PyArgParseFmt,
-                               'PyArg_Parse',
-                               1, 2, False)
-            elif stmt.fndecl.name == '_PyArg_Parse_SizeT':
-                check_callsite(stmt,
-                               PyArgParseFmt,
-                               'PyArg_Parse',
-                               1, 2, True)
-            elif stmt.fndecl.name == 'PyArg_ParseTupleAndKeywords':
-                check_keyword_array(stmt, 3)
-                check_callsite(stmt,
-                               PyArgParseFmt,
-                               'PyArg_ParseTupleAndKeywords',
-                               2, 4, False)
-            elif stmt.fndecl.name == '_PyArg_ParseTupleAndKeywords_SizeT':
-                check_keyword_array(stmt, 3)
-                check_callsite(stmt,
-                               PyArgParseFmt,
-                               'PyArg_ParseTupleAndKeywords',
-                               2, 4, True)
-            elif stmt.fndecl.name == 'Py_BuildValue':
-                check_callsite(stmt,
-                               PyBuildValueFmt,
-                               'Py_BuildValue',
-                               0, 1, False)
-            elif stmt.fndecl.name == 'Py_BuildValue_SizeT':
-                check_callsite(stmt,
-                               PyBuildValueFmt,
-                               'Py_BuildValue',
-                               0, 1, True)
+                    elif isinstance(contents, gcc.IntegerCst):
+                        elements[elt_idx] = contents.constant
+                if elements[-1] != 0:
+                    gcc.warning(stmt.loc, 'keywords to PyArg_ParseTupleAndKeywords are not NULL-terminated')
+                i = 0
+                for elt in elements[0:-1]:
+                    if not elt:
+                        gcc.warning(stmt.loc, 'keyword argument %d missing in PyArg_ParseTupleAndKeywords call' % i)
+                    i = i + 1
+
+def iter_format_string_callsites(fun, flat=None):
+    """
+    Yield (gcc.GimpleCall, FormatStringFunction) pairs for the calls within
+    the given gcc.Function to functions taking format strings
 
+    flat: the gccutils.FlattenedCfg for fun.cfg, if the caller has already
+    built one within the current pass (otherwise, one is built)
+    """
+    functions = get_format_string_functions()
     if fun.cfg:
-        for bb in fun.cfg.basic_blocks:
-            if isinstance(bb.gimple, list):
-                for stmt in bb.gimple:
-                    if stmt.loc:
-                        gcc.set_location(stmt.loc)
-                    if isinstance(stmt, gcc.GimpleCall):
-                        maybe_check_callsite(stmt)
+        if flat is None:
+            flat = FlattenedCfg(fun.cfg)
+        # (phi nodes are never calls, so only the other statements of each
+        # block are looked at):
+        for bb in flat.blocks:
+            for stmt in flat.gimple[bb.index]:
+                if isinstance(stmt, gcc.GimpleCall) and stmt.fndecl:
+                    fsf = functions.get(stmt.fndecl.name)
+                    if fsf:
+                        yield stmt, fsf
+
+def parse_callsite(stmt, fsf):
+    """
+    Parse the format string at a callsite, returning the ParsedFormatString,
+    or None if it couldn't be (emitting a warning if the format string is
+    bad)
+    """
+    log('got call at %s', stmt.loc)
+    log(get_src_for_loc(stmt.loc))
+
+    if fsf.keywords_idx is not None:
+        check_keyword_array(stmt, fsf.keywords_idx)
+
+    # We expect the following args:
+    #   args[0]: PyObject *input_tuple
+    #   args[1]: char * format
+    #   args[2...]: output pointers
+
+    if len(stmt.args) >= fsf.format_idx:
+        fmt_string = get_format_string(stmt, fsf.format_idx)
+        if fmt_string:
+            log('fmt_string: %r', fmt_string)
+
+            # Figure out expected types, based on the format string...
+            try:
+                fmt = parse_format_string(fsf.parser, fmt_string,
+                                          fsf.with_size_t)
+            except FormatStringWarning:
+                err = sys.exc_info()[1]
+                err.emit_as_warning(stmt.loc)
+                return None
+            log('fmt: %r', fmt.args)
+            return fmt
+
+def compare_varargs(exp_types, varargs):
+    """
+    Compare the expected types from a format string against the varargs
+    at a callsite, returning NotEnoughVars or TooManyVars (the classes) if
+    there's the wrong number of them, or otherwise a list of the indices of
+    the varargs that have mismatching types
+    """
+    log('exp_types: %r', exp_types)
+    if len(varargs) < len(exp_types):
+        return NotEnoughVars
+    if len(varargs) > len(exp_types):
+        return TooManyVars
+    return [index
+            for index, ((exp_arg, exp_type), vararg)
+            in enumerate(zip(exp_types, varargs))
+            if not compatible_type(exp_type, vararg.type, actualarg=vararg)]
+
+def describe_mismatches(exp_types, result):
+    """
+    Get a dict mapping from the indices of the mismatching varargs in the
+    result of compare_varargs to descriptions of the types expected for them
+    """
+    if result in (NotEnoughVars, TooManyVars):
+        return {}
+    return dict((index, describe_type(exp_types[index][1]))
+                for index in result)
+
+def emit_callsite_warnings(stmt, fsf, fmt, varargs, result, exp_descs=None):
+    """
+    Emit the warnings for a callsite, given the result of compare_varargs
+    (and optionally, that of describe_mismatches, if the callsite wasn't the
+    one that was compared)
+    """
+    if result in (NotEnoughVars, TooManyVars):
+        result(fsf.funcname, fmt, varargs).emit_as_warning(stmt.loc)
+        return
+
+    exp_types = fmt.get_exp_types()
+    for index in result:
+        exp_arg, exp_type = exp_types[index]
+        vararg = varargs[index]
+        err = MismatchingType(fsf.funcname, fmt,
+                              index + fsf.varargs_idx + 1,
+                              exp_arg.code, exp_type, vararg,
+                              exp_descs[index] if exp_descs else None)
+        if hasattr(vararg, 'location'):
+            loc = vararg.location
+        else:
+            loc = stmt.loc
+        err.emit_as_warning(loc)
+
+def check_pyargs(fun, flat=None):
+    for stmt, fsf in iter_format_string_callsites(fun, flat):
+        if stmt.loc:
+            gcc.set_location(stmt.loc)
+        fmt = parse_callsite(stmt, fsf)
+        if fmt:
+            # ...then compare them against the actual types:
+            varargs = stmt.args[fsf.varargs_idx:]
+            result = compare_varargs(fmt.get_exp_types(), varargs)
+            emit_callsite_warnings(stmt, fsf, fmt, varargs, result)
+
+def _type_depends_on_arg(exp_type):
+    # Does compatible_type() look at the vararg itself, rather than just its
+    # type, for this expected type?
+    if isinstance(exp_type, tuple):
+        for exp in exp_type:
+            if _type_depends_on_arg(exp):
+                return True
+        return False
+    return isinstance(exp_type, (AwkwardType, NullPointer))
+
+def get_varargs_key(exp_types, varargs):
+    """
+    Get a hashable value that's equal for any two callsites for which
+    compare_varargs() will give the same result for the given expected
+    types
+    """
+    key = []
+    for (exp_arg, exp_type), vararg in zip(exp_types, varargs):
+        if _type_depends_on_arg(exp_type):
+            key.append((vararg.type, str(vararg)))
+        else:
+            key.append(vararg.type)
+    return (len(varargs), tuple(key))
+
+class PyArgsChecker(object):
+    """
+    Checks the calls to PyArg_ParseTuple, Py_BuildValue etc within each
+    function of a translation unit, like check_pyargs, but sharing the
+    results between all of the functions
+
+    The callsites are grouped by their format string and the types of their
+    varargs, and each group is only compared once; any warnings are then
+    emitted at each of the callsites in the group
+    """
+    def __init__(self):
+        # A dictionary mapping from (parser class, fmt_string, with_size_t,
+        # varargs key) to a (result of compare_varargs, result of
+        # describe_mismatches) pair, the latter being rendered at the
+        # callsite that was compared (since the cached ParsedFormatString is
+        # reset for each callsite):
+        self.results = {}
+
+    def check_function(self, fun, flat=None):
+        for stmt, fsf in iter_format_string_callsites(fun, flat):
+            if stmt.loc:
+                gcc.set_location(stmt.loc)
+            fmt = parse_callsite(stmt, fsf)
+            if fmt:
+                varargs = stmt.args[fsf.varargs_idx:]
+                exp_types = fmt.get_exp_types()
+                key = (fsf.parser, fmt.fmt_string, fsf.with_size_t,
+                       get_varargs_key(exp_types, varargs))
+                if key not in self.results:
+                    result = compare_varargs(exp_types, varargs)
+                    self.results[key] = (result,
+                                         describe_mismatches(exp_types,
+                                                             result))
+                result, exp_descs = self.results[key]
+                emit_callsite_warnings(stmt, fsf, fmt, varargs,
+                                       result, exp_descs)
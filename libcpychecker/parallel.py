@@ -0,0 +1,188 @@
+#   Copyright 2011, 2012 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2011, 2012 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+"""
+Running the refcount checker on several functions at once, in worker
+processes.
+
+The checker works directly on GCC's own data structures (via the gcc.*
+wrapper objects), which can't be pickled.  Instead, each function is
+analyzed in a child process forked from the compiler at the point where
+our GIMPLE pass sees the function: the fork gives the child a snapshot of
+the whole compiler's memory, including that function's CFG, types and
+declarations.
+
+The child sends back its GCC diagnostics as plain data, which the parent
+then emits, in the order in which the functions were submitted, once all
+of the children have finished (from our IPA pass).  Any files that the
+checker writes (HTML and JSON reports) are written directly by the child,
+other than the lines of a JSONL file shared by all of the functions, which
+the child passes back to be written out in that same order.
+"""
+
+import multiprocessing
+import os
+import sys
+import traceback
+
+import gcc
+
+from gccutils import check_isinstance
+from libcpychecker.diagnostics import CapturedDiagnostics, \
+    get_locations_for_function, get_locations_for_translation_unit
+from libcpychecker.utils import log, flush_log
+
+def get_multiprocessing_context():
+    # We need the "fork" start method, so that the child has a copy of the
+    # compiler's state:
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('fork')
+    return multiprocessing
+
+def _run_job(conn, fn, fun):
+    # Entrypoint within the child process.
+    # Capture GCC diagnostics rather than emitting them directly, so that
+    # the parent can emit them later:
+    result = None
+    with CapturedDiagnostics() as captured:
+        try:
+            result = fn(fun)
+            error = None
+        except:
+            error = traceback.format_exc()
+    flush_log()
+    conn.send((captured.diagnostics, error, result))
+    conn.close()
+
+class Job:
+    """
+    The analysis of one gcc.Function within a child process
+    """
+    def __init__(self, ctx, fn, fun):
+        self.fun = fun
+        self.locations = get_locations_for_function(fun)
+        self.diagnostics = None
+        self.error = None
+        self.result = None
+        self._conn, child_conn = ctx.Pipe(duplex=False)
+        self._process = ctx.Process(target=_run_job,
+                                    args=(child_conn, fn, fun))
+        # Avoid the child re-emitting any output we've buffered:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        flush_log()
+        self._process.start()
+        child_conn.close()
+
+    def wait(self):
+        if self.diagnostics is None:
+            try:
+                self.diagnostics, self.error, self.result = self._conn.recv()
+            except EOFError:
+                self.diagnostics = []
+                self.error = ('worker process for %s exited with code %s'
+                              % (self.fun.decl.name, self._process.exitcode))
+            self._process.join()
+            self._conn.close()
+
+    def is_done(self):
+        return self.diagnostics is not None or not self._process.is_alive()
+
+    def emit(self, tu_locations=None):
+        self.wait()
+        for d in self.diagnostics:
+            d.emit(self.locations, self.fun.start, tu_locations)
+        if self.error:
+            gcc.inform(self.fun.start,
+                       ('error within the reference-count checker: %s'
+                        % self.error))
+
+class WorkerPool:
+    """
+    Run a callback on gcc.Function instances within up to "jobs" child
+    processes at once, emitting their diagnostics in submission order when
+    finish() is called
+
+    The callback's return value (which must be picklable) is passed to
+    on_result(fun, result) in this process, if supplied, as each job
+    completes, and to on_emit(fun, result), if supplied, once the job's
+    diagnostics have been emitted (i.e. in submission order)
+    """
+    def __init__(self, fn, jobs=None, on_result=None, on_emit=None):
+        self.fn = fn
+        self.on_result = on_result
+        self.on_emit = on_emit
+        if jobs is not None and jobs < 0:
+            raise ValueError('jobs must be at least 0 (not %i)' % jobs)
+        if not jobs:
+            jobs = multiprocessing.cpu_count()
+        self.jobs = jobs
+        self._ctx = get_multiprocessing_context()
+        self._submitted = []
+        self._job_for_fun = {}
+
+    def _running(self):
+        return [job for job in self._submitted
+                if job.diagnostics is None]
+
+    def _wait(self, job):
+        if job.diagnostics is None:
+            job.wait()
+            if self.on_result and job.result is not None:
+                self.on_result(job.fun, job.result)
+
+    def submit(self, fun, wait_for=()):
+        """
+        Analyze the given gcc.Function in a child process, once the jobs for
+        any of the gcc.Function instances in "wait_for" have completed
+        """
+        check_isinstance(fun, gcc.Function)
+        for other in wait_for:
+            if other in self._job_for_fun:
+                self._wait(self._job_for_fun[other])
+        running = self._running()
+        while len(running) >= self.jobs:
+            # Wait for one to finish, favoring any that already have:
+            finished = [job for job in running if job.is_done()]
+            if finished:
+                self._wait(finished[0])
+            else:
+                self._wait(running[0])
+            running = self._running()
+        log('submitting %s to worker pool', fun)
+        job = Job(self._ctx, self.fn, fun)
+        self._submitted.append(job)
+        self._job_for_fun[fun] = job
+
+    def finish(self):
+        """
+        Wait for all of the jobs to complete, emitting their diagnostics
+        """
+        # The gcc.Location instances can't be sent back from the child
+        # processes, so the diagnostics are emitted at the equivalent ones
+        # within this process: those within each function, or within the
+        # declarations of the translation unit:
+        tu_locations = None
+        if self._submitted:
+            tu_locations = get_locations_for_translation_unit()
+        for job in self._submitted:
+            self._wait(job)
+            job.emit(tu_locations)
+            if self.on_emit and job.result is not None:
+                self.on_emit(job.fun, job.result)
+        self._submitted = []
+        self._job_for_fun = {}
@@ -30,16 +30,20 @@ from libcpychecker.attributes import fnnames_returning_borrowed_refs, \
     stolen_refs_by_fnname, fnnames_setting_exception, \
     fnnames_setting_exception_on_negative_result
 from libcpychecker.diagnostics import Reporter, Annotator, Note
+from libcpychecker.summaries import FunctionSummary, record_summary
 from libcpychecker.PyArg_ParseTuple import PyArgParseFmt, FormatStringWarning,\
     TypeCheckCheckerType, TypeCheckResultType, \
     ConverterCallbackType, ConverterResultType
 from libcpychecker.Py_BuildValue import PyBuildValueFmt, ObjectFormatUnit, \
     CodeSO, CodeN
+from libcpychecker.formatstrings import parse_format_string
 from libcpychecker.types import is_py3k, is_debug_build, get_PyObjectPtr, \
     get_Py_ssize_t
-from libcpychecker.utils import log
+from libcpychecker.utils import get_logger, Lazy
 from libcpychecker import compat
 
+log = get_logger('refcounts')
+
 def stmt_is_assignment_to_count(stmt):
     if hasattr(stmt, 'lhs'):
         if stmt.lhs:
@@ -51,13 +55,54 @@ def stmt_is_assignment_to_count(stmt):
                 if stmt.lhs.field.name == 'ob_refcnt':
                     return True
 
+# These are called for most statements, so cache their results, keyed by
+# gcc.Type (and, for the subclass check, by the layout of PyObject in the
+# Python.h being compiled against; see get_pyobject_layout):
+_type_is_pyobjptr_cache = {}
+_type_is_pyobjptr_subclass_cache = {}
+
+# The (gcc.RecordType, layout) pairs known to have the layout of a PyObject:
+pyobject_record_types = set()
+
+def get_pyobject_layout():
+    # Get a hashable description of what _type_is_pyobjptr_subclass looks
+    # for in the fields of a struct:
+    py3k = is_py3k()
+    if py3k:
+        return (py3k, False)
+    return (py3k, is_debug_build())
+
 def type_is_pyobjptr(t):
     assert t is None or isinstance(t, gcc.Type)
-    if str(t) == 'struct PyObject *':
-        return True
+    try:
+        return _type_is_pyobjptr_cache[t]
+    except KeyError:
+        result = _type_is_pyobjptr_cache[t] = (str(t) == 'struct PyObject *')
+        return result
 
 def type_is_pyobjptr_subclass(t):
     assert t is None or isinstance(t, gcc.Type)
+    layout = get_pyobject_layout()
+    key = (t, layout)
+    try:
+        return _type_is_pyobjptr_subclass_cache[key]
+    except KeyError:
+        result = _type_is_pyobjptr_subclass(t, layout)
+        if result:
+            pyobject_record_types.add((t.dereference, layout))
+        elif type_is_ptr_to_opaque_struct(t):
+            # The struct may yet be completed, so don't cache the result:
+            return result
+        _type_is_pyobjptr_subclass_cache[key] = result
+        return result
+
+def type_is_ptr_to_opaque_struct(t):
+    return (isinstance(t, gcc.PointerType)
+            and isinstance(t.dereference, gcc.RecordType)
+            and not [field for field in t.dereference.fields
+                     if isinstance(field, gcc.FieldDecl)])
+
+def _type_is_pyobjptr_subclass(t, layout):
     # It must be a pointer:
     if not isinstance(t, gcc.PointerType):
         return False
@@ -66,6 +111,10 @@ def type_is_pyobjptr_subclass(t):
     if not isinstance(t.dereference, gcc.RecordType):
         return False
 
+    # (e.g. a differently-qualified pointer to a struct we've already seen)
+    if (t.dereference, layout) in pyobject_record_types:
+        return True
+
     # Obtain the fields of the struct/class
     # For C++ "fields" will also contain a gcc.TypeDecl for the
     # type itself, and for any nested types (e.g. typedefs), so filter them
@@ -86,7 +135,8 @@ def type_is_pyobjptr_subclass(t):
 
     fieldnames = [f.name for f in fields]
 
-    if is_py3k():
+    py3k, debug_build = layout
+    if py3k:
         # For Python 3, the first field must be "ob_base", or it must be "PyObject":
         if str(t) == 'struct PyObject *':
             return True
@@ -96,7 +146,7 @@ def type_is_pyobjptr_subclass(t):
         # For Python 2, the first two fields must be "ob_refcnt" and "ob_type".
         # (In a debug build, these are preceded by _ob_next and _ob_prev)
         # FIXME: debug builds!
-        if is_debug_build():
+        if debug_build:
             if fieldnames[:4] != ['_ob_next', '_ob_prev',
                                   'ob_refcnt', 'ob_type']:
                 return False
@@ -319,6 +369,31 @@ class RefcountValue(AbstractValue):
                              external=WithinRange(get_Py_ssize_t().type, loc,
                                                   1, 1))
 
+    identity_matters = False
+
+    def get_fingerprint(self):
+        return AbstractValue.get_fingerprint(self) + \
+            (self.r_obj, self.relvalue, self.external.get_fingerprint())
+
+    def widen(self, v_prev):
+        # Only the bound on the external references can be widened: if the
+        # references owned by this function change each time around a loop,
+        # then there's a leak (or a premature release), which we don't want
+        # to hide by widening it away.  The State then never converges, and
+        # the looping path is eventually abandoned (see
+        # ExplodedNode.widen_at_loop), but the error is still reported, on
+        # the paths that leave the loop after each of the iterations
+        # analyzed before that:
+        if not isinstance(v_prev, RefcountValue):
+            return self
+        if self.relvalue != v_prev.relvalue:
+            return self
+        external = widen_range(self.external, v_prev.external)
+        if isinstance(external, ConcreteValue):
+            # (RefcountValue needs a WithinRange)
+            return self
+        return RefcountValue(self.loc, self.r_obj, self.relvalue, external)
+
     def get_min_value(self):
         return self.relvalue + self.external.minvalue
 
@@ -508,6 +583,9 @@ class CPython(Facet):
                         self.has_gil)
         return f_new
 
+    def get_fingerprint(self):
+        return (self.exception_rvalue.get_fingerprint(), self.has_gil)
+
     def init_for_function(self, fun):
         log('CPython.init_for_function(%r)', fun)
 
@@ -785,16 +863,19 @@ class CPython(Facet):
         # Claim a Region for the object:
         r_nonnull = self.state.make_heap_region(name, stmt)
 
+        # If the RefcountValue doesn't have a Region yet, associate it
+        # with that of the new object (making a new RefcountValue, as they
+        # are immutable):
+        if not v_refcount.r_obj:
+            v_refcount = RefcountValue(v_refcount.loc, r_nonnull,
+                                       v_refcount.relvalue,
+                                       v_refcount.external)
+
         # Set up ob_refcnt to the given value:
         r_ob_refcnt = self.state.make_field_region(r_nonnull,
                                              'ob_refcnt') # FIXME: this should be a memref and fieldref
         self.state.value_for_region[r_ob_refcnt] = v_refcount
 
-        # If the RefcountValue doesn't have a Region yet, associate it
-        # with that of the new object:
-        if not v_refcount.r_obj:
-            v_refcount.r_obj = r_nonnull
-
         # Ensure that the new object has a sane ob_type:
         if r_typeobj is None:
             # If no specific type object provided by caller, supply one:
@@ -896,6 +977,33 @@ class CPython(Facet):
         return self.state.make_transitions_for_fncall(stmt, fnmeta,
                                                       s_success, s_failure)
 
+    def make_transitions_for_summary(self, stmt, fnmeta, summary):
+        """
+        Generate the appropriate list of transitions for a call to a
+        function returning a PyObject* that we've already analyzed, using
+        its FunctionSummary
+        """
+        check_isinstance(fnmeta, FnMeta)
+        check_isinstance(summary, FunctionSummary)
+        if summary.returns == 'borrowed':
+            s_success = self.mkstate_borrowed_ref(stmt, fnmeta)
+        else:
+            s_success, nonnull = self.mkstate_new_ref(stmt,
+                                                      ('new ref from call to %s'
+                                                       % fnmeta.name))
+        if summary.sets_exception_on_null:
+            s_failure = self.mkstate_exception(stmt)
+        else:
+            s_failure = self.state.mkstate_concrete_return_of(stmt, 0)
+        if not summary.can_return_null:
+            return [self.state.mktrans_from_fncall_state(stmt, s_success,
+                                                         'succeeds', False)]
+        if not summary.can_return_nonnull:
+            return [self.state.mktrans_from_fncall_state(stmt, s_failure,
+                                                         'fails', False)]
+        return self.state.make_transitions_for_fncall(stmt, fnmeta,
+                                                      s_success, s_failure)
+
     def object_ptr_has_global_ob_type(self, v_object_ptr, vardecl_name):
         """
         Boolean: do we know that the given PyObject* has an ob_type matching
@@ -916,10 +1024,16 @@ class CPython(Facet):
         #  [...., (r_obj, v_ob_refcnt), ....]
         # corresponding to all of the PyObject* memory regions that we know
         # about, and their ob_refcnt values
-        for var in self.state.region_for_var:
-            check_isinstance(self.state.region_for_var[var], Region)
-            r_obj = self.state.region_for_var[var]
-
+        #
+        # This scans the whole of region_for_var, rather than keeping an
+        # index of the PyObject regions within each State: whether a region
+        # has an "ob_refcnt" field is recorded on the Region itself, which
+        # is shared by the States along every path, and so can change after
+        # a State has been copied; and the order in which the regions are
+        # yielded (and hence reported on) is that of region_for_var.  It's
+        # only needed at the end of each distinct path (see explore_traces),
+        # rather than at every transition.
+        for var, r_obj in self.state.region_for_var.items():
             log('considering ob_refcnt of %r', r_obj)
             check_isinstance(r_obj, Region)
 
@@ -1106,7 +1220,7 @@ class CPython(Facet):
             return UnknownValue.make(exptype.dereference, stmt.loc)
 
         def _handle_successful_parse(fmt):
-            exptypes = fmt.iter_exp_types()
+            exptypes = fmt.get_exp_types()
             for v_vararg, (unit, exptype) in zip(v_varargs, exptypes):
                 if 0:
                     print('v_vararg: %r' % v_vararg)
@@ -1121,7 +1235,8 @@ class CPython(Facet):
         fmt_string = v_fmt.as_string_constant()
         if fmt_string:
             try:
-                fmt = PyArgParseFmt.from_string(fmt_string, with_size_t)
+                fmt = parse_format_string(PyArgParseFmt, fmt_string,
+                                          with_size_t)
                 _handle_successful_parse(fmt)
             except FormatStringWarning:
                 pass
@@ -1311,7 +1426,7 @@ class CPython(Facet):
             """
             Returns a boolean: is success of the function possible?
             """
-            exptypes = fmt.iter_exp_types()
+            exptypes = fmt.get_exp_types()
             for v_vararg, (unit, exptype) in zip(v_varargs, exptypes):
                 if 0:
                     print('v_vararg: %r' % v_vararg)
@@ -1338,7 +1453,8 @@ class CPython(Facet):
         fmt_string = v_fmt.as_string_constant()
         if fmt_string:
             try:
-                fmt = PyBuildValueFmt.from_string(fmt_string, with_size_t)
+                fmt = parse_format_string(PyBuildValueFmt, fmt_string,
+                                          with_size_t)
                 if not _handle_successful_parse(fmt):
                     return [t_failure]
             except FormatStringWarning:
@@ -2639,7 +2755,7 @@ class CPython(Facet):
             """
             Returns a boolean: is success of the function possible?
             """
-            exptypes = fmt.iter_exp_types()
+            exptypes = fmt.get_exp_types()
             for v_vararg, (unit, exptype) in zip(fncall.varargs, exptypes):
                 if 0:
                     print('v_vararg: %r' % v_vararg)
@@ -2664,7 +2780,8 @@ class CPython(Facet):
         fmt_string = fncall.args[fmtargidx].as_string_constant()
         if fmt_string:
             try:
-                fmt = PyBuildValueFmt.from_string(fmt_string, with_size_t)
+                fmt = parse_format_string(PyBuildValueFmt, fmt_string,
+                                          with_size_t)
                 if not _handle_successful_parse(fmt):
                     on_success.is_possible = False
             except FormatStringWarning:
@@ -4201,13 +4318,122 @@ def warn_about_NULL_without_exception(v_return,
                        % v_return.value))
                 w.add_trace(trace, ExceptionStateAnnotator())
 
-def make_stmt_graph(fun):
-    stmtgraph = StmtGraph(fun, False, omit_complex_edges=True)
+def get_net_refcount(endstate, r_obj):
+    """
+    Get the change in the ob_refcnt of the given PyObject region within the
+    given end state, excluding the references from non-stack memory, or None
+    if this isn't known
+    """
+    if 'ob_refcnt' not in r_obj.fields:
+        return None
+    v_ob_refcnt = endstate.get_value_of_field_by_region(r_obj, 'ob_refcnt')
+    if not isinstance(v_ob_refcnt, RefcountValue):
+        return None
+    return (v_ob_refcnt.relvalue
+            - len(endstate.get_persistent_refs_for_region(r_obj)))
+
+def summarize_function(fun, traces):
+    """
+    Generate a FunctionSummary for the given gcc.Function from the complete
+    list of Trace instances through it, or None if we can't summarize it
+    """
+    check_isinstance(fun, gcc.Function)
+    returns_pyobject = type_is_pyobjptr_subclass(fun.decl.type.type)
+    return_kinds = set()
+    can_return_null = False
+    can_return_nonnull = False
+    sets_exception_on_null = True
+    sets_exception_on_negative = True
+    arg_kinds = {} # 1-based argindex -> set of net refcount changes
+
+    num_traces = 0
+    for trace in traces:
+        if trace.err:
+            # Traces that bail early are already reported as bugs; they
+            # tell us nothing about the function's normal behavior:
+            continue
+        endstate = trace.states[-1]
+        if endstate.not_returning:
+            continue
+        if not hasattr(endstate, 'cpython'):
+            return None
+        num_traces += 1
+
+        v_return = trace.return_value()
+        v_exc = endstate.cpython.exception_rvalue
+        exception_is_set = not (isinstance(v_exc, ConcreteValue)
+                                and v_exc.value == 0)
+        if returns_pyobject:
+            if isinstance(v_return, ConcreteValue) and v_return.value == 0:
+                can_return_null = True
+                if not exception_is_set:
+                    sets_exception_on_null = False
+            elif isinstance(v_return, PointerToRegion):
+                can_return_nonnull = True
+                return_kinds.add(get_net_refcount(endstate, v_return.region))
+            else:
+                # Could be either:
+                can_return_null = True
+                can_return_nonnull = True
+                sets_exception_on_null = False
+                return_kinds.add(None)
+        else:
+            if isinstance(v_return, ConcreteValue):
+                if v_return.value < 0 and not exception_is_set:
+                    sets_exception_on_negative = False
+            elif v_return is not None:
+                # Could be negative:
+                sets_exception_on_negative = False
+
+        for argindex, parm in enumerate(fun.decl.arguments):
+            if not type_is_pyobjptr_subclass(parm.type):
+                continue
+            v_parm = trace.states[0].eval_rvalue(parm, None)
+            if isinstance(v_parm, PointerToRegion):
+                kind = get_net_refcount(endstate, v_parm.region)
+            else:
+                kind = None
+            arg_kinds.setdefault(argindex + 1, set()).add(kind)
+
+    if num_traces == 0:
+        return None
+    if returns_pyobject and not (can_return_null or can_return_nonnull):
+        return None
+
+    if return_kinds == set([1]):
+        returns = 'new'
+    elif return_kinds == set([0]):
+        returns = 'borrowed'
+    else:
+        returns = None
+    stolen_args = [argindex
+                   for argindex, kinds in arg_kinds.items()
+                   if kinds == set([-1])]
+    return FunctionSummary(fun.decl.name,
+                           returns=returns,
+                           can_return_null=can_return_null,
+                           can_return_nonnull=can_return_nonnull,
+                           sets_exception_on_null=(returns_pyobject
+                                                   and sets_exception_on_null),
+                           sets_exception_on_negative=(not returns_pyobject
+                                                       and sets_exception_on_negative),
+                           stolen_args=stolen_args)
+
+def make_stmt_graph(fun, flat=None):
+    stmtgraph = StmtGraph(fun, False, omit_complex_edges=True, flat=flat)
     return stmtgraph
 
 def impl_check_refcounts(fun, dump_traces=False,
                          show_possible_null_derefs=False,
-                         maxtrans=256):
+                         maxtrans=256,
+                         merge_states=True,
+                         summarize=False,
+                         widen_loops=False,
+                         max_cpu_secs=None,
+                         max_memory_mb=None,
+                         degrade=False,
+                         report_budget=False,
+                         flat=None):
     """
     Inner implementation of the refcount checker, checking the refcounting
     behavior of a function, returning a Reporter instance.
@@ -4219,6 +4445,33 @@ def impl_check_refcounts(fun, dump_traces=False,
 
     dump_traces: bool: if True, dump information about the traces through
     the function to stdout (for self tests)
+
+    merge_states: bool: if True, paths that reach equivalent States at join
+    points are merged, so that the code after them is only interpreted
+    once, and each distinct end of a path is only checked once, with the
+    other paths to it counted as similar traces in its reports (see
+    explore_traces); if False, every path through the function is
+    interpreted and checked separately
+
+    summarize: bool: if True, record a FunctionSummary for the function (if
+    it was fully analyzed), for use when analyzing its callers
+
+    widen_loops: bool: if True, analyze loops by widening the state at each
+    loop until it converges, rather than only analyzing the first iteration
+    (see explore_traces)
+
+    max_cpu_secs, max_memory_mb: if not None, limits on the CPU time and
+    memory growth of the analysis, in addition to maxtrans (see Budget)
+
+    degrade: bool: if True, then on exceeding a limit, fall back to cheaper
+    strategies (merging states everywhere, then sampling paths), rather
+    than giving up on the function
+
+    report_budget: bool: if True, emit a note giving the resources that the
+    analysis consumed
+
+    flat: the gccutils.FlattenedCfg for fun.cfg, if the caller has already
+    built one within the current pass (otherwise, one is built)
     """
     # Abstract interpretation:
     # Walk the CFG, gathering the information we're interested in
@@ -4234,27 +4487,51 @@ def impl_check_refcounts(fun, dump_traces=False,
     if get_PyObject():
         facets['cpython'] = CPython
 
-    limits=Limits(maxtrans=maxtrans)
+    limits=Budget(maxtrans,
+                  max_cpu_secs=max_cpu_secs,
+                  max_memory_mb=max_memory_mb,
+                  degrade=degrade)
 
-    stmtgraph = make_stmt_graph(fun)
+    stmtgraph = make_stmt_graph(fun, flat)
     if 0:
         dot = stmtgraph.to_dot('foo')
         from gccutils import invoke_dot
         invoke_dot(dot)
 
     try:
-        traces = iter_traces(stmtgraph,
-                             facets,
-                             limits=limits)
+        traces = explore_traces(stmtgraph,
+                                facets,
+                                limits=limits,
+                                merge_states=merge_states,
+                                widen_loops=widen_loops)
     except TooComplicated:
         err = sys.exc_info()[1]
         gcc.inform(fun.start,
                    'this function is too complicated for the reference-count checker to fully analyze: not all paths were analyzed')
         traces = err.complete_traces
+        # Don't summarize the function from a partial set of traces:
+        summarize = False
+    else:
+        if limits.strategy == Budget.SAMPLE:
+            gcc.inform(fun.start,
+                       'this function is too complicated for the reference-count checker to fully analyze: only a sample of paths were analyzed')
+            summarize = False
+
+    log('budget: %s', Lazy(limits.describe))
+    if report_budget:
+        gcc.inform(fun.start,
+                   'reference-count checker used %s' % limits.describe())
+
+    if summarize:
+        traces = list(traces)
+        summary = summarize_function(fun, traces)
+        log('summary: %r', summary)
+        if summary:
+            record_summary(summary)
 
     if dump_traces:
         traces = list(traces)
-        dump_traces_to_stdout(traces)
+        dump_traces_to_stdout(list(iter_all_traces(traces)))
 
     # Debug dump of all traces in HTML form:
     if 0:
@@ -4275,9 +4552,33 @@ def impl_check_refcounts(fun, dump_traces=False,
 
     rep = Reporter()
 
+    # Traces that reach equivalent end states through different prefixes
+    # get the same end-of-function reports, so group them, running those
+    # checks once per group (on the first trace within it), and attaching
+    # the other traces of the group to the resulting reports as duplicates.
+    # (The reports describe objects in terms of the variables that pointed
+    # to them anywhere along the trace, so those descriptions are those of
+    # the first trace of the group, and are only computed for it):
+    traces = list(traces)
+    group_for_trace = {}
+    groups = {}
+    for trace in traces:
+        if trace.err:
+            continue
+        endstate = trace.states[-1]
+        key = (endstate.stmtnode,
+               endstate.get_gcc_loc(fun),
+               endstate.get_fingerprint())
+        group = groups.setdefault(key, [])
+        group.append(trace)
+        group_for_trace[trace] = group
+    log('%i traces reach %i distinct end states',
+        len(group_for_trace), len(groups))
+
     # Iterate through all traces, adding reports to the Reporter:
     for i, trace in enumerate(traces):
-        trace.log(log, 'TRACE %i' % i)
+        if log.enabled:
+            trace.log(log, 'TRACE %i' % i)
         if trace.err:
             # This trace bails early with a fatal error; it probably doesn't
             # have a return value
@@ -4297,6 +4598,7 @@ def impl_check_refcounts(fun, dump_traces=False,
 
             w = rep.make_warning(fun, trace.err.loc, str(trace.err))
             w.add_trace(trace)
+            w.add_duplicate_traces(trace.num_paths - 1)
             if hasattr(trace.err, 'why'):
                 if trace.err.why:
                     w.add_note(trace.err.loc,
@@ -4324,6 +4626,12 @@ def impl_check_refcounts(fun, dump_traces=False,
             # going away
             continue
 
+        group = group_for_trace[trace]
+        if group[0] is not trace:
+            # Already checked, as a duplicate of the first trace in the group:
+            continue
+        num_reports = len(rep.reports)
+
         # Check the refcount of all Python objects we know about:
         if hasattr(endstate, 'cpython'):
             for r_obj, v_ob_refcnt in endstate.cpython.iter_python_refcounts():
@@ -4345,16 +4653,41 @@ def impl_check_refcounts(fun, dump_traces=False,
         warn_about_NULL_without_exception(v_return,
                                           trace, endstate, fun, rep)
 
+        num_paths = sum(other.num_paths for other in group)
+        for report in rep.reports[num_reports:]:
+            report.add_duplicate_traces(num_paths - 1)
+
     # (all traces analysed)
 
     return rep
 
 
+def get_report_filenames(fun):
+    """
+    Get the names of the files that check_refcounts() writes its reports to
+    for the given gcc.Function (if it finds any problems), as a dict
+    mapping from 'json', 'html' and 'html_v2' to filenames
+    """
+    base = '%s.%s' % (gcc.get_dump_base_name(), fun.decl.name)
+    return dict(json='%s.json' % base,
+                html='%s-refcount-errors.html' % base,
+                html_v2='%s-refcount-errors.v2.html' % base)
+
 def check_refcounts(fun, dump_traces=False, show_traces=False,
                     show_possible_null_derefs=False,
                     show_timings=False,
                     maxtrans=256,
-                    dump_json=False):
+                    dump_json=False,
+                    summarize=False,
+                    merge_states=True,
+                    widen_loops=False,
+                    max_cpu_secs=None,
+                    max_memory_mb=None,
+                    degrade=False,
+                    report_budget=False,
+                    jsonl=None,
+                    html=True,
+                    flat=None):
     """
     The top-level function of the refcount checker, checking the refcounting
     behavior of a function
@@ -4367,6 +4700,28 @@ def check_refcounts(fun, dump_traces=False, show_traces=False,
     show_traces: bool: if True, display a diagram of the state transition graph
 
     show_timings: bool: if True, add timing information to stderr
+
+    summarize: bool: if True, record a FunctionSummary for the function, for
+    use when analyzing its callers
+
+    merge_states: bool: if True, reuse the analysis of equivalent States
+    (see impl_check_refcounts)
+
+    widen_loops: bool: if True, analyze loops until the state converges,
+    rather than only analyzing their first iteration
+
+    max_cpu_secs, max_memory_mb, degrade, report_budget: the budget for the
+    analysis (see impl_check_refcounts)
+
+    jsonl: a JsonlReportWriter, or None: if supplied, any reports are
+    appended to it, rather than written out as per-function JSON and HTML
+    files
+
+    html: bool: if False, only write out the JSON for any reports, leaving
+    the HTML to be rendered offline (see libcpychecker_html/batch.py)
+
+    flat: the gccutils.FlattenedCfg for fun.cfg, if the caller has already
+    built one within the current pass (otherwise, one is built)
     """
 
     log('check_refcounts(%r, %r, %r)', fun, dump_traces, show_traces)
@@ -4390,7 +4745,15 @@ def check_refcounts(fun, dump_traces=False, show_traces=False,
     rep = impl_check_refcounts(fun,
                                dump_traces,
                                show_possible_null_derefs,
-                               maxtrans)
+                               maxtrans,
+                               summarize=summarize,
+                               merge_states=merge_states,
+                               widen_loops=widen_loops,
+                               max_cpu_secs=max_cpu_secs,
+                               max_memory_mb=max_memory_mb,
+                               degrade=degrade,
+                               report_budget=report_budget,
+                               flat=flat)
 
     # Organize the Report instances into equivalence classes, simplifying
     # the list of reports:
@@ -4401,22 +4764,28 @@ def check_refcounts(fun, dump_traces=False, show_traces=False,
     # de-duplication
     rep.flush()
 
-    if rep.got_warnings():
+    if rep.got_warnings() and jsonl:
+        rep.jsonl_data = rep.to_json(fun)
+        jsonl.write(rep.jsonl_data)
+    elif rep.got_warnings() and not html:
+        filename = get_report_filenames(fun)['json']
+        rep.dump_json(fun, filename)
+        gcc.inform(fun.start,
+                   ('error report for function %r written out to %r'
+                    % (fun.decl.name, filename)))
+    elif rep.got_warnings():
+        filenames = get_report_filenames(fun)
         if dump_json:
             # JSON output:
-            filename = ('%s.%s.json'
-                    % (gcc.get_dump_base_name(), fun.decl.name))
-            rep.dump_json(fun, filename)
+            rep.dump_json(fun, filenames['json'])
 
-        filename = ('%s.%s-refcount-errors.html'
-                    % (gcc.get_dump_base_name(), fun.decl.name))
+        filename = filenames['html']
         rep.dump_html(fun, filename)
         gcc.inform(fun.start,
                    ('graphical error report for function %r written out to %r'
                     % (fun.decl.name, filename)))
 
-        filename_v2 = ('%s.%s-refcount-errors.v2.html'
-                       % (gcc.get_dump_base_name(), fun.decl.name))
+        filename_v2 = filenames['html_v2']
 
         from libcpychecker_html.make_html import HtmlPage
         data = rep.to_json(fun)
@@ -4425,6 +4794,7 @@ def check_refcounts(fun, dump_traces=False, show_traces=False,
         htmlfile.write(str(HtmlPage(srcfile, data)))
         htmlfile.close()
         srcfile.close()
+        rep.written_files.append(filename_v2)
 
 
     if show_timings:
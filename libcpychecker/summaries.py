@@ -0,0 +1,92 @@
+#   Copyright 2011, 2012 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2011, 2012 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+"""
+Summaries of the behavior of the functions that the refcount checker has
+analyzed, as seen by their callers.
+
+When functions are analyzed bottom-up over the callgraph, calls to functions
+that have already been analyzed can use the summary of the callee, rather
+than the generic "new reference or NULL with an exception" guess that's
+used for unknown functions (see State._get_transitions_for_GimpleCall)
+"""
+
+class FunctionSummary:
+    """
+    What a caller needs to know about a function, in terms of references
+    and exceptions
+    """
+    def __init__(self, fnname,
+                 returns=None,
+                 can_return_null=True,
+                 can_return_nonnull=True,
+                 sets_exception_on_null=False,
+                 sets_exception_on_negative=False,
+                 stolen_args=()):
+        self.fnname = fnname
+
+        # For functions returning PyObject* (or a subclass):
+        #   'new': non-NULL results are always new references
+        #   'borrowed': non-NULL results are always borrowed references
+        #   None: not known (or not a PyObject*)
+        self.returns = returns
+        self.can_return_null = can_return_null
+        self.can_return_nonnull = can_return_nonnull
+
+        # Is an exception always set when the function returns NULL
+        # (for PyObject*), or a negative value (for integer results)?
+        self.sets_exception_on_null = sets_exception_on_null
+        self.sets_exception_on_negative = sets_exception_on_negative
+
+        # The 1-based indices of the PyObject* arguments that the function
+        # steals a reference to:
+        self.stolen_args = frozenset(stolen_args)
+
+    def __repr__(self):
+        return ('FunctionSummary(%r, returns=%r, can_return_null=%r,'
+                ' can_return_nonnull=%r, sets_exception_on_null=%r,'
+                ' sets_exception_on_negative=%r, stolen_args=%r)'
+                % (self.fnname, self.returns, self.can_return_null,
+                   self.can_return_nonnull, self.sets_exception_on_null,
+                   self.sets_exception_on_negative, sorted(self.stolen_args)))
+
+    def as_json(self):
+        return dict(fnname=self.fnname,
+                    returns=self.returns,
+                    can_return_null=self.can_return_null,
+                    can_return_nonnull=self.can_return_nonnull,
+                    sets_exception_on_null=self.sets_exception_on_null,
+                    sets_exception_on_negative=self.sets_exception_on_negative,
+                    stolen_args=sorted(self.stolen_args))
+
+    @classmethod
+    def from_json(cls, jsonobj):
+        kwargs = dict((str(key), value) for key, value in jsonobj.items())
+        return cls(**kwargs)
+
+# A dictionary mapping from fnname to FunctionSummary:
+summaries_by_fnname = {}
+
+def record_summary(summary):
+    summaries_by_fnname[summary.fnname] = summary
+
+def get_summary(fnname):
+    """
+    Get the FunctionSummary for the function with the given name, or None
+    if it hasn't been analyzed (or couldn't be summarized)
+    """
+    return summaries_by_fnname.get(fnname)
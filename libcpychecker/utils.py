@@ -16,25 +16,160 @@
 #   <http://www.gnu.org/licenses/>.
 
 # Logging
+#
+# The log is split into subsystems ("absinterp", "refcounts", etc), each with
+# its own level (0 meaning disabled).  Each module logs via the Logger for
+# its subsystem, from get_logger().  Calling a Logger only expands the
+# message if the subsystem is enabled; wrap any expensive arguments in Lazy
+# so that they're only computed at that point.  Anything more expensive than
+# that (e.g. dumping a whole Trace) should be guarded with:
+#    if log.enabled:
+# so that the cost when logging is disabled is a single branch.
+#
+# Output goes to a file named after the dump base name, and is buffered.
+# The file is opened (and truncated) when logging is enabled, and written to
+# in append mode, so that worker processes forked from the compiler (see
+# parallel.py) can share it, flushing their output to it as they go.
 import sys
 
 import gcc
 
 logfile = None
 
+# Is any subsystem enabled?
 logging_enabled = False
 
-def log(msg, *args):
-    if logging_enabled:
-        # Only do the work of expanding the message if logging is enabled:
-        expanded_msg = msg % args
-        if 1:
-            global logfile
-            if not logfile:
-                filename = gcc.get_dump_base_name() + '.cpychecker-log.txt'
-                logfile = open(filename, 'w')
-            logfile.write(expanded_msg)
-            logfile.write('\n')
-        if 0:
-            sys.stderr.write(expanded_msg)
-            sys.stderr.write('\n')
+# Has the log been started (truncating any earlier one, and registering the
+# callback that flushes it at the end of the compilation)?  This is only done
+# by the first call to enable_logging() that enables anything:
+_log_started = False
+
+# Buffered lines of output:
+_pending = []
+FLUSH_THRESHOLD = 1000
+
+def _write(line):
+    _pending.append(line)
+    if len(_pending) >= FLUSH_THRESHOLD:
+        flush_log()
+
+def get_log_filename():
+    return gcc.get_dump_base_name() + '.cpychecker-log.txt'
+
+def flush_log():
+    """
+    Write out any buffered log output
+    """
+    global logfile
+    if not _pending:
+        return
+    if not logfile:
+        logfile = open(get_log_filename(), 'a')
+    logfile.write('\n'.join(_pending))
+    logfile.write('\n')
+    logfile.flush()
+    del _pending[:]
+
+class Lazy(object):
+    """
+    An argument to a Logger call that's only computed if the message is
+    actually expanded e.g.:
+        log('dir(stmt): %s', Lazy(dir, stmt))
+    """
+    __slots__ = ('fn', 'args')
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+    def __str__(self):
+        return str(self.fn(*self.args))
+
+    def __repr__(self):
+        return repr(self.fn(*self.args))
+
+class Logger(object):
+    """
+    The log for one subsystem
+    """
+    __slots__ = ('name', 'level', 'enabled')
+
+    def __init__(self, name):
+        self.name = name
+        self.set_level(0)
+
+    def set_level(self, level):
+        self.level = level
+        self.enabled = level > 0
+
+    def __call__(self, msg, *args):
+        if self.enabled:
+            # Only do the work of expanding the message if logging is
+            # enabled:
+            if args:
+                msg = msg % args
+            _write(msg)
+
+_loggers = {}
+
+def get_logger(name):
+    """
+    Get the Logger for the given subsystem
+    """
+    if name not in _loggers:
+        _loggers[name] = Logger(name)
+    return _loggers[name]
+
+# The Logger for code that isn't part of a more specific subsystem:
+log = get_logger('cpychecker')
+
+KNOWN_SUBSYSTEMS = ('cpychecker', 'absinterp', 'refcounts', 'formatstrings')
+
+def enable_logging(spec):
+    """
+    Enable logging, given a comma-separated list of subsystems, each
+    optionally with a level e.g.
+      "absinterp,refcounts:2"
+    The subsystem "all" enables all of them.
+
+    Raises ValueError for an unknown subsystem or an invalid level.
+    """
+    global logging_enabled, logfile, _log_started
+    # Parse the whole spec before changing anything:
+    levels = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if ':' in item:
+            name, level = item.split(':', 1)
+            try:
+                level = int(level)
+            except ValueError:
+                level = -1
+            if level < 0:
+                raise ValueError('invalid logging level for %r in %r:'
+                                 ' expected a non-negative integer'
+                                 % (name, item))
+        else:
+            name, level = item, 1
+        if name == 'all':
+            for name in KNOWN_SUBSYSTEMS:
+                levels.append((name, level))
+        elif name in KNOWN_SUBSYSTEMS:
+            levels.append((name, level))
+        else:
+            raise ValueError('unknown logging subsystem %r (expected one'
+                             ' of: %s)'
+                             % (name, ', '.join(KNOWN_SUBSYSTEMS + ('all', ))))
+    for name, level in levels:
+        get_logger(name).set_level(level)
+    logging_enabled = any(logger.enabled for logger in _loggers.values())
+    if logging_enabled and not _log_started:
+        _log_started = True
+        # Truncate any log from an earlier run now, before any worker
+        # processes are forked; later calls append to it:
+        open(get_log_filename(), 'w').close()
+        logfile = open(get_log_filename(), 'a')
+        gcc.register_callback(gcc.PLUGIN_FINISH,
+                              lambda *args, **kwargs: flush_log())
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""Render HTML reports for a whole project, offline.
+
+The compiler can be told to only write out the JSON data for its reports
+(see the --cpychecker-jsonl and --cpychecker-no-html options of
+gcc-with-cpychecker).  This script then turns any number of those files
+into HTML pages in one go, lexing each source file only once however many
+of its functions have reports, and writing the stylesheets, script and
+images once into a "static" directory that all of the pages link to,
+rather than embedding them within every page.
+
+Usage:
+    python -m libcpychecker_html.batch OUTDIR FILE [FILE ...]
+
+where each FILE is either a .jsonl file (one report per line), or a .json
+file (a single report).
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+#   Copyright 2011, 2012 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2011, 2012 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+import hashlib
+import os
+import shutil
+from json import loads
+
+from lxml.html import tostring, builder as E
+
+from .make_html import HERE, HtmlPage, HighlightedSource, open
+
+# The assets that pages link to, relative to both this directory and the
+# "static" directory of the output:
+STATIC_FILES = (
+    'extlib/reset-20110126.min.css',
+    'pygments_c.css',
+    'style.css',
+    'script.js',
+    'images/arrow-180.png',
+    'images/arrow.png',
+)
+
+
+def iter_reports(filename):
+    """Yield the report data from a .json or .jsonl file"""
+    with open(filename) as jsonfile:
+        if filename.endswith('.jsonl'):
+            for line in jsonfile:
+                if line.strip():
+                    yield loads(line)
+        else:
+            yield loads(jsonfile.read())
+
+
+class BatchRenderer(object):
+    """Render many reports into one output directory."""
+    def __init__(self, outdir):
+        self.outdir = outdir
+        # A mapping from source filename to HighlightedSource:
+        self.sources = {}
+        # A list of (data, page filename) pairs, for the index:
+        self.pages = []
+        # The page filenames used so far:
+        self.page_filenames = set()
+
+    def copy_static(self):
+        """Write the shared assets, once"""
+        for filename in STATIC_FILES:
+            dest = os.path.join(self.outdir, 'static', filename)
+            if not os.path.isdir(os.path.dirname(dest)):
+                os.makedirs(os.path.dirname(dest))
+            shutil.copyfile(os.path.join(HERE, filename), dest)
+
+    def find_source(self, data, jsondir):
+        """Locate the source file of a report.
+
+        Relative paths are relative to wherever the compiler was run from,
+        so try alongside the JSON file as well as the current directory.
+        """
+        filename = data['filename']
+        if not os.path.isabs(filename):
+            candidate = os.path.join(jsondir, filename)
+            if os.path.exists(candidate):
+                return candidate
+        return filename
+
+    def get_source(self, filename):
+        """Get the HighlightedSource for a file, lexing it only once"""
+        if filename not in self.sources:
+            with open(filename) as codefile:
+                self.sources[filename] = HighlightedSource(codefile)
+        return self.sources[filename]
+
+    def get_page_filename(self, data, srcpath):
+        """The name of the page for a report, within the output directory.
+
+        Source files in different directories can have the same name, so
+        the name of the source file is qualified by a hash of its full path.
+        A number is added if the name is still taken (e.g. by the same
+        function in a header, seen by more than one compilation).
+        """
+        path = os.path.abspath(srcpath)
+        digest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:8]
+        name = '%s-%s.%s' % (os.path.basename(path), digest,
+                             data['function']['name'])
+        filename = '%s.html' % name
+        count = 1
+        while filename in self.page_filenames:
+            count += 1
+            filename = '%s.%i.html' % (name, count)
+        self.page_filenames.add(filename)
+        return filename
+
+    def render(self, data, jsondir):
+        """Write out the page for one report"""
+        srcpath = self.find_source(data, jsondir)
+        source = self.get_source(srcpath)
+        page = HtmlPage(None, data, static_url='static/', source=source)
+        filename = self.get_page_filename(data, srcpath)
+        with open(os.path.join(self.outdir, filename), 'w') as htmlfile:
+            htmlfile.write('%s' % page)
+        self.pages.append((data, filename))
+
+    def write_index(self):
+        """Write an index page linking to all of the reports"""
+        items = E.UL()
+        for data, filename in sorted(self.pages,
+                                     key=lambda page: page[1]):
+            items.append(
+                E.LI(
+                    E.A(
+                        '%s: %s' % (data['filename'],
+                                    data['function']['name']),
+                        href=filename,
+                    ),
+                    ' (%i report(s))' % len(data['reports']),
+                )
+            )
+        html = E.HTML(
+            E.HEAD(
+                E.META({
+                    'http-equiv': 'Content-Type',
+                    'content': 'text/html; charset=utf-8'
+                }),
+                E.TITLE('GCC Python Plugin'),
+            ),
+            E.BODY(
+                E.H1('GCC Python Plugin'),
+                items,
+            ),
+        )
+        with open(os.path.join(self.outdir, 'index.html'), 'w') as indexfile:
+            indexfile.write('<!DOCTYPE html>\n' +
+                            tostring(html).decode('utf-8'))
+
+
+def main(argv):
+    """our entry point"""
+    if len(argv) < 3:
+        return "Please provide an output directory and json filenames."
+
+    renderer = BatchRenderer(argv[1])
+    renderer.copy_static()
+    for filename in argv[2:]:
+        jsondir = os.path.dirname(os.path.abspath(filename))
+        for data in iter_reports(filename):
+            renderer.render(data, jsondir)
+    renderer.write_index()
+    print('wrote %i page(s) to %s' % (len(renderer.pages), argv[1]))
+
+if __name__ == '__main__':
+    from sys import argv as ARGV
+    exit(main(ARGV))
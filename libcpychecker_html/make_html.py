@@ -33,7 +33,7 @@ from lxml.html import (
     tostring, fragment_fromstring as parse, builder as E
 )
 
-from pygments import highlight
+from pygments import highlight, format as format_tokens
 from pygments.lexers.compiled import CLexer
 from pygments.formatters.html import HtmlFormatter
 
@@ -52,10 +52,20 @@ def open(filename, mode='r'):  # pylint:disable=redefined-builtin
 
 
 class HtmlPage(object):
-    """Represent one html page."""
-    def __init__(self, codefile, data):
+    """Represent one html page.
+
+    By default, the page is self-contained, with all of its assets embedded
+    within it.  If static_url is given, the assets are instead linked to
+    beneath that URL (see batch.py, which shares them between pages).
+
+    If source is given, it's a HighlightedSource for the source file, which
+    is used instead of reading and lexing codefile.
+    """
+    def __init__(self, codefile, data, static_url=None, source=None):
         self.codefile = codefile
         self.data = data
+        self.static_url = static_url
+        self.source = source
 
     def __str__(self):
         html = tostring(self.__html__())
@@ -73,16 +83,32 @@ class HtmlPage(object):
             }),
             E.TITLE('%s -- GCC Python Plugin' % self.data['filename']),
         )
-        head.extend(
-            E.STYLE(
-                file_contents(css + '.css'),
-                media='screen',
-                type='text/css'
-            )
-            for css in ('extlib/reset-20110126.min', 'pygments_c', 'style')
-        )
+        for css in ('extlib/reset-20110126.min', 'pygments_c', 'style'):
+            if self.static_url is None:
+                head.append(
+                    E.STYLE(
+                        file_contents(css + '.css'),
+                        media='screen',
+                        type='text/css'
+                    )
+                )
+            else:
+                head.append(
+                    E.LINK(
+                        rel='stylesheet',
+                        href=self.static_url + css + '.css',
+                        media='screen',
+                        type='text/css'
+                    )
+                )
         return head
 
+    def image(self, mimetype, filename):
+        """The src of an image: either embedded, or linked to"""
+        if self.static_url is None:
+            return data_uri(mimetype, filename)
+        return self.static_url + filename
+
     def raw_code(self):
         """Get the correct lines from the code file"""
         first, last = self.data['function']['lines']
@@ -98,14 +124,21 @@ class HtmlPage(object):
             linenostart=self.data['function']['lines'][0],
         )
 
-        # <link rel="stylesheet", href="pygments_c.css", type="text/css">
-        open('pygments_c.css', 'w').write(formatter.get_style_defs())
-
-        # Use pygments to convert it all to HTML:
-        code = parse(highlight(self.raw_code(), CLexer(), formatter))
-
-        # linkify the python C-API functions
-        for name in code.xpath('//span[@class="n"]'):
+        if self.source is not None:
+            # Format the already-lexed lines:
+            first, last = self.data['function']['lines']
+            code = parse(format_tokens(self.source.get_tokens(first, last),
+                                       formatter))
+        else:
+            # <link rel="stylesheet", href="pygments_c.css", type="text/css">
+            open('pygments_c.css', 'w').write(formatter.get_style_defs())
+
+            # Use pygments to convert it all to HTML:
+            code = parse(highlight(self.raw_code(), CLexer(), formatter))
+
+        # linkify the python C-API functions (which newer versions of
+        # Pygments mark up as function names, rather than plain names):
+        for name in code.xpath('//span[@class="n" or @class="nf"]'):
             url = capi.get_url(name.text)
             if url is not None:
                 link = E.A(name.text, href=url)
@@ -154,21 +187,30 @@ class HtmlPage(object):
                 E.DIV(
                     E.ATTR(id='prev'),
                     E.IMG(
-                        src=data_uri('image/png', 'images/arrow-180.png'),
+                        src=self.image('image/png', 'images/arrow-180.png'),
                     ),
                 ),
                 E.DIV(
                     E.ATTR(id='next'),
                     E.IMG(
-                        src=data_uri('image/png', 'images/arrow.png'),
+                        src=self.image('image/png', 'images/arrow.png'),
                     ),
                 ),
             ),
         )
 
-    @staticmethod
-    def footer():
+    def footer(self):
         """put non-essential javascript in the footer"""
+        if self.static_url is not None:
+            script = E.SCRIPT(
+                src=self.static_url + 'script.js',
+                type='text/javascript',
+            )
+        else:
+            script = E.SCRIPT(
+                file_contents('script.js'),
+                type='text/javascript',
+            )
         return E.E.footer(
             # zepto is the one resource we don't embed.
             # It's (relatively) big, and non-essential.
@@ -179,10 +221,7 @@ class HtmlPage(object):
                 ),
                 type='text/javascript',
             ),
-            E.SCRIPT(
-                file_contents('script.js'),
-                type='text/javascript',
-            ),
+            script,
         )
 
     def states(self):
@@ -283,6 +322,33 @@ def file_contents(filename):
     return '\n' + open(join(HERE, filename)).read()
 
 
+class HighlightedSource(object):
+    """The Pygments tokens for each line of a source file.
+
+    The file is lexed once, so that the code of each of the functions within
+    it can be formatted without lexing it again.
+    """
+    def __init__(self, codefile):
+        # Don't strip leading newlines, which would throw off the line
+        # numbers:
+        lexer = CLexer(stripnl=False)
+        self.lines = [[]]
+        for ttype, value in lexer.get_tokens(codefile.read()):
+            # Split multi-line tokens (e.g. comments) at the line breaks:
+            for i, part in enumerate(value.split('\n')):
+                if i:
+                    self.lines[-1].append((ttype, '\n'))
+                    self.lines.append([])
+                if part:
+                    self.lines[-1].append((ttype, part))
+
+    def get_tokens(self, first, last):
+        """The tokens for the given range of lines (ONE-based, inclusive)"""
+        for line in self.lines[first - 1:last]:
+            for token in line:
+                yield token
+
+
 class CodeHtmlFormatter(HtmlFormatter):
     """Format our HTML!"""
 
@@ -0,0 +1,80 @@
+/*
+   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+   Copyright 2013 Red Hat, Inc.
+
+   This is free software: you can redistribute it and/or modify it
+   under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful, but
+   WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+   General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program.  If not, see
+   <http://www.gnu.org/licenses/>.
+*/
+
+
+/*
+  Verify that --cpychecker-batch-pyargs gives the same warnings as checking
+  each function separately, when a group of callsites with the same
+  format string and argument types spans more than one function, and the
+  description of the expected types depends on the arguments ("O!", "O&")
+*/
+#include <Python.h>
+
+extern int convert_to_int(PyObject *, int *);
+extern int convert_to_ssize(PyObject *, Py_ssize_t *);
+
+PyObject *
+test_first(PyObject *self, PyObject *args)
+{
+    PyLongObject *long_obj;
+    int i;
+
+    /* Incorrect: */
+    if (!PyArg_ParseTuple(args, "O!", &PyUnicode_Type, &long_obj)) {
+        return NULL;
+    }
+    if (!PyArg_ParseTuple(args, "O&", convert_to_ssize, &i)) {
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
+PyObject *
+test_second(PyObject *self, PyObject *args)
+{
+    PyLongObject *long_obj;
+    int i;
+
+    /* Correct, with different types for the same format strings: */
+    if (!PyArg_ParseTuple(args, "O!", &PyLong_Type, &long_obj)) {
+        return NULL;
+    }
+    if (!PyArg_ParseTuple(args, "O&", convert_to_int, &i)) {
+        return NULL;
+    }
+
+    /* The same incorrect calls as in test_first: */
+    if (!PyArg_ParseTuple(args, "O!", &PyUnicode_Type, &long_obj)) {
+        return NULL;
+    }
+    if (!PyArg_ParseTuple(args, "O&", convert_to_ssize, &i)) {
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
+/*
+  PEP-7
+Local variables:
+c-basic-offset: 4
+indent-tabs-mode: nil
+End:
+*/
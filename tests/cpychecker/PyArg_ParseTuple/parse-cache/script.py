@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import sys
+
+import gcc
+
+from libcpychecker.formatstrings import parse_format_string, \
+    FormatStringWarning
+from libcpychecker.PyArg_ParseTuple import PyArgParseFmt
+from libcpychecker.Py_BuildValue import PyBuildValueFmt
+
+def on_finish_unit():
+    # Hits and misses:
+    fmt = parse_format_string(PyArgParseFmt, 'O!O&', False)
+    print('same string: %s'
+          % (parse_format_string(PyArgParseFmt, 'O!O&', False) is fmt))
+    print('different with_size_t: %s'
+          % (parse_format_string(PyArgParseFmt, 'O!O&', True) is fmt))
+    print('different parser: %s'
+          % (parse_format_string(PyArgParseFmt, 'i', False)
+             is parse_format_string(PyBuildValueFmt, 'i', False)))
+
+    # Any state recorded when checking one callsite must not be seen when
+    # checking the next:
+    typecheck, conversion = fmt.args
+    typecheck.typeobject = gcc.Type.int()
+    conversion.callback.actual_type = gcc.Type.int()
+    conversion.result.type = gcc.Type.int()
+    fmt = parse_format_string(PyArgParseFmt, 'O!O&', False)
+    print('typeobject after reuse: %r' % typecheck.typeobject)
+    print('callback.actual_type after reuse: %r'
+          % conversion.callback.actual_type)
+    print('result.type after reuse: %r' % conversion.result.type)
+
+    # Bad format strings raise a fresh warning each time:
+    errs = []
+    for i in range(2):
+        try:
+            parse_format_string(PyArgParseFmt, 'Z', False)
+        except FormatStringWarning:
+            errs.append(sys.exc_info()[1])
+    print('warning: %s' % errs[0])
+    print('same warning: %s' % (errs[0] is errs[1]))
+    print('same message: %s' % (str(errs[0]) == str(errs[1])))
+
+gcc.register_callback(gcc.PLUGIN_FINISH_UNIT, on_finish_unit)
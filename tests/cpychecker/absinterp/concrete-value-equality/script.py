@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import gcc
+
+from libcpychecker.absinterp import ConcreteValue, UnknownValue
+
+class ConcreteValueEqualityTests(unittest.TestCase):
+    def assertConsistent(self, a, b):
+        # "!=" should always be the negation of "==":
+        self.assertEqual(a != b, not (a == b))
+        self.assertEqual(b != a, not (b == a))
+
+    def test_same_value(self):
+        a = ConcreteValue(gcc.Type.int(), None, 0)
+        b = ConcreteValue(gcc.Type.long(), None, 0)
+        self.assertTrue(a == b)
+        self.assertFalse(a != b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertConsistent(a, b)
+
+    def test_different_value(self):
+        a = ConcreteValue(gcc.Type.int(), None, 0)
+        b = ConcreteValue(gcc.Type.int(), None, 1)
+        self.assertFalse(a == b)
+        self.assertTrue(a != b)
+        self.assertConsistent(a, b)
+
+    def test_other_values(self):
+        a = ConcreteValue(gcc.Type.int(), None, 0)
+        b = UnknownValue.make(gcc.Type.int(), None)
+        self.assertFalse(a == b)
+        self.assertTrue(a != b)
+        self.assertConsistent(a, b)
+
+import sys
+sys.argv = ['foo', '-v']
+
+unittest.main()
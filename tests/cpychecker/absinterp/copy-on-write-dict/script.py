@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from collections import OrderedDict
+
+from libcpychecker.absinterp import CopyOnWriteDict, StoreSnapshot
+
+class CopyOnWriteDictTests(unittest.TestCase):
+    def assertSameAs(self, d, od):
+        # Verify that the CopyOnWriteDict has the same content as the
+        # OrderedDict, in the same order:
+        self.assertEqual(d.items(), list(od.items()))
+        self.assertEqual(d.keys(), list(od.keys()))
+        self.assertEqual(d.values(), list(od.values()))
+        self.assertEqual(list(d), list(od))
+        self.assertEqual(len(d), len(od))
+        for k in od:
+            self.assertTrue(k in d)
+            self.assertEqual(d[k], od[k])
+
+    def test_copies_are_independent(self):
+        d1 = CopyOnWriteDict()
+        d1['a'] = 1
+        d1['b'] = 2
+        d2 = d1.copy()
+        d2['a'] = 3
+        del d2['b']
+        d1['c'] = 4
+        self.assertSameAs(d1, OrderedDict([('a', 1), ('b', 2), ('c', 4)]))
+        self.assertSameAs(d2, OrderedDict([('a', 3)]))
+        self.assertRaises(KeyError, d2.__getitem__, 'b')
+        self.assertEqual(d2.get('c'), None)
+
+    def test_deletion_and_readding(self):
+        # Re-adding a deleted key moves it to the end, as for OrderedDict:
+        d = CopyOnWriteDict([('a', 1), ('b', 2), ('c', 3)])
+        d = d.copy()
+        del d['a']
+        d['a'] = 4
+        self.assertSameAs(d, OrderedDict([('b', 2), ('c', 3), ('a', 4)]))
+        self.assertRaises(KeyError, d.__delitem__, 'z')
+
+    def get_depth(self, d):
+        depth = 0
+        while d._parent is not None:
+            d = d._parent
+            depth += 1
+        return depth
+
+    def test_long_chain(self):
+        # A long chain of copies, each with a few changes, stays short:
+        d = CopyOnWriteDict()
+        od = OrderedDict()
+        for i in range(200):
+            d[i] = i
+            od[i] = i
+            if i % 3 == 0:
+                del d[i // 2]
+                del od[i // 2]
+            d = d.copy()
+            self.assertSameAs(d, od)
+            self.assertTrue(self.get_depth(d) <= 12)
+
+    def test_reading_leaves_layers_alone(self):
+        # Reading the entries walks the shared layers without modifying
+        # them:
+        d = CopyOnWriteDict()
+        for i in range(5):
+            d[i] = i
+            d = d.copy()
+        d1 = d.copy()
+        d2 = d.copy()
+        d1['x'] = 'x'
+        del d2[0]
+        layers = []
+        layer = d
+        while layer is not None:
+            layers.append((layer, list(layer._local.items())))
+            layer = layer._parent
+        self.assertSameAs(d1, OrderedDict([(0, 0), (1, 1), (2, 2), (3, 3),
+                                           (4, 4), ('x', 'x')]))
+        self.assertSameAs(d2, OrderedDict([(1, 1), (2, 2), (3, 3), (4, 4)]))
+        self.assertSameAs(d, OrderedDict([(0, 0), (1, 1), (2, 2), (3, 3),
+                                          (4, 4)]))
+        for layer, items in layers:
+            self.assertEqual(list(layer._local.items()), items)
+        self.assertTrue(d1._parent is d._parent)
+        self.assertTrue(d2._parent is d._parent)
+
+    def test_snapshots(self):
+        # Snapshots compare the entries regardless of their order, or of
+        # how the stores were built up:
+        d1 = CopyOnWriteDict([('a', 1), ('b', 2)])
+        d2 = d1.copy()
+        d2['c'] = 3
+        del d2['c']
+        d3 = CopyOnWriteDict([('b', 2), ('a', 0)])
+        d3 = d3.copy()
+        d3['a'] = 1
+        s1 = StoreSnapshot(d1)
+        self.assertEqual(s1, StoreSnapshot(d2))
+        self.assertEqual(hash(s1), hash(StoreSnapshot(d2)))
+        self.assertEqual(s1, StoreSnapshot(d3))
+        self.assertEqual(hash(s1), hash(StoreSnapshot(d3)))
+        self.assertNotEqual(s1, StoreSnapshot(CopyOnWriteDict([('a', 1)])))
+        # Later changes to the store don't affect an existing snapshot:
+        d1['a'] = 4
+        self.assertEqual(s1, StoreSnapshot(d2))
+        self.assertNotEqual(s1, StoreSnapshot(d1))
+
+import sys
+sys.argv = ['foo', '-v']
+
+unittest.main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from libcpychecker.absinterp import Facet, get_impl_dispatch
+from libcpychecker.refcounts import CPython
+
+class Libfoo(Facet):
+    def impl_foo_new(self, stmt):
+        pass
+
+    def impl_PyList_New(self, stmt, v_len):
+        pass
+
+class Libbar(Libfoo):
+    def impl_foo_new(self, stmt):
+        pass
+
+    def impl_bar_new(self, stmt):
+        pass
+
+class ImplTableTests(unittest.TestCase):
+    def test_table(self):
+        table = Libfoo.get_impl_table()
+        self.assertEqual(sorted(table.keys()), ['PyList_New', 'foo_new'])
+        self.assertEqual(table['foo_new'], Libfoo.impl_foo_new)
+
+        # The table is only built once per class:
+        self.assertTrue(Libfoo.get_impl_table() is table)
+
+    def test_subclass(self):
+        # A subclass gets its own table, including the inherited methods,
+        # and its overrides:
+        table = Libbar.get_impl_table()
+        self.assertEqual(sorted(table.keys()),
+                         ['PyList_New', 'bar_new', 'foo_new'])
+        self.assertEqual(table['foo_new'], Libbar.impl_foo_new)
+        self.assertEqual(table['PyList_New'], Libfoo.impl_PyList_New)
+        self.assertEqual(sorted(Libfoo.get_impl_table().keys()),
+                         ['PyList_New', 'foo_new'])
+
+    def test_cpython(self):
+        table = CPython.get_impl_table()
+        self.assertEqual(table['PyList_New'], CPython.impl_PyList_New)
+        self.assertFalse('foo_new' in table)
+
+    def test_dispatch(self):
+        # When more than one facet implements a function, the first facet
+        # is used:
+        from collections import OrderedDict
+        facets = OrderedDict([('cpython', CPython), ('libfoo', Libfoo)])
+        dispatch = get_impl_dispatch(facets)
+        self.assertEqual(dispatch['PyList_New'],
+                         ('cpython', CPython.impl_PyList_New))
+        self.assertEqual(dispatch['foo_new'],
+                         ('libfoo', Libfoo.impl_foo_new))
+        self.assertFalse('bar_new' in dispatch)
+
+        # The result is reused for the same facets:
+        self.assertTrue(get_impl_dispatch(OrderedDict(facets)) is dispatch)
+
+import sys
+sys.argv = ['foo', '-v']
+
+unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import os
+import unittest
+
+import gcc
+
+from libcpychecker import utils
+from libcpychecker.utils import enable_logging, flush_log, get_logger, \
+    get_log_filename
+
+class LoggingTests(unittest.TestCase):
+    def test_invalid_level(self):
+        self.assertRaises(ValueError, enable_logging, 'absinterp:verbose')
+        self.assertRaises(ValueError, enable_logging, 'absinterp:-1')
+        self.assertFalse(get_logger('absinterp').enabled)
+
+    def test_unknown_subsystem(self):
+        self.assertRaises(ValueError, enable_logging, 'absinterp,nonesuch')
+
+    def test_enable(self):
+        filename = get_log_filename()
+        with open(filename, 'w') as f:
+            f.write('output from an earlier run\n')
+        try:
+            enable_logging('refcounts:2, formatstrings')
+            self.assertEqual(get_logger('refcounts').level, 2)
+            self.assertTrue(get_logger('formatstrings').enabled)
+            self.assertFalse(get_logger('absinterp').enabled)
+
+            # The log is truncated when logging is enabled, and then
+            # appended to:
+            get_logger('refcounts')('first: %i', 1)
+            flush_log()
+            get_logger('absinterp')('not logged')
+            get_logger('formatstrings')('second')
+            flush_log()
+            with open(filename) as f:
+                self.assertEqual(f.read(), 'first: 1\nsecond\n')
+        finally:
+            enable_logging('all:0')
+            utils.logfile.close()
+            utils.logfile = None
+            os.unlink(filename)
+
+    def test_enable_twice(self):
+        # Only the first call truncates the log and registers the callback
+        # that flushes it; later calls append to it:
+        calls = []
+        register_callback = gcc.register_callback
+        gcc.register_callback = lambda *args: calls.append(args)
+        filename = get_log_filename()
+        utils._log_started = False
+        try:
+            enable_logging('refcounts')
+            get_logger('refcounts')('first')
+            flush_log()
+            enable_logging('absinterp')
+            get_logger('absinterp')('second')
+            flush_log()
+            with open(filename) as f:
+                self.assertEqual(f.read(), 'first\nsecond\n')
+            self.assertEqual(len(calls), 1)
+        finally:
+            gcc.register_callback = register_callback
+            enable_logging('all:0')
+            utils.logfile.close()
+            utils.logfile = None
+            os.unlink(filename)
+
+import sys
+sys.argv = ['foo', '-v']
+
+unittest.main()
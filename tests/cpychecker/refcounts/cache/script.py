@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import shutil
+import tempfile
+
+import gcc
+
+from libcpychecker.cache import ResultCache
+from libcpychecker.refcounts import check_refcounts
+
+class TestPass(gcc.GimplePass):
+    def execute(self, fun):
+        if fun:
+            cachedir = tempfile.mkdtemp()
+            try:
+                cache = ResultCache(cachedir)
+                # The first lookup misses, analyzing the function (and
+                # emitting the diagnostics as normal); the second hits,
+                # replaying them:
+                cache.check_function(fun, check_refcounts)
+                cache.check_function(fun, check_refcounts)
+            finally:
+                shutil.rmtree(cachedir)
+
+ps = TestPass(name='test-cache')
+ps.register_before('*warn_function_return')
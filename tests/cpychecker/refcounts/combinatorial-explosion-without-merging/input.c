@@ -0,0 +1,141 @@
+/*
+   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+   Copyright 2013 Red Hat, Inc.
+
+   This is free software: you can redistribute it and/or modify it
+   under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful, but
+   WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+   General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program.  If not, see
+   <http://www.gnu.org/licenses/>.
+*/
+
+
+#include <Python.h>
+
+/*
+  Verify that the refcount checker can cope with a function with many
+  sequential checks, each of which leads to the same state on both of its
+  paths, so that there are 2^24 paths through the function, but only a few
+  distinct states at each statement
+*/
+
+extern int get_flag(void);
+extern void note_flag(void);
+
+int
+test_sequential_checks(void)
+{
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    if (get_flag()) {
+        note_flag();
+    }
+
+    return 0;
+}
+
+/*
+  PEP-7
+Local variables:
+c-basic-offset: 4
+indent-tabs-mode: nil
+End:
+*/
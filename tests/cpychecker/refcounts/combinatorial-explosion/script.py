@@ -16,7 +16,11 @@
 #   along with this program.  If not, see
 #   <http://www.gnu.org/licenses/>.
 
+# The paths are explored separately, so that this exercises giving up part
+# of the way through them; see ../combinatorial-explosion-with-merging for
+# what happens when equivalent states are merged:
 from libcpychecker import main
 main(verify_refcounting=True,
      dump_traces=True,
-     show_traces=False)
+     show_traces=False,
+     merge_states=False)
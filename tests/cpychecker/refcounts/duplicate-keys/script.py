@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import gcc
+
+from libcpychecker.diagnostics import Reporter
+
+def make_reporter(fun, get_duplicate_key=None):
+    rep = Reporter(get_duplicate_key)
+    rep.make_warning(fun, fun.start, 'first message')
+    rep.make_warning(fun, fun.end, 'first message')
+    rep.make_warning(fun, fun.start, 'second message')
+    rep.make_warning(fun, fun.start, 'first message')
+    rep.make_warning(fun, fun.end, 'second message')
+    rep.make_warning(fun, fun.start, 'first message')
+    return rep
+
+def dump_reporter(title, rep):
+    # (the reports aren't flushed, so nothing is emitted to stderr)
+    print('%s:' % title)
+    for report in rep.reports:
+        print('  line %i: %r, with %i duplicate(s): %s'
+              % (report.loc.line - report.fun.start.line,
+                 report.msg,
+                 len(report.duplicates),
+                 [(dup.loc.line - report.fun.start.line, dup.msg)
+                  for dup in report.duplicates]))
+        assert not report.is_duplicate
+        for dup in report.duplicates:
+            assert dup.is_duplicate
+
+class TestPass(gcc.GimplePass):
+    def execute(self, fun):
+        if fun:
+            # The default key: the function, location and message:
+            rep = make_reporter(fun)
+            rep.remove_duplicates()
+            dump_reporter('default', rep)
+
+            # Key on the message alone:
+            rep = make_reporter(fun, lambda report: report.msg)
+            rep.remove_duplicates()
+            dump_reporter('by message', rep)
+
+            # Put every report in the same class:
+            rep = make_reporter(fun, lambda report: None)
+            rep.remove_duplicates()
+            dump_reporter('all the same', rep)
+
+ps = TestPass(name='test-duplicate-keys')
+ps.register_before('*warn_function_return')
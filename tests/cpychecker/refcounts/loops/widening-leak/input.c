@@ -0,0 +1,68 @@
+/*
+   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+   Copyright 2013 Red Hat, Inc.
+
+   This is free software: you can redistribute it and/or modify it
+   under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful, but
+   WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+   General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program.  If not, see
+   <http://www.gnu.org/licenses/>.
+*/
+
+#include <Python.h>
+
+/*
+  Verify that when widening the State at loops, a reference that's leaked
+  each time around a loop is still reported, even though the State never
+  converges, and that a loop with balanced references isn't reported
+*/
+
+PyObject *
+test_leak(PyObject *self, PyObject *args)
+{
+    int i, count;
+
+    if (!PyArg_ParseTuple(args, "i", &count)) {
+        return NULL;
+    }
+
+    for (i = 0; i < count; i++) {
+        /* BUG: leaks a reference to self on each iteration: */
+        Py_INCREF(self);
+    }
+
+    Py_RETURN_NONE;
+}
+
+PyObject *
+test_balanced(PyObject *self, PyObject *args)
+{
+    int i, count;
+
+    if (!PyArg_ParseTuple(args, "i", &count)) {
+        return NULL;
+    }
+
+    for (i = 0; i < count; i++) {
+        Py_INCREF(self);
+        Py_DECREF(self);
+    }
+
+    Py_RETURN_NONE;
+}
+
+/*
+  PEP-7
+Local variables:
+c-basic-offset: 4
+indent-tabs-mode: nil
+End:
+*/
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import gcc
+
+from libcpychecker.refcounts import impl_check_refcounts
+
+class TestPass(gcc.GimplePass):
+    def execute(self, fun):
+        if fun:
+            rep = impl_check_refcounts(fun, widen_loops=True)
+            # The exact number of iterations analyzed (and thus of the
+            # reports, and how far the refcount is out by in each) depends
+            # on MAX_WIDENINGS, so only print what was reported, and where:
+            msgs = set()
+            for report in rep.reports:
+                msgs.add((report.loc.line, report.msg.split(' is ')[0]))
+            print('%s:' % fun.decl.name)
+            for line, msg in sorted(msgs):
+                print('  %i: %s' % (line, msg))
+
+ps = TestPass(name='test-widening')
+ps.register_before('*warn_function_return')
@@ -0,0 +1,81 @@
+/*
+   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+   Copyright 2013 Red Hat, Inc.
+
+   This is free software: you can redistribute it and/or modify it
+   under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful, but
+   WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+   General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program.  If not, see
+   <http://www.gnu.org/licenses/>.
+*/
+
+#include <Python.h>
+
+/*
+  Verify the counts of similar traces when traces reaching equivalent end
+  states are checked once per group
+*/
+
+extern unsigned int get_flag(void);
+
+int
+test_counts(PyObject *obj)
+{
+    unsigned int i, j;
+
+    /* Both paths through here reach the same end state: */
+    i = get_flag();
+    if (i) {
+        i = 2;
+    }
+    i = 0;
+
+    /* Whereas these reach different end states, with the same report: */
+    j = get_flag();
+    if (j) {
+        j = 1;
+    }
+
+    /* BUG: leaks a reference to obj on all 4 paths: */
+    Py_INCREF(obj);
+    return j;
+}
+
+int
+test_descriptions(void)
+{
+    PyObject *p = NULL;
+    unsigned int i;
+
+    /*
+      Both paths through here reach the same end state, and so get a single
+      report, even though the object is only described in terms of "p" on
+      one of them (that of the first path):
+    */
+    i = get_flag();
+    if (i) {
+        p = Py_None;
+    }
+    i = 0;
+    p = NULL;
+
+    /* BUG: leaks a reference to None: */
+    Py_INCREF(Py_None);
+    return i;
+}
+
+/*
+  PEP-7
+Local variables:
+c-basic-offset: 4
+indent-tabs-mode: nil
+End:
+*/
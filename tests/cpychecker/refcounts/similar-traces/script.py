@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import gcc
+
+from libcpychecker.refcounts import impl_check_refcounts
+
+class TestPass(gcc.GimplePass):
+    def execute(self, fun):
+        if fun:
+            rep = impl_check_refcounts(fun)
+            rep.remove_duplicates()
+            print('%s:' % fun.decl.name)
+            for msg, count in sorted((report.msg,
+                                      report.get_num_similar_traces())
+                                     for report in rep.reports):
+                print('  %s (%i similar trace(s))' % (msg, count))
+
+ps = TestPass(name='test-similar-traces')
+ps.register_before('*warn_function_return')
@@ -0,0 +1,47 @@
+/*
+   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+   Copyright 2013 Red Hat, Inc.
+
+   This is free software: you can redistribute it and/or modify it
+   under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful, but
+   WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+   General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program.  If not, see
+   <http://www.gnu.org/licenses/>.
+*/
+
+
+/*
+  Verify that a struct that's incomplete when first checked isn't then
+  assumed not to be a PyObject subclass once it's complete (see script.py)
+*/
+
+struct Foo;
+
+extern struct Foo *early;
+
+/*
+  Without Python.h, the checker assumes the Python 3 layout, in which the
+  first field of a PyObject subclass is "ob_base":
+*/
+struct Foo {
+    int ob_base;
+    int i;
+};
+
+extern struct Foo *late;
+
+/*
+  PEP-7
+Local variables:
+c-basic-offset: 4
+indent-tabs-mode: nil
+End:
+*/
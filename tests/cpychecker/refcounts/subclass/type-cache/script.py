@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import gcc
+
+import libcpychecker.refcounts
+from libcpychecker.refcounts import type_is_pyobjptr_subclass
+
+def check_finish_decl(*args):
+    decl = args[0]
+    if isinstance(decl, gcc.VarDecl):
+        print('%s: %s' % (decl.name, type_is_pyobjptr_subclass(decl.type)))
+        if decl.name == 'late':
+            # The result also depends on which Python.h we're compiling
+            # against; verify that it isn't reused for the Python 2 layout:
+            libcpychecker.refcounts.is_py3k = lambda: False
+            libcpychecker.refcounts.is_debug_build = lambda: False
+            print('%s (Python 2): %s'
+                  % (decl.name, type_is_pyobjptr_subclass(decl.type)))
+
+gcc.register_callback(gcc.PLUGIN_FINISH_DECL, check_finish_decl)
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import gcc
+
+from libcpychecker import main
+from libcpychecker.summaries import summaries_by_fnname
+
+main(verify_refcounting=True,
+     summaries=True)
+
+def on_finish():
+    for fnname in sorted(summaries_by_fnname):
+        print(summaries_by_fnname[fnname])
+
+gcc.register_callback(gcc.PLUGIN_FINISH, on_finish)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import gcc
+import gccutils
+
+from libcpychecker.compat import on_finish_decl
+
+def check_finish_decl(*args):
+    decl = args[0]
+    # Ensure that there's an index, then see whether libcpychecker's
+    # callback discards it:
+    gccutils.get_symbol_index()
+    on_finish_decl(*args)
+    print('%s %s: %s'
+          % (decl.__class__.__name__,
+             decl.name,
+             'discarded' if gccutils._symbol_index is None else 'kept'))
+
+gcc.register_callback(gcc.PLUGIN_FINISH_DECL, check_finish_decl)
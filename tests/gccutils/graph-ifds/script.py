@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+# Verify the IFDS solver, using stub supergraphs rather than ones built from
+# real code
+
+import unittest
+
+from gccutils.graph import Graph
+from gccutils.graph.supergraph import SupergraphNode, CallNode, \
+    ReturnNode, SupergraphEdge, CallToReturnSiteEdge, CallToStart, \
+    ExitToReturnSite
+from gccutils.graph.ifds import IfdsProblem, IfdsSolver, ZERO
+
+class StubStmtNode(object):
+    # Stands in for a StmtNode
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+class StubStmtGraph(object):
+    # Stands in for a StmtGraph; "fun" is just the name of the function
+    def __init__(self, fun):
+        self.fun = fun
+        self.entry = StubStmtNode('%s.entry' % fun)
+        self.exit = StubStmtNode('%s.exit' % fun)
+        self.supernode_for_stmtnode = {}
+
+class StubSupergraph(Graph):
+    """
+    A supergraph of functions consisting of just an entry, an exit, and
+    the given calls between them
+    """
+    def __init__(self):
+        Graph.__init__(self)
+        self.stmtg_for_fun = {}
+        self.entry_nodes = []
+
+    def _make_edge(self, srcnode, dstnode, cls, edge):
+        return cls(srcnode, dstnode, edge)
+
+    def add_function(self, fun, callees=(), is_entry=False):
+        stmtg = StubStmtGraph(fun)
+        self.stmtg_for_fun[fun] = stmtg
+        entry = self._add_supernode(SupergraphNode, stmtg, stmtg.entry)
+        exit = self._add_supernode(SupergraphNode, stmtg, stmtg.exit)
+        prev = entry
+        for i, callee in enumerate(callees):
+            callnode = self.add_node(
+                CallNode(StubStmtNode('%s.call%i' % (fun, i)), stmtg))
+            returnnode = self.add_node(
+                ReturnNode(StubStmtNode('%s.return%i' % (fun, i)), stmtg))
+            callnode.returnnode = returnnode
+            returnnode.callnode = callnode
+            self.add_edge(prev, callnode, SupergraphEdge, None)
+            self.add_edge(callnode, returnnode, CallToReturnSiteEdge, None)
+            calleestmtg = self.stmtg_for_fun[callee]
+            self.add_edge(
+                callnode,
+                calleestmtg.supernode_for_stmtnode[calleestmtg.entry],
+                CallToStart, None)
+            self.add_edge(
+                calleestmtg.supernode_for_stmtnode[calleestmtg.exit],
+                returnnode,
+                ExitToReturnSite, None)
+            prev = returnnode
+        self.add_edge(prev, exit, SupergraphEdge, None)
+        if is_entry:
+            self.entry_nodes.append(entry)
+        return stmtg
+
+    def _add_supernode(self, cls, stmtg, stmtnode):
+        node = self.add_node(cls(stmtnode, stmtg))
+        stmtg.supernode_for_stmtnode[stmtnode] = node
+        return node
+
+    def get_entry_nodes(self):
+        return self.entry_nodes
+
+    def get_stmtgraph(self, fun):
+        return self.stmtg_for_fun[fun]
+
+def get_entry(stmtg):
+    return stmtg.supernode_for_stmtnode[stmtg.entry]
+
+def get_exit(stmtg):
+    return stmtg.supernode_for_stmtnode[stmtg.exit]
+
+class ArgumentProblem(IfdsProblem):
+    """
+    Each caller generates a fact named after it at its entry, and passes it
+    to the functions that it calls, getting back a "returned" version of
+    whatever reaches the exit of the callee
+    """
+    def __init__(self):
+        # A dict mapping from fact to the number of times that it's been
+        # passed to flow() for an edge within the "identity" function:
+        self.identity_flows = {}
+
+    def flow(self, edge, fact):
+        if edge.srcnode.function == 'identity' and fact is not ZERO:
+            self.identity_flows[fact] = self.identity_flows.get(fact, 0) + 1
+        if fact is ZERO:
+            if (edge.srcnode.function != 'identity'
+                and edge.srcnode is get_entry(edge.srcnode.stmtg)):
+                return [edge.srcnode.function]
+        return [fact]
+
+    def call_flow(self, edge, fact):
+        if fact == edge.srcnode.function:
+            return [fact]
+        return []
+
+    def return_flow(self, edge, callnode, callfact, fact):
+        if fact is ZERO:
+            return []
+        return ['returned %s' % fact]
+
+class IfdsTests(unittest.TestCase):
+    def setUp(self):
+        #   first:  entry ─> call0 ─> return0 ─> call1 ─> return1 ─> exit
+        #   second: entry ─> call0 ─> return0 ─> exit
+        # where each of the calls are of:
+        #   identity: entry ─> exit
+        self.sg = StubSupergraph()
+        self.identity = self.sg.add_function('identity')
+        self.first = self.sg.add_function('first',
+                                          ['identity', 'identity'],
+                                          is_entry=True)
+        self.second = self.sg.add_function('second',
+                                           ['identity'],
+                                           is_entry=True)
+        self.problem = ArgumentProblem()
+        self.solver = IfdsSolver(self.sg, self.problem)
+        self.solver.solve()
+
+    def test_facts_per_caller(self):
+        # Each caller only gets back what it passed in:
+        self.assertEqual(self.solver.get_facts_at(get_exit(self.first)),
+                         set(['first', 'returned first']))
+        self.assertEqual(self.solver.get_facts_at(get_exit(self.second)),
+                         set(['second', 'returned second']))
+        self.assertEqual(self.solver.get_facts_at(get_exit(self.identity)),
+                         set(['first', 'second']))
+
+    def test_facts_at_return_sites(self):
+        for callnode in self.sg.nodes:
+            if isinstance(callnode, CallNode):
+                caller = callnode.function
+                self.assertEqual(
+                    self.solver.get_facts_at(callnode.returnnode),
+                    set([caller, 'returned %s' % caller]))
+
+    def test_summaries(self):
+        self.assertEqual(self.solver.get_summary('identity', 'first'),
+                         set(['first']))
+        self.assertEqual(self.solver.get_summary('identity', 'second'),
+                         set(['second']))
+        self.assertEqual(self.solver.get_summary('identity', 'other'),
+                         set())
+
+    def test_summary_reuse(self):
+        # "first" calls "identity" twice with the same fact, but the
+        # function is only analyzed once for it, with the summary being
+        # applied at the second call:
+        self.assertEqual(self.problem.identity_flows,
+                         {'first': 1, 'second': 1})
+
+import sys
+sys.argv = ['foo', '-v']
+unittest.main()
@@ -0,0 +1,60 @@
+/*
+   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+   Copyright 2013 Red Hat, Inc.
+
+   This is free software: you can redistribute it and/or modify it
+   under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful, but
+   WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+   General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program.  If not, see
+   <http://www.gnu.org/licenses/>.
+*/
+
+
+/*
+  Verify that chained queries on a supergraph find the same nodes as a full
+  scan (see script.py)
+*/
+
+extern int external_function(int);
+
+static int
+leaf(int i)
+{
+    int total = 0;
+    total += external_function(i);
+    return total;
+}
+
+int
+helper(int i)
+{
+    int total = 42;
+    if (i > 0) {
+        total = leaf(i);
+    }
+    return total;
+}
+
+int
+test_caller(int i)
+{
+    int total = 0;
+    total = helper(i) + helper(i - 1);
+    return total;
+}
+
+/*
+  PEP-7
+Local variables:
+c-basic-offset: 4
+indent-tabs-mode: nil
+End:
+*/
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import gcc
+
+from gccutils.graph.query import Query
+from gccutils.graph.supergraph import Supergraph, LazySupergraph
+
+def make_queries(sg):
+    q = Query(sg)
+    return [q.get_calls_of('leaf'),
+            q.get_calls_of('external_function'),
+            q.assigning_to('total'),
+            q.assigning_constant(0),
+            q.within('helper'),
+            q.within('helper').get_calls_of('leaf'),
+            q.get_calls_of('leaf').within('test_caller'),
+            q.assigning_to('total').assigning_constant(42),
+            q.assigning_constant(0).within('leaf'),
+            q.within('helper').assigning_constant(0),
+            q.within('leaf').within('helper')]
+
+def full_scan(sg, query):
+    return set(node for node in list(sg.nodes) if query.matches(node))
+
+def get_names(funs):
+    return sorted(fun.decl.name for fun in funs)
+
+class TestPass(gcc.SimpleIpaPass):
+    def execute(self):
+        # (the functions are in SSA form by this point, as assigning_to()
+        # expects)
+        sg = Supergraph(split_phi_nodes=False, add_fake_entry_node=False)
+        for query in make_queries(sg):
+            result = set(query)
+            print('%s: found: %s, same as full scan: %s'
+                  % (query, len(result) > 0,
+                     result == full_scan(sg, query)))
+
+        # within() on a LazySupergraph only builds the functions that it
+        # names, but finds the same nodes:
+        lazy = LazySupergraph(split_phi_nodes=False, add_fake_entry_node=False)
+        query = Query(lazy).within('helper').assigning_to('total')
+        result = set(query)
+        print('lazy: %s: found: %s' % (query, len(result) > 0))
+        print('lazy: built: %s' % get_names(lazy.stmtg_for_fun))
+        # An unfiltered query builds the whole of the graph:
+        expected = set(node for node in Query(lazy) if query.matches(node))
+        print('lazy: built: %s' % get_names(lazy.stmtg_for_fun))
+        print('lazy: same as full scan: %s' % (result == expected))
+
+        # ...as does any other lookup, after which every query matches a
+        # full scan:
+        lazy = LazySupergraph(split_phi_nodes=False, add_fake_entry_node=False)
+        ok = True
+        for query in make_queries(lazy):
+            if set(query) != full_scan(lazy, query):
+                ok = False
+        print('lazy: all queries same as full scan: %s' % ok)
+
+ps = TestPass(name='test-graph-query')
+ps.register_before('whole-program')
@@ -81,6 +81,62 @@ def add_cycle(g, length):
     g.add_edge(last, first)
     return first
 
+class CompactGraphTests(unittest.TestCase):
+    def test_fork(self):
+        #  a ─> b─┬─> c
+        #         └─> d
+        g, a, b, ab = make_trivial_graph()
+        c = g.add_node(NamedNode('c'))
+        bc = g.add_edge(b, c)
+        d = g.add_node(NamedNode('d'))
+        bd = g.add_edge(b, d)
+        g.compact()
+        self.assertEqual(a.preds, ())
+        self.assertEqual(a.succs, (ab, ))
+        self.assertEqual(b.preds, (ab, ))
+        self.assertEqual(set(b.succs), set([bc, bd]))
+        self.assertEqual(c.preds, (bc, ))
+        self.assertEqual(c.succs, ())
+        self.assertEqual(set(g.adjacency.nodes[i]
+                             for i in g.adjacency.iter_succ_node_ids(b._index)),
+                         set([c, d]))
+
+    def test_changes_after_compaction(self):
+        g, a, b, ab = make_trivial_graph()
+        g.compact()
+        c = g.add_node(NamedNode('c'))
+        bc = g.add_edge(b, c)
+        self.assertEqual(g.adjacency, None)
+        self.assertEqual(b.preds, set([ab]))
+        self.assertEqual(b.succs, set([bc]))
+
+    def test_long_path(self):
+        LENGTH = 1000
+        g = Graph()
+        first, last = add_long_path(g, LENGTH)
+        g.compact()
+        path = g.get_shortest_path(first, last)
+        self.assertEqual(len(path), LENGTH)
+
+    def test_reachability(self):
+        # The ReachabilityIndex of a compacted graph is built from its
+        # arrays:
+        LENGTH = 5
+        g = Graph()
+        a = add_cycle(g, LENGTH)
+        b = add_cycle(g, LENGTH)
+        c = add_cycle(g, LENGTH)
+        ab = g.add_edge(a, b)
+        bc = g.add_edge(b, c)
+        g.compact()
+        self.assertTrue(g.is_reachable(a, c))
+        self.assertFalse(g.is_reachable(c, a))
+        self.assertFalse(g.is_reachable(b, a))
+        for edge in c.succs:
+            self.assertTrue(g.is_reachable(edge.dstnode, c))
+        self.assertEqual(g.get_shortest_path(a, c), [ab, bc])
+        self.assertEqual(g.get_shortest_path(c, a), None)
+
 class GraphTests(unittest.TestCase):
     def test_to_dot(self):
         g, a, b, ab = make_trivial_graph()
@@ -109,7 +165,12 @@ class PathfindingTests(unittest.TestCase):
         b = g.add_node(Node())
         # no edges between them
         path = g.get_shortest_path(a, b)
-        self.assertEqual(path, []) # FIXME: shouldn't this be None?
+        self.assertEqual(path, None)
+
+    def test_same_node(self):
+        g, a, b, ab = make_trivial_graph()
+        path = g.get_shortest_path(a, a)
+        self.assertEqual(path, [])
 
     def test_trivial_path(self):
         g, a, b, ab = make_trivial_graph()
@@ -165,6 +226,60 @@ class PathfindingTests(unittest.TestCase):
         self.assertEqual(p1, be)
         self.assertEqual(p2, ef)
 
+class ReachabilityTests(unittest.TestCase):
+    def test_trivial(self):
+        g, a, b, ab = make_trivial_graph()
+        self.assertTrue(g.is_reachable(a, b))
+        self.assertFalse(g.is_reachable(b, a))
+        self.assertTrue(g.is_reachable(a, a))
+
+    def test_cycles(self):
+        LENGTH = 5
+        g = Graph()
+        a = add_cycle(g, LENGTH)
+        b = add_cycle(g, LENGTH)
+        c = add_cycle(g, LENGTH)
+        g.add_edge(a, b)
+        g.add_edge(b, c)
+        self.assertTrue(g.is_reachable(a, c))
+        self.assertFalse(g.is_reachable(c, a))
+        for edge in c.succs:
+            self.assertTrue(g.is_reachable(edge.dstnode, c))
+
+    def test_diamond(self):
+        # Verify that it copes with paths that aren't on the spanning tree:
+        #  a ─┬─> b ─┬─> d
+        #     └─> c ─┘
+        #  e ─> c
+        g = Graph()
+        a, b, c, d, e = [g.add_node(NamedNode(name))
+                         for name in 'abcde']
+        g.add_edge(a, b)
+        g.add_edge(a, c)
+        g.add_edge(b, d)
+        g.add_edge(c, d)
+        g.add_edge(e, c)
+        self.assertTrue(g.is_reachable(a, d))
+        self.assertTrue(g.is_reachable(e, d))
+        self.assertFalse(g.is_reachable(e, b))
+        self.assertFalse(g.is_reachable(b, c))
+        self.assertFalse(g.is_reachable(d, a))
+
+    def test_changes(self):
+        g, a, b, ab = make_trivial_graph()
+        self.assertFalse(g.is_reachable(b, a))
+        self.assertEqual(g.get_shortest_path(b, a), None)
+        ba = g.add_edge(b, a)
+        self.assertTrue(g.is_reachable(b, a))
+        self.assertEqual(g.get_shortest_path(b, a), [ba])
+
+    def test_long_path(self):
+        LENGTH = 1000
+        g = Graph()
+        first, last = add_long_path(g, LENGTH)
+        self.assertTrue(g.is_reachable(first, last))
+        self.assertFalse(g.is_reachable(last, first))
+
 import sys
 sys.argv = ['foo', '-v']
 
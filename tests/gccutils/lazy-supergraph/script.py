@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import gcc
+
+from gccutils.graph.supergraph import Supergraph, LazySupergraph
+
+def describe_node(node):
+    if node.function:
+        return (node.__class__.__name__, node.function.decl.name, str(node))
+    return (node.__class__.__name__, None, str(node))
+
+def describe_edge(edge):
+    return (edge.__class__.__name__,
+            describe_node(edge.srcnode),
+            describe_node(edge.dstnode))
+
+def describe_function(sg, fun):
+    # Get sorted lists describing the nodes within the function, and the
+    # edges to and from them:
+    nodes = list(sg.iter_nodes_within(fun))
+    edges = set()
+    for node in nodes:
+        edges.update(node.preds)
+        edges.update(node.succs)
+    return (sorted(describe_node(node) for node in nodes),
+            sorted(describe_edge(edge) for edge in edges))
+
+def get_names(funs):
+    return sorted(fun.decl.name for fun in funs)
+
+class TestPass(gcc.SimpleIpaPass):
+    def execute(self):
+        eager = Supergraph(split_phi_nodes=False, add_fake_entry_node=True)
+        lazy = LazySupergraph(split_phi_nodes=False, add_fake_entry_node=True)
+        print('functions: %s' % get_names(lazy.get_functions()))
+
+        helper = lazy.get_functions_by_name('helper')[0]
+        exp_nodes, exp_edges = describe_function(eager, helper)
+
+        # Building just one function only adds its nodes, and none of the
+        # edges to the functions that haven't been built yet:
+        nodes, edges = describe_function(lazy, helper)
+        print('built: %s' % get_names(lazy.stmtg_for_fun))
+        print('nodes match: %s' % (nodes == exp_nodes))
+        print('intraprocedural edges match: %s'
+              % (edges == [edge for edge in exp_edges
+                           if edge[1][1] == edge[2][1] == 'helper']))
+
+        # Once everything that can reach it or be reached from it has been
+        # built, so have all of the edges:
+        for node in lazy.get_entry_nodes():
+            pass
+        print('built: %s' % get_names(lazy.stmtg_for_fun))
+        nodes, edges = describe_function(lazy, helper)
+        print('nodes match: %s' % (nodes == exp_nodes))
+        print('edges match: %s' % (edges == exp_edges))
+
+ps = TestPass(name='test-lazy-supergraph')
+ps.register_before('*free_lang_data')
@@ -0,0 +1,48 @@
+/*
+   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+   Copyright 2013 Red Hat, Inc.
+
+   This is free software: you can redistribute it and/or modify it
+   under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful, but
+   WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+   General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program.  If not, see
+   <http://www.gnu.org/licenses/>.
+*/
+
+
+/*
+  Verify that gcc.Cfg.get_flattened() gives the same blocks, statements and
+  edges as walking the CFG attribute by attribute (see script.py)
+*/
+
+int
+test_function(int a, int b)
+{
+    int i;
+    int total = 0;
+
+    for (i = 0; i < a; i++) {
+        if (i == b) {
+            continue;
+        }
+        total += i;
+    }
+
+    return total;
+}
+
+/*
+  PEP-7
+Local variables:
+c-basic-offset: 4
+indent-tabs-mode: nil
+End:
+*/
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#   Copyright 2013 David Malcolm <dmalcolm@redhat.com>
+#   Copyright 2013 Red Hat, Inc.
+#
+#   This is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see
+#   <http://www.gnu.org/licenses/>.
+
+import gcc
+
+from gccutils import FlattenedCfg
+
+def on_pass_execution(p, fn):
+    if p.name == '*warn_function_return':
+        assert isinstance(fn, gcc.Function)
+        print('fn: %r' % fn)
+
+        blocks, stmts, edges = fn.cfg.get_flattened()
+
+        # Compare against the result of walking the CFG attribute by
+        # attribute:
+        exp_stmts = []
+        exp_edges = []
+        for bb in fn.cfg.basic_blocks:
+            for stmt in (bb.phi_nodes or []) + (bb.gimple or []):
+                exp_stmts.append((bb.index, stmt))
+            for e in bb.succs:
+                exp_edges.append((bb.index, e.dest.index, e))
+        print('blocks match: %s'
+              % ([bb.index for bb in blocks]
+                 == [bb.index for bb in fn.cfg.basic_blocks]))
+        print('stmts match: %s'
+              % ([(index, str(stmt)) for index, stmt in stmts]
+                 == [(index, str(stmt)) for index, stmt in exp_stmts]))
+        print('edges match: %s'
+              % ([(srcindex, destindex, e.src.index, e.dest.index)
+                  for srcindex, destindex, e in edges]
+                 == [(srcindex, destindex, e.src.index, e.dest.index)
+                     for srcindex, destindex, e in exp_edges]))
+
+        # Verify the per-block lookups of FlattenedCfg:
+        flat = FlattenedCfg(fn.cfg)
+        ok = True
+        for bb in fn.cfg.basic_blocks:
+            if flat.block_for_index[bb.index].index != bb.index:
+                ok = False
+            if ([str(stmt) for stmt in flat.gimple[bb.index]]
+                != [str(stmt) for stmt in (bb.gimple or [])]):
+                ok = False
+            if ([flat.edges[i][1] for i in flat.succs[bb.index]]
+                != [e.dest.index for e in bb.succs]):
+                ok = False
+            if (sorted(flat.edges[i][0] for i in flat.preds[bb.index])
+                != sorted(e.src.index for e in bb.preds)):
+                ok = False
+        print('FlattenedCfg lookups match: %s' % ok)
+
+gcc.register_callback(gcc.PLUGIN_PASS_EXECUTION,
+                      on_pass_execution)